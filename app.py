@@ -5,11 +5,13 @@ from flask_cors import CORS
 import os
 import json
 from datetime import datetime
-from whatsapp_msg import send_whatsapp_message, send_whatsapp_media, whatsapp_bp
-from firebase_db import load_seller_data, save_seller_data, initialize_firebase, save_razorpay_credentials, get_razorpay_credentials, get_whatsapp_credentials, upload_product_image
+from whatsapp_msg import send_whatsapp_message, whatsapp_bp
+from outbound import PRIORITY_NOTICE
+from firebase_db import initialize_firebase, save_razorpay_credentials, get_razorpay_credentials, get_whatsapp_credentials, upload_product_image, get_order, get_orders as get_orders_by_id, update_order_fields, WriteBatch, load_company_info, load_products, load_orders, list_orders, get_order_stats, count_orders, ORDER_PAGE_SIZE, load_seller_field, allocate_product_id, add_product, update_product_fields, delete_product, update_company_info_fields
 from google.oauth2 import id_token
 from google.auth.transport import requests as google_requests
-from razorpay_helper import create_payment_link, handle_payment_success, verify_webhook_signature
+from razorpay_helper import handle_payment_success, verify_webhook_signature
+import notifications
 
 from werkzeug.middleware.proxy_fix import ProxyFix
 
@@ -24,34 +26,32 @@ app.config.update(
 )
 
 def get_seller_state():
+    # Reads company_info, products and orders individually so customers,
+    # conversation history and credentials are never downloaded here
     seller_id = session.get('seller_id')
     if not seller_id:
         return {}, [], []
     try:
-        from firebase_db import load_seller_data
-        data = load_seller_data(seller_id)
-        if not data:
-            return {}, [], []
-        return data.get('company_info', {}), data.get('products', []), data.get('orders', [])
+        return load_company_info(seller_id), load_products(seller_id), load_orders(seller_id)
     except Exception as e:
         print(f"Error loading state: {e}")
         return {}, [], []
 
-def save_seller_state(company_info, products, orders):
+def get_seller_company_info():
     seller_id = session.get('seller_id')
     if not seller_id:
-        return False
-    try:
-        from firebase_db import save_seller_data
-        data = {
-            'company_info': company_info,
-            'products': products,
-            'orders': orders
-        }
-        return save_seller_data(seller_id, data)
-    except Exception as e:
-        print(f"Error saving state: {e}")
-        return False
+        return {}
+    return load_company_info(seller_id)
+
+def get_seller_products():
+    seller_id = session.get('seller_id')
+    if not seller_id:
+        return []
+    return load_products(seller_id)
+
+# company_info fields the dashboard can edit; writes touch only the ones sent
+COMPANY_INFO_FIELDS = ('company_name', 'owner_name', 'email', 'phone', 'address', 'city', 'state',
+                       'pincode', 'country', 'upi_id', 'company_description')
 
 # Initialize Firebase on startup
 initialize_firebase()
@@ -154,8 +154,8 @@ def google_login():
         seller_id = email
         session['seller_id'] = seller_id
         
-        # Load data from Firebase
-        company_info, products, orders = get_seller_state()
+        # Only company info decides whether onboarding is needed
+        company_info = get_seller_company_info()
         
         # Check if this is a new user (no company_info)
         is_new_user = not company_info or len(company_info) == 0
@@ -191,7 +191,6 @@ def google_login():
 
 @app.route('/api/onboarding', methods=['POST'])
 def onboarding():
-    company_info, products, orders = get_seller_state()
     """Complete seller onboarding with company information"""
     try:
         seller_id = session.get('seller_id')
@@ -201,26 +200,31 @@ def onboarding():
         data = request.get_json()
         
         # Update company info with onboarding data (matching seller_id 1 structure)
-        company_info['id'] = seller_id  # Use email as ID
-        company_info['company_name'] = data.get('company_name', company_info.get('company_name', ''))
-        company_info['owner_name'] = data.get('owner_name', company_info.get('owner_name', ''))
-        company_info['phone'] = data.get('phone', '')
-        company_info['address'] = data.get('address', '')
-        company_info['city'] = data.get('city', '')
-        company_info['state'] = data.get('state', '')
-        company_info['pincode'] = data.get('pincode', '')
-        company_info['country'] = data.get('country', 'India')
-        company_info['upi_id'] = data.get('upi_id', '')
-        company_info['company_description'] = data.get('company_description', '')
-        company_info['google_business_link'] = data.get('google_business_link', '')
-        company_info['instagram_link'] = data.get('instagram_link', '')
-        company_info['registered_at'] = datetime.now().isoformat()
+        fields = {
+            'id': seller_id,  # Use email as ID
+            'phone': data.get('phone', ''),
+            'address': data.get('address', ''),
+            'city': data.get('city', ''),
+            'state': data.get('state', ''),
+            'pincode': data.get('pincode', ''),
+            'country': data.get('country', 'India'),
+            'upi_id': data.get('upi_id', ''),
+            'company_description': data.get('company_description', ''),
+            'google_business_link': data.get('google_business_link', ''),
+            'instagram_link': data.get('instagram_link', ''),
+            'registered_at': datetime.now().isoformat()
+        }
+        # Names set at login are kept unless the form sends new ones
+        for field in ('company_name', 'owner_name'):
+            if field in data:
+                fields[field] = data[field]
         
         # Keep email and picture from Google login
         # (already set in company_info during login)
         
-        # Save to Firebase
-        save_seller_state(company_info, products, orders)
+        # Save to Firebase (only the onboarding fields)
+        if not update_company_info_fields(seller_id, fields):
+            return jsonify({'error': 'Failed to save company information'}), 500
         
         return jsonify({
             'success': True,
@@ -295,7 +299,7 @@ def get_all_data():
 
 @app.route('/api/products', methods=['GET'])
 def get_products():
-    company_info, products, orders = get_seller_state()
+    products = get_seller_products()
     """Get all products for a seller"""
     try:
         seller_id = session.get('seller_id')
@@ -320,26 +324,48 @@ def get_products():
 
 @app.route('/api/orders', methods=['GET'])
 def get_orders():
-    company_info, products, orders = get_seller_state()
-    """Get all orders for a seller"""
+    """
+    Get one page of a seller's orders, newest first.
+    
+    Query params: status, payment_status, buyer_phone, from and to (ISO dates,
+    inclusive), limit, cursor (next_cursor from the previous page).
+    """
     try:
         seller_id = session.get('seller_id')
         if not seller_id:
             return jsonify({'error': 'Not logged in'}), 401
         
         order_status = request.args.get('status')
+        payment_status = request.args.get('payment_status')
+        try:
+            limit = int(request.args.get('limit', ORDER_PAGE_SIZE))
+        except ValueError:
+            return jsonify({'error': 'limit must be a number'}), 400
+        
+        # Filters and the date range run as one indexed range query per page
+        page = list_orders(
+            seller_id,
+            order_status=order_status,
+            payment_status=payment_status,
+            buyer_phone=request.args.get('buyer_phone'),
+            date_from=request.args.get('from'),
+            date_to=request.args.get('to'),
+            limit=limit,
+            cursor=request.args.get('cursor')
+        )
         
-        # Filter out None entries and filter by order status if provided
-        seller_orders = [o for o in orders if o is not None]
-        if order_status:
-            seller_orders = [o for o in seller_orders if o.get('order_status') == order_status]
-        
-        # Sort by created_at descending
-        seller_orders.sort(key=lambda x: x.get('created_at', ''), reverse=True)
+        summary = get_order_stats(seller_id)
+        # Exact match counts come from order_stats; other filter combinations are not counted
+        total = None
+        if not (request.args.get('buyer_phone') or request.args.get('from') or request.args.get('to')):
+            total = count_orders(summary, order_status, payment_status)
         
         return jsonify({
-            'orders': seller_orders,
-            'count': len(seller_orders)
+            'orders': page['orders'],
+            'count': len(page['orders']),
+            'next_cursor': page['next_cursor'],
+            'total': total,
+            'summary': summary
         }), 200
         
     except Exception as e:
@@ -348,7 +374,6 @@ def get_orders():
 
 @app.route('/api/update_upi', methods=['POST'])
 def update_upi():
-    company_info, products, orders = get_seller_state()
     """Update seller's UPI ID"""
     try:
         seller_id = session.get('seller_id')
@@ -361,11 +386,9 @@ def update_upi():
         if not upi_id:
             return jsonify({'error': 'UPI ID is required'}), 400
         
-        # Update company info
-        company_info['upi_id'] = upi_id
-        
-        # Save to Firebase
-        save_seller_state(company_info, products, orders)
+        # Save to Firebase (only company_info/upi_id)
+        if not update_company_info_fields(seller_id, {'upi_id': upi_id}):
+            return jsonify({'error': 'Failed to update UPI ID'}), 500
         
         return jsonify({
             'message': 'UPI ID updated successfully',
@@ -378,7 +401,7 @@ def update_upi():
 
 @app.route('/api/seller_info', methods=['GET'])
 def get_seller_info():
-    company_info, products, orders = get_seller_state()
+    company_info = get_seller_company_info()
     """Get seller information including UPI ID"""
     try:
         seller_id = session.get('seller_id')
@@ -401,7 +424,6 @@ def get_seller_info():
 
 @app.route('/api/company', methods=['GET', 'POST'])
 def company_info_route():
-    company_info, products, orders = get_seller_state()
     """Get or update company information"""
     try:
         seller_id = session.get('seller_id')
@@ -409,6 +431,7 @@ def company_info_route():
             return jsonify({'error': 'Not logged in'}), 401
         
         if request.method == 'GET':
+            company_info = get_seller_company_info()
             return jsonify({
                 'company_name': company_info.get('company_name', ''),
                 'owner_name': company_info.get('owner_name', ''),
@@ -426,21 +449,12 @@ def company_info_route():
         elif request.method == 'POST':
             data = request.get_json()
             
-            # Update company info
-            company_info['company_name'] = data.get('company_name', company_info.get('company_name', ''))
-            company_info['owner_name'] = data.get('owner_name', company_info.get('owner_name', ''))
-            company_info['email'] = data.get('email', company_info.get('email', ''))
-            company_info['phone'] = data.get('phone', company_info.get('phone', ''))
-            company_info['address'] = data.get('address', company_info.get('address', ''))
-            company_info['city'] = data.get('city', company_info.get('city', ''))
-            company_info['state'] = data.get('state', company_info.get('state', ''))
-            company_info['pincode'] = data.get('pincode', company_info.get('pincode', ''))
-            company_info['country'] = data.get('country', company_info.get('country', ''))
-            company_info['upi_id'] = data.get('upi_id', company_info.get('upi_id', ''))
-            company_info['company_description'] = data.get('company_description', company_info.get('company_description', ''))
+            # Update only the fields that were sent
+            fields = {field: data[field] for field in COMPANY_INFO_FIELDS if field in data}
             
             # Save to Firebase
-            save_seller_state(company_info, products, orders)
+            if not update_company_info_fields(seller_id, fields):
+                return jsonify({'error': 'Failed to update company information'}), 500
             
             return jsonify({'message': 'Company information updated successfully'}), 200
             
@@ -450,7 +464,6 @@ def company_info_route():
 
 @app.route('/api/products/<int:product_id>', methods=['PUT', 'DELETE'])
 def update_delete_product(product_id):
-    company_info, products, orders = get_seller_state()
     """Update or delete a product"""
     
     try:
@@ -465,37 +478,34 @@ def update_delete_product(product_id):
             print(f"📥 Update product {product_id} - received data: {data}")
             print(f"📥 Features in request: {data.get('features', 'NOT PRESENT')}")
             
-            # Find and update product
-            for product in products:
-                if product.get('id') == product_id:
-                    product['title'] = data.get('title', product['title'])
-                    product['description'] = data.get('description', product['description'])
-                    product['price'] = float(data.get('price', product['price']))
-                    product['category'] = data.get('category', product.get('category', ''))
-                    product['stock_quantity'] = int(data.get('stock_quantity', product.get('stock_quantity', 0)))
-                    product['image_url'] = data.get('image_url', product.get('image_url', ''))
-                    # Save features if provided
-                    if 'features' in data:
-                        product['features'] = data['features']
-                        print(f"📦 Features saved: {data['features']}")
-                    else:
-                        print(f"⚠️ No features in request data!")
-                    
-                    print(f"📦 Updated product: {product}")
-                    
-                    # Save to Firebase
-                    save_seller_state(company_info, products, orders)
-                    
-                    return jsonify({'message': 'Product updated successfully', 'product': product}), 200
+            # Only the fields that were sent are written
+            fields = {}
+            for field in ('title', 'description', 'category', 'image_url'):
+                if field in data:
+                    fields[field] = data[field]
+            if 'price' in data:
+                fields['price'] = float(data['price'])
+            if 'stock_quantity' in data:
+                fields['stock_quantity'] = int(data['stock_quantity'])
+            # Save features if provided
+            if 'features' in data:
+                fields['features'] = data['features']
+                print(f"📦 Features saved: {data['features']}")
+            else:
+                print(f"⚠️ No features in request data!")
+            
+            # Save to Firebase (only products/<id>)
+            product = update_product_fields(seller_id, product_id, fields)
+            if not product:
+                return jsonify({'error': 'Product not found'}), 404
             
-            return jsonify({'error': 'Product not found'}), 404
+            print(f"📦 Updated product: {product}")
+            return jsonify({'message': 'Product updated successfully', 'product': product}), 200
         
         elif request.method == 'DELETE':
-            # Find and remove product
-            products = [p for p in products if p.get('id') != product_id]
-            
-            # Save to Firebase
-            save_seller_state(company_info, products, orders)
+            # Save to Firebase (only products/<id>)
+            if not delete_product(seller_id, product_id):
+                return jsonify({'error': 'Failed to delete product'}), 500
             
             return jsonify({'message': 'Product deleted successfully'}), 200
             
@@ -549,7 +559,6 @@ def upload_image():
 
 @app.route('/api/products', methods=['POST'])
 def create_product():
-    company_info, products, orders = get_seller_state()
     """Create a new product"""
     try:
         seller_id = session.get('seller_id')
@@ -562,8 +571,10 @@ def create_product():
         print(f"📥 Create product - received data: {data}")
         print(f"📥 Features received: {data.get('features', 'NOT PRESENT')}")
         
-        # Generate new product ID
-        new_id = max([p.get('id', 0) for p in products], default=0) + 1
+        # Generate new product ID from the seller's counter
+        new_id = allocate_product_id(seller_id)
+        if new_id is None:
+            return jsonify({'error': 'Failed to create product'}), 500
         
         product = {
             'id': new_id,
@@ -579,10 +590,9 @@ def create_product():
         
         print(f"📦 Created product object: {product}")
         
-        products.append(product)
-        
-        # Save to Firebase
-        save_seller_state(company_info, products, orders)
+        # Save to Firebase (only products/<id>)
+        if not add_product(seller_id, product):
+            return jsonify({'error': 'Failed to create product'}), 500
         
         return jsonify({'message': 'Product created successfully', 'product': product}), 201
         
@@ -590,9 +600,77 @@ def create_product():
         return jsonify({'error': str(e)}), 500
 
 
+def _order_changes(seller_id, order_id, order, data, invoice_file=None):
+    """
+    Work out the order fields to write and the buyer notifications to emit
+    for a requested change.
+    
+    Returns:
+        tuple: (updates dict for update_order_fields, notification events)
+    """
+    # Track if order status or payment status changed
+    old_order_status = order.get('order_status')
+    old_payment_status = order.get('payment_status')
+    order_status_changed = False
+    payment_status_changed = False
+    new_order_status = old_order_status
+    new_payment_status = old_payment_status
+    updates = {}
+    
+    if 'order_status' in data:
+        new_order_status = data['order_status']
+        if old_order_status != new_order_status:
+            order_status_changed = True
+            updates['order_status'] = new_order_status
+    
+    if 'payment_status' in data:
+        new_payment_status = data['payment_status']
+        if old_payment_status != new_payment_status:
+            payment_status_changed = True
+        updates['payment_status'] = new_payment_status
+        
+    if 'buyer_phone' in data:
+        updates['buyer_phone'] = data['buyer_phone']
+    if 'delivery_lat' in data:
+        updates['delivery_lat'] = data['delivery_lat']
+    if 'delivery_lng' in data:
+        updates['delivery_lng'] = data['delivery_lng']
+    
+    # Buyer notifications are rendered and delivered by notification workers
+    # (payment links included); the order records each one's progress
+    buyer_phone = updates.get('buyer_phone', order.get('buyer_phone'))
+    custom_message = data.get('custom_message')
+    events = []
+    if order_status_changed and buyer_phone:
+        event, fields = notifications.build_event(
+            seller_id, order_id, notifications.EVENT_ORDER_STATUS, new_order_status, custom_message
+        )
+        events.append(event)
+        updates.update(fields)
+    if payment_status_changed and buyer_phone:
+        if invoice_file and invoice_file.content_type != 'application/pdf':
+            print(f"⚠️ Invalid file type: {invoice_file.content_type}. Only PDF allowed.")
+            invoice_file = None
+        event, fields = notifications.build_event(
+            seller_id, order_id, notifications.EVENT_PAYMENT_STATUS, new_payment_status, custom_message,
+            invoice=invoice_file if new_payment_status == 'Requested' else None
+        )
+        events.append(event)
+        updates.update(fields)
+    return updates, events
+
+
+def _apply_order_updates(order, updates):
+    """Apply written fields (including notification/<type> paths) to a loaded order"""
+    for field, value in updates.items():
+        if field.startswith('notification/'):
+            order.setdefault('notification', {})[field.split('/', 1)[1]] = value
+        else:
+            order[field] = value
+
+
 @app.route('/api/orders/<int:order_id>', methods=['PUT'])
 def update_order(order_id):
-    company_info, products, orders = get_seller_state()
     """Update order status"""
     try:
         seller_id = session.get('seller_id')
@@ -607,231 +685,104 @@ def update_order(order_id):
             # Regular JSON
             data = request.get_json()
         
-        # Find and update order (filter out None values from Firebase sparse arrays)
-        for order in orders:
-            if order is None:
+        # Load just this order (keyed read, no full orders download)
+        order = get_order(seller_id, order_id)
+        if not order:
+            return jsonify({'error': 'Order not found'}), 404
+        
+        invoice_file = request.files.get('invoice')
+        updates, events = _order_changes(seller_id, order_id, order, data, invoice_file)
+        
+        # Save to Firebase - one partial update with the changed fields and notification markers
+        if updates:
+            if not update_order_fields(seller_id, order_id, updates, check_exists=False, current=order):
+                # Nothing was saved, so nothing is sent; drop any invoice staged for the notice
+                for event in events:
+                    if event.get('invoice_path') and os.path.exists(event['invoice_path']):
+                        os.remove(event['invoice_path'])
+                return jsonify({'error': 'Failed to save order'}), 500
+            _apply_order_updates(order, updates)
+        
+        notifications.emit(events)
+        
+        return jsonify({'message': 'Order updated successfully', 'order': order}), 200
+        
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
+
+BULK_ORDER_LIMIT = int(os.environ.get('BULK_ORDER_LIMIT', '200'))
+
+
+@app.route('/api/orders/bulk', methods=['POST'])
+def bulk_update_orders():
+    """
+    Apply status changes to many orders at once.
+    
+    Body: {"updates": [{"order_id": 1, "order_status": "...", "payment_status": "...",
+    "custom_message": "..."}, ...]} or, for the same change on every order,
+    {"order_ids": [1, 2], "order_status": "...", "payment_status": "..."}.
+    The orders are read concurrently, all changes go out in one multi-path
+    write, and buyer notifications fan out through the notification workers.
+    """
+    try:
+        seller_id = session.get('seller_id')
+        if not seller_id:
+            return jsonify({'error': 'Not logged in'}), 401
+        
+        data = request.get_json() or {}
+        changes = data.get('updates')
+        if changes is None and data.get('order_ids'):
+            shared = {k: data[k] for k in ('order_status', 'payment_status', 'custom_message') if k in data}
+            changes = [dict(shared, order_id=order_id) for order_id in data['order_ids']]
+        if not changes:
+            return jsonify({'error': 'updates or order_ids is required'}), 400
+        if len(changes) > BULK_ORDER_LIMIT:
+            return jsonify({'error': f'At most {BULK_ORDER_LIMIT} orders per request'}), 400
+        
+        try:
+            changes = [dict(change, order_id=int(change['order_id'])) for change in changes]
+        except (KeyError, TypeError, ValueError):
+            return jsonify({'error': 'Every update needs a numeric order_id'}), 400
+        
+        orders = get_orders_by_id(seller_id, [change['order_id'] for change in changes])
+        if orders is None:
+            return jsonify({'error': 'Failed to load orders'}), 500
+        
+        batch = WriteBatch()
+        events = []
+        updated, unchanged, not_found = [], [], []
+        for change in changes:
+            order_id = change['order_id']
+            order = orders.get(order_id)
+            if not order:
+                not_found.append(order_id)
                 continue
-            if order.get('order_id') == order_id or order.get('id') == order_id:
-                # Track if order status or payment status changed
-                old_order_status = order.get('order_status')
-                old_payment_status = order.get('payment_status')
-                order_status_changed = False
-                payment_status_changed = False
-                new_order_status = old_order_status
-                new_payment_status = old_payment_status
-                
-                if 'order_status' in data:
-                    new_order_status = data['order_status']
-                    if old_order_status != new_order_status:
-                        order_status_changed = True
-                        order['order_status'] = new_order_status
-                
-                if 'payment_status' in data:
-                    new_payment_status = data['payment_status']
-                    if old_payment_status != new_payment_status:
-                        payment_status_changed = True
-                    order['payment_status'] = new_payment_status
-                    
-                if 'buyer_phone' in data:
-                    order['buyer_phone'] = data['buyer_phone']
-                if 'delivery_lat' in data:
-                    order['delivery_lat'] = data['delivery_lat']
-                if 'delivery_lng' in data:
-                    order['delivery_lng'] = data['delivery_lng']
-                
-                # Save to Firebase - save the entire state to capture all modifications
-                save_seller_state(company_info, products, orders)
-                
-                buyer_phone = order.get('buyer_phone')
-                
-                # Send WhatsApp notification if order status changed
-                if order_status_changed and buyer_phone:
-                    # Check if custom message is provided
-                    if 'custom_message' in data and data['custom_message']:
-                        message = data['custom_message']
-                    else:
-                        # Get items display for multi-item orders
-                        items_display = ""
-                        if order.get('items') and len(order['items']) > 0:
-                            if len(order['items']) == 1:
-                                items_display = f"{order['items'][0]['product_name']} x{order['items'][0]['quantity']}"
-                            else:
-                                items_display = "\n".join([f"- {item['product_name']} x{item['quantity']}" for item in order['items']])
-                        else:
-                            items_display = order.get('product_name', 'your order')
-                        
-                        message = (
-                            f"🛒 *Order Status Update* 🛒\n\n"
-                            f"Order ID: #{order_id}\n"
-                            f"Items:\n{items_display}\n\n"
-                            f"Status: *{new_order_status}*\n\n"
-                            f"Thank you for your order!"
-                        )
-                    
-                    try:
-                        # Fetch WhatsApp credentials for this seller
-                        whatsapp_creds = get_whatsapp_credentials(seller_id)
-                        send_whatsapp_message(buyer_phone, message, seller_id, whatsapp_creds)
-                        print(f"✅ Order status WhatsApp notification sent to {buyer_phone}")
-                    except Exception as e:
-                        print(f"⚠️ Failed to send order status notification: {e}")
-                
-                # Send WhatsApp notification if payment status changed
-                if payment_status_changed and buyer_phone:
-                    total_amount = order.get('total_amount') or order.get('amount', 0)
-                    
-                    # Get items display for multi-item orders
-                    items_display = ""
-                    if order.get('items') and len(order['items']) > 0:
-                        if len(order['items']) == 1:
-                            items_display = f"{order['items'][0]['product_name']} x{order['items'][0]['quantity']}"
-                        else:
-                            items_display = "\n".join([f"- {item['product_name']} x{item['quantity']}" for item in order['items']])
-                    else:
-                        items_display = order.get('product_name', 'your order')
-                    
-
-                    
-                    if 'custom_message' in data and data['custom_message'] and new_payment_status != "Requested":
-                        message = data['custom_message']
-                    else:
-                        if new_payment_status == "Requested":
-                            # Check if Razorpay is enabled
-                            print(f"🔍 DEBUG: Checking Razorpay for seller {seller_id}")
-                            razorpay_credentials = get_razorpay_credentials(seller_id)
-                            print(f"🔍 DEBUG: Credentials = {razorpay_credentials}")
-                            
-                            if razorpay_credentials and razorpay_credentials.get('enabled'):
-                                print(f"✅ DEBUG: Razorpay IS enabled, creating payment link...")
-                                # Create Razorpay payment link
-                                print(f"🔗 Creating Razorpay payment link for order {order_id}...")
-                                
-                                buyer_name = order.get('buyer_name', 'Customer')
-                                payment_result = create_payment_link(
-                                    seller_id=seller_id,
-                                    order_id=order_id,
-                                    amount=total_amount,
-                                    customer_name=buyer_name,
-                                    customer_phone=buyer_phone,
-                                    description=f"Payment for Order #{order_id}"
-                                )
-                                
-                                if payment_result.get('success'):
-                                    payment_link = payment_result.get('payment_link')
-                                    message = (
-                                        f"💳 *Payment Request* 💳\n\n"
-                                        f"Order ID: #{order_id}\n"
-                                        f"Items:\n{items_display}\n"
-                                        f"Amount: *₹{total_amount:.2f}*\n\n"
-                                        f"Please complete your payment using this secure link:\n"
-                                        f"🔗 {payment_link}\n\n"
-                                        f"After payment, your order will be automatically confirmed.\n\n"
-                                        f"Thank you! 🙏"
-                                    )
-                                else:
-                                    # Fallback to UPI if payment link creation fails
-                                    print(f"⚠️ Payment link creation failed: {payment_result.get('error')}")
-                                    upi_id = company_info.get('upi_id', '')
-                                    if upi_id:
-                                        message = (
-                                            f"💳 *Payment Request* 💳\n\n"
-                                            f"Order ID: #{order_id}\n"
-                                            f"Items:\n{items_display}\n"
-                                            f"Amount: *₹{total_amount:.2f}*\n\n"
-                                            f"Please pay to UPI ID:\n"
-                                            f"📱 *{upi_id}*\n\n"
-                                            f"After payment, please share the transaction screenshot for verification.\n\n"
-                                            f"Thank you! 🙏"
-                                        )
-                                    else:
-                                        message = (
-                                            f"💳 *Payment Request* 💳\n\n"
-                                            f"Order ID: #{order_id}\n"
-                                            f"Items:\n{items_display}\n"
-                                            f"Amount: *₹{total_amount:.2f}*\n\n"
-                                            f"Please contact the seller for payment details.\n\n"
-                                            f"Thank you! 🙏"
-                                        )
-                            else:
-                                # Razorpay not enabled, use UPI
-                                print(f"⚠️ DEBUG: Razorpay NOT enabled, falling back to UPI")
-                                upi_id = company_info.get('upi_id', '')
-                                if upi_id:
-                                    message = (
-                                        f"💳 *Payment Request* 💳\n\n"
-                                        f"Order ID: #{order_id}\n"
-                                        f"Items:\n{items_display}\n"
-                                        f"Amount: *₹{total_amount:.2f}*\n\n"
-                                        f"Please pay to UPI ID:\n"
-                                        f"📱 *{upi_id}*\n\n"
-                                        f"After payment, please share the transaction screenshot for verification.\n\n"
-                                        f"Thank you! 🙏"
-                                    )
-                                else:
-                                    message = (
-                                        f"💳 *Payment Request* 💳\n\n"
-                                        f"Order ID: #{order_id}\n"
-                                        f"Items:\n{items_display}\n"
-                                        f"Amount: *₹{total_amount:.2f}*\n\n"
-                                        f"Please contact the seller for payment details.\n\n"
-                                        f"Thank you! 🙏"
-                                    )
-                        elif new_payment_status == "Completed":
-                            message = (
-                                f"✅ *Payment Confirmed* ✅\n\n"
-                                f"Order ID: #{order_id}\n"
-                                f"Items:\n{items_display}\n"
-                                f"Amount: ₹{total_amount:.2f}\n\n"
-                                f"Your payment has been received and confirmed!\n"
-                                f"Your order will be processed shortly.\n\n"
-                                f"Thank you for your purchase! 🎉"
-                            )
-                        elif new_payment_status == "Pending":
-                            message = (
-                                f"⏳ *Payment Status Update* ⏳\n\n"
-                                f"Order ID: #{order_id}\n"
-                                f"Items:\n{items_display}\n"
-                                f"Amount: ₹{total_amount:.2f}\n\n"
-                                f"Payment status: *Pending*\n\n"
-                                f"We'll notify you once payment is requested.\n\n"
-                                f"Thank you! 🙏"
-                            )
-                        else:
-                            message = None
-                    
-                    if message:
-                        # Check for attached invoice file
-                        invoice_file = request.files.get('invoice')
-                        
-                        # Debug: Log what we received
-                        print(f"📄 DEBUG: invoice_file = {invoice_file}")
-                        print(f"📄 DEBUG: new_payment_status = {new_payment_status}")
-                        print(f"📄 DEBUG: request.files = {request.files}")
-                        
-                        # Fetch WhatsApp credentials for this seller
-                        whatsapp_creds = get_whatsapp_credentials(seller_id)
-                        
-                        try:
-                            if invoice_file and new_payment_status == 'Requested':
-                                # Validate PDF file
-                                if invoice_file.content_type == 'application/pdf':
-                                    print(f"📎 Invoice PDF attached, sending via WhatsApp...")
-                                    # Send PDF with caption
-                                    send_whatsapp_media(buyer_phone, invoice_file, message, seller_id=seller_id, whatsapp_creds=whatsapp_creds)
-                                else:
-                                    print(f"⚠️ Invalid file type: {invoice_file.content_type}. Only PDF allowed.")
-                                    # Fall back to text-only
-                                    send_whatsapp_message(buyer_phone, message, seller_id, whatsapp_creds)
-                            else:
-                                # Text-only message
-                                send_whatsapp_message(buyer_phone, message, seller_id, whatsapp_creds)
-                            print(f"✅ Payment status WhatsApp notification sent to {buyer_phone}")
-                        except Exception as e:
-                            print(f"⚠️ Failed to send payment status notification: {e}")
-                
-                return jsonify({'message': 'Order updated successfully', 'order': order}), 200
+            # Only status fields are bulk-editable
+            requested = {k: change[k] for k in ('order_status', 'payment_status', 'custom_message') if k in change}
+            updates, order_events = _order_changes(seller_id, order_id, order, requested)
+            if not updates:
+                unchanged.append(order_id)
+                continue
+            update_order_fields(seller_id, order_id, updates, check_exists=False, batch=batch, current=order)
+            _apply_order_updates(order, updates)
+            events.extend(order_events)
+            updated.append(order_id)
+        
+        if not batch.commit():
+            return jsonify({'error': 'Failed to save orders'}), 500
+        notifications.emit(events)
         
-        return jsonify({'error': 'Order not found'}), 404
+        return jsonify({
+            'message': f'{len(updated)} orders updated',
+            'updated': updated,
+            'unchanged': unchanged,
+            'not_found': not_found,
+            'notifications_queued': len(events),
+            'orders': [orders[order_id] for order_id in updated]
+        }), 200
         
     except Exception as e:
         import traceback
@@ -979,8 +930,8 @@ def approve_cancellation(order_id):
         if buyer_phone and custom_message:
             try:
                 whatsapp_creds = get_whatsapp_credentials(seller_id)
-                send_whatsapp_message(buyer_phone, custom_message, seller_id, whatsapp_creds)
-                print(f"✅ Cancellation approval notification sent to {buyer_phone}")
+                send_whatsapp_message(buyer_phone, custom_message, seller_id, whatsapp_creds, priority=PRIORITY_NOTICE, wait=False)
+                print(f"✅ Cancellation approval notification queued for {buyer_phone}")
             except Exception as e:
                 print(f"⚠️ Failed to send cancellation notification: {e}")
         
@@ -1020,8 +971,8 @@ def reject_cancellation(order_id):
         if buyer_phone and custom_message:
             try:
                 whatsapp_creds = get_whatsapp_credentials(seller_id)
-                send_whatsapp_message(buyer_phone, custom_message, seller_id, whatsapp_creds)
-                print(f"✅ Cancellation rejection notification sent to {buyer_phone}")
+                send_whatsapp_message(buyer_phone, custom_message, seller_id, whatsapp_creds, priority=PRIORITY_NOTICE, wait=False)
+                print(f"✅ Cancellation rejection notification queued for {buyer_phone}")
             except Exception as e:
                 print(f"⚠️ Failed to send cancellation notification: {e}")
         
@@ -1382,8 +1333,7 @@ def get_customers_api():
     if not seller_id:
         return jsonify({'error': 'Not logged in'}), 401
     try:
-        data = load_seller_data(seller_id)
-        customers = data.get('customers', {})
+        customers = load_seller_field(seller_id, 'customers') or {}
         return jsonify({'customers': customers}), 200
     except Exception as e:
         import traceback
@@ -1413,5 +1363,25 @@ def get_firebase_token():
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Dependency health: Firebase circuit breaker state, per-operation latency/error counters, cache, HTTP pool, webhook/notification queue and outbound send stats"""
+    seller_id = session.get('seller_id')
+    if not seller_id:
+        return jsonify({'error': 'Not logged in'}), 401
+    from resilience import get_metrics as get_dependency_metrics
+    from firebase_db import get_tenant_config_stats
+    from http_client import get_connection_stats
+    data = get_dependency_metrics()
+    data['tenant_config_cache'] = get_tenant_config_stats()
+    data['http_connections'] = get_connection_stats()
+    import webhook_queue
+    data['webhook_queue'] = webhook_queue.get_stats()
+    import outbound
+    data['outbound'] = outbound.get_stats()
+    data['notifications'] = notifications.get_stats()
+    return jsonify(data), 200
+
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
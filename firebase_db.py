@@ -10,8 +10,16 @@ import firebase_admin
 from firebase_admin import credentials, db, storage
 import json
 import os
-from datetime import datetime
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 import uuid
+from storage_backend import get_backend, NULL_ETAG
+from resilience import FIREBASE_HTTP_TIMEOUT, time_limit
 
 def sanitize_email_for_firebase(email):
     """
@@ -65,7 +73,9 @@ def initialize_firebase():
     
     firebase_admin.initialize_app(cred, {
         'databaseURL': database_url,
-        'storageBucket': 'jils-5a82d.firebasestorage.app'
+        'storageBucket': 'jils-5a82d.firebasestorage.app',
+        # Per-request socket timeout; retries and deadlines are in resilience.py
+        'httpTimeout': FIREBASE_HTTP_TIMEOUT
     })
     
     _firebase_initialized = True
@@ -73,6 +83,11 @@ def initialize_firebase():
     print(f"Firebase Storage bucket: ai-shopping-assistant-jils.firebasestorage.app")
 
 
+def _ref(path=None):
+    """Reference to a path in the configured storage backend (see storage_backend.py)"""
+    return get_backend().reference(path)
+
+
 # ==================== FIREBASE STORAGE ====================
 
 def upload_product_image(file_bytes, filename, content_type='image/jpeg'):
@@ -117,11 +132,78 @@ def upload_product_image(file_bytes, filename, content_type='image/jpeg'):
         }
 
 
+# ==================== WRITE BATCHES ====================
+
+def server_increment(delta):
+    """Value that makes the database add delta to the number stored at a path"""
+    return {'.sv': {'increment': delta}}
+
+
+class WriteBatch:
+    """
+    Unit of work that collects writes across paths and commits them as one
+    multi-location update() from the database root. Either every write in the
+    batch is applied or none is.
+    
+    Paths in one batch must not overlap (one may not be an ancestor of another);
+    the database rejects such updates.
+    """
+    
+    def __init__(self):
+        self._updates = {}
+    
+    def __len__(self):
+        return len(self._updates)
+    
+    def set(self, path, value):
+        """Queue a write that replaces the value at path"""
+        self._updates[path.strip('/')] = value
+        return self
+    
+    def update(self, path, fields):
+        """Queue a partial write of the given child fields under path"""
+        for key, value in fields.items():
+            self._updates[f"{path.strip('/')}/{key}"] = value
+        return self
+    
+    def delete(self, path):
+        """Queue removal of the value at path"""
+        self._updates[path.strip('/')] = None
+        return self
+    
+    def increment(self, path, delta):
+        """Queue a server-side increment of the number at path (deltas to one path add up)"""
+        path = path.strip('/')
+        queued = self._updates.get(path)
+        if isinstance(queued, dict) and 'increment' in queued.get('.sv', {}):
+            delta += queued['.sv']['increment']
+        self._updates[path] = server_increment(delta)
+        return self
+    
+    def commit(self):
+        """
+        Send all queued writes in a single round trip.
+        
+        Returns:
+            bool: True if successful (or nothing to write), False otherwise
+        """
+        if not self._updates:
+            return True
+        try:
+            initialize_firebase()
+            _ref().update(self._updates)
+            self._updates = {}
+            return True
+        except Exception as e:
+            print(f"❌ Error committing write batch ({len(self._updates)} paths): {e}")
+            return False
+
+
 # ==================== BUYERS DATA ====================
 
 def get_buyers_ref():
     """Get reference to buyers node in Firebase"""
-    return db.reference('buyers')
+    return _ref('buyers')
 
 
 def load_buyers_data():
@@ -169,7 +251,7 @@ def get_buyer(phone_number):
     """Get a single buyer's data by phone number"""
     try:
         initialize_firebase()
-        buyer_ref = db.reference(f'buyers/{phone_number}')
+        buyer_ref = _ref(f'buyers/{phone_number}')
         return buyer_ref.get()
     except Exception as e:
         print(f"Error getting buyer from Firebase: {e}")
@@ -180,7 +262,7 @@ def update_buyer(phone_number, buyer_data):
     """Update a single buyer's data"""
     try:
         initialize_firebase()
-        buyer_ref = db.reference(f'buyers/{phone_number}')
+        buyer_ref = _ref(f'buyers/{phone_number}')
         buyer_ref.set(buyer_data)
         return True
     except Exception as e:
@@ -192,10 +274,8 @@ def add_buyer_order(phone_number, order):
     """Add an order to a buyer's order history"""
     try:
         initialize_firebase()
-        orders_ref = db.reference(f'buyers/{phone_number}/orders')
-        orders = orders_ref.get() or []
-        orders.append(order)
-        orders_ref.set(orders)
+        # Append under a push key instead of rewriting the whole history
+        _ref(f'buyers/{phone_number}/orders').push(order)
         return True
     except Exception as e:
         print(f"Error adding order to buyer in Firebase: {e}")
@@ -206,7 +286,7 @@ def update_buyer_cart(phone_number, cart):
     """Update a buyer's shopping cart"""
     try:
         initialize_firebase()
-        cart_ref = db.reference(f'buyers/{phone_number}/cart')
+        cart_ref = _ref(f'buyers/{phone_number}/cart')
         cart_ref.set(cart)
         return True
     except Exception as e:
@@ -214,11 +294,292 @@ def update_buyer_cart(phone_number, cart):
         return False
 
 
+# ==================== SELLER MIRROR ====================
+# Optional in-process mirror of sellers/<id> kept current by a streaming listener.
+# When enabled, load_seller_data() is served from memory instead of a network get().
+
+SELLER_MIRROR_ENABLED = os.environ.get('SELLER_MIRROR_ENABLED', 'false').lower() == 'true'
+SELLER_MIRROR_MAX_SELLERS = int(os.environ.get('SELLER_MIRROR_MAX_SELLERS', '50'))
+SELLER_MIRROR_IDLE_SECONDS = float(os.environ.get('SELLER_MIRROR_IDLE_SECONDS', '1800'))
+SELLER_MIRROR_SYNC_TIMEOUT = float(os.environ.get('SELLER_MIRROR_SYNC_TIMEOUT', '5'))
+
+
+def _mirror_set(node, parts, value):
+    """
+    Store value at the relative path parts inside node, following Realtime Database
+    semantics (None deletes, empty containers disappear, arrays stay arrays).
+    
+    Returns:
+        The updated node (may be a new object, or None if it became empty)
+    """
+    if not parts:
+        return value
+    
+    key = parts[0]
+    
+    if isinstance(node, list) and key.isdigit():
+        index = int(key)
+        child = node[index] if index < len(node) else None
+        new_child = _mirror_set(child, parts[1:], value)
+        if new_child is not None:
+            while len(node) <= index:
+                node.append(None)
+            node[index] = new_child
+        elif index < len(node):
+            node[index] = None
+        while node and node[-1] is None:
+            node.pop()
+        return node or None
+    
+    if isinstance(node, list):
+        node = {str(i): v for i, v in enumerate(node) if v is not None}
+    elif not isinstance(node, dict):
+        node = {}
+    
+    new_child = _mirror_set(node.get(key), parts[1:], value)
+    if new_child is None:
+        node.pop(key, None)
+    else:
+        node[key] = new_child
+    return node or None
+
+
+def _apply_mirror_event(tree, path, data, event_type):
+    """
+    Apply a streaming 'put' or 'patch' event to a mirrored tree.
+    
+    Args:
+        tree: Current mirrored value (dict, list or None)
+        path (str): Event path relative to the listened reference (e.g. '/orders/3')
+        data: Event payload
+        event_type (str): 'put' or 'patch'
+        
+    Returns:
+        The updated tree
+    """
+    parts = [p for p in (path or '/').split('/') if p]
+    
+    if event_type == 'patch' and isinstance(data, dict):
+        for child_path, child_value in data.items():
+            child_parts = parts + [p for p in child_path.split('/') if p]
+            tree = _mirror_set(tree, child_parts, copy.deepcopy(child_value))
+        return tree
+    
+    return _mirror_set(tree, parts, copy.deepcopy(data))
+
+
+class _MirrorEntry:
+    """A single mirrored seller subtree and its listener registration"""
+    
+    def __init__(self):
+        self.data = None
+        self.ready = threading.Event()
+        self.registration = None
+        self.last_access = time.time()
+
+
+class SellerMirror:
+    """
+    LRU-bounded set of seller subtrees mirrored in memory via db.Reference.listen().
+    
+    Each seller that is read gets a streaming listener. The first event carries the
+    full snapshot, later events are applied in place, so reads become dict lookups.
+    Idle or least-recently-used sellers are unsubscribed to bound memory.
+    """
+    
+    def __init__(self, max_sellers=SELLER_MIRROR_MAX_SELLERS, idle_seconds=SELLER_MIRROR_IDLE_SECONDS,
+                 sync_timeout=SELLER_MIRROR_SYNC_TIMEOUT):
+        self.max_sellers = max_sellers
+        self.idle_seconds = idle_seconds
+        self.sync_timeout = sync_timeout
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def get(self, safe_seller_id):
+        """
+        Get a deep copy of the mirrored seller subtree.
+        
+        Args:
+            safe_seller_id (str): Sanitized seller ID
+            
+        Returns:
+            tuple: (found, data). found is False when the mirror could not sync in time
+            and the caller should fall back to a direct read.
+        """
+        evicted = []
+        subscribe = False
+        result = None
+        
+        with self._lock:
+            entry = self._entries.get(safe_seller_id)
+            if entry is not None and not self._is_alive(entry):
+                # Listener thread died (e.g. stream dropped) - resubscribe
+                self._entries.pop(safe_seller_id, None)
+                evicted.append(entry)
+                entry = None
+            
+            if entry is not None and entry.ready.is_set():
+                self._entries.move_to_end(safe_seller_id)
+                entry.last_access = time.time()
+                self.hits += 1
+                result = (True, copy.deepcopy(entry.data))
+            else:
+                self.misses += 1
+                if entry is None:
+                    entry = _MirrorEntry()
+                    self._entries[safe_seller_id] = entry
+                    subscribe = True
+                entry.last_access = time.time()
+            
+            evicted.extend(self._evict_locked(keep=safe_seller_id))
+        
+        self._close(evicted)
+        
+        if result is not None:
+            return result
+        
+        if subscribe and not self._subscribe(safe_seller_id, entry):
+            return False, None
+        
+        if not entry.ready.wait(self.sync_timeout):
+            print(f"⚠️ Seller mirror for {safe_seller_id} not synced within {self.sync_timeout}s")
+            return False, None
+        
+        with self._lock:
+            return True, copy.deepcopy(entry.data)
+    
+    def peek(self, safe_seller_id, field):
+        """
+        Get a deep copy of one top-level child of a seller that is already mirrored.
+        Never starts a listener, so cold sellers cost nothing here.
+        
+        Returns:
+            tuple: (found, data). found is False when the seller is not mirrored and synced.
+        """
+        with self._lock:
+            entry = self._entries.get(safe_seller_id)
+            if entry is None or not entry.ready.is_set() or not self._is_alive(entry):
+                return False, None
+            self._entries.move_to_end(safe_seller_id)
+            entry.last_access = time.time()
+            self.hits += 1
+            data = entry.data if isinstance(entry.data, dict) else {}
+            return True, copy.deepcopy(data.get(field))
+    
+    def invalidate(self, safe_seller_id):
+        """Drop a seller from the mirror and close its listener"""
+        with self._lock:
+            entry = self._entries.pop(safe_seller_id, None)
+        self._close([entry] if entry else [])
+    
+    def clear(self):
+        """Drop all mirrored sellers"""
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+        self._close(entries)
+    
+    def stats(self):
+        """Return hit/miss counters and current size"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'enabled': SELLER_MIRROR_ENABLED,
+                'sellers': len(self._entries),
+                'max_sellers': self.max_sellers,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': round(self.hits / total, 4) if total else 0.0
+            }
+    
+    def _subscribe(self, safe_seller_id, entry):
+        def on_event(event):
+            with self._lock:
+                entry.data = _apply_mirror_event(entry.data, event.path, event.data, event.event_type)
+            entry.ready.set()
+        
+        try:
+            initialize_firebase()
+            entry.registration = _ref(f'sellers/{safe_seller_id}').listen(on_event)
+            return True
+        except Exception as e:
+            print(f"❌ Error starting seller mirror listener for {safe_seller_id}: {e}")
+            with self._lock:
+                if self._entries.get(safe_seller_id) is entry:
+                    self._entries.pop(safe_seller_id, None)
+            return False
+    
+    def _is_alive(self, entry):
+        thread = getattr(entry.registration, '_thread', None)
+        return thread is None or thread.is_alive()
+    
+    def _evict_locked(self, keep=None):
+        """Pop idle and over-capacity entries. Caller must hold the lock."""
+        evicted = []
+        now = time.time()
+        
+        for seller_id in list(self._entries.keys()):
+            if seller_id == keep:
+                continue
+            if now - self._entries[seller_id].last_access > self.idle_seconds:
+                evicted.append(self._entries.pop(seller_id))
+        
+        while len(self._entries) > self.max_sellers:
+            oldest_id = next(iter(self._entries))
+            if oldest_id == keep:
+                self._entries.move_to_end(oldest_id)
+                oldest_id = next(iter(self._entries))
+            evicted.append(self._entries.pop(oldest_id))
+        
+        self.evictions += len(evicted)
+        return evicted
+    
+    def _close(self, entries):
+        for entry in entries:
+            if entry.registration is not None:
+                try:
+                    entry.registration.close()
+                except Exception as e:
+                    print(f"⚠️ Error closing seller mirror listener: {e}")
+
+
+_seller_mirror = SellerMirror()
+
+
+def get_mirror_stats():
+    """
+    Get seller mirror counters.
+    
+    Returns:
+        dict: enabled, sellers, max_sellers, hits, misses, evictions, hit_ratio
+    """
+    return _seller_mirror.stats()
+
+
 # ==================== SELLERS DATA ====================
 
 def get_sellers_ref():
     """Get reference to sellers node in Firebase"""
-    return db.reference('sellers')
+    return _ref('sellers')
+
+
+def list_seller_ids():
+    """
+    List all seller IDs with a shallow read (no seller data downloaded).
+    
+    Returns:
+        list: Sanitized seller IDs (empty on error)
+    """
+    try:
+        initialize_firebase()
+        return list((_ref('sellers').get(shallow=True) or {}).keys())
+    except Exception as e:
+        print(f"Error listing sellers: {e}")
+        return []
 
 
 def load_seller_data(seller_id):
@@ -230,8 +591,14 @@ def load_seller_data(seller_id):
         initialize_firebase()
         # Sanitize email for Firebase path (emails contain . and @ which are not allowed)
         safe_seller_id = sanitize_email_for_firebase(seller_id)
-        seller_ref = db.reference(f'sellers/{safe_seller_id}')
-        data = seller_ref.get()
+        
+        found = False
+        if SELLER_MIRROR_ENABLED:
+            found, data = _seller_mirror.get(safe_seller_id)
+        
+        if not found:
+            seller_ref = _ref(f'sellers/{safe_seller_id}')
+            data = seller_ref.get()
         
         if data is None:
             return {
@@ -240,6 +607,12 @@ def load_seller_data(seller_id):
                 "orders": []
             }
         
+        # Present both order layouts (v1 list / v2 keyed map) and keyed products as plain lists
+        if 'orders' in data:
+            data['orders'] = orders_to_list(data['orders'])
+        if 'products' in data:
+            data['products'] = products_to_list(data['products'])
+        
         return data
     except Exception as e:
         print(f"Error loading seller {seller_id} data from Firebase: {e}")
@@ -250,6 +623,128 @@ def load_seller_data(seller_id):
         }
 
 
+def load_seller_field(seller_id, field):
+    """
+    Load one top-level child of a seller (e.g. 'company_info', 'customers')
+    without downloading the rest of the seller node. Served from the seller
+    mirror when that seller is already mirrored.
+    
+    Args:
+        seller_id (str): Seller ID
+        field (str): Child key under sellers/<id>
+        
+    Returns:
+        The child's value, or None if missing or on error
+    """
+    try:
+        initialize_firebase()
+        safe_seller_id = sanitize_email_for_firebase(seller_id)
+        
+        if SELLER_MIRROR_ENABLED:
+            found, data = _seller_mirror.peek(safe_seller_id, field)
+            if found:
+                return data
+        
+        return _ref(f'sellers/{safe_seller_id}/{field}').get()
+    except Exception as e:
+        print(f"Error loading {field} for seller {seller_id}: {e}")
+        return None
+
+
+def list_seller_keys(seller_id, path=None):
+    """
+    List child keys under a seller node with a shallow read (no values downloaded).
+    
+    Args:
+        seller_id (str): Seller ID
+        path (str): Optional sub-path under sellers/<id> (e.g. 'customers')
+        
+    Returns:
+        list: Child keys (empty if missing or on error)
+    """
+    try:
+        initialize_firebase()
+        safe_seller_id = sanitize_email_for_firebase(seller_id)
+        full_path = f'sellers/{safe_seller_id}/{path}' if path else f'sellers/{safe_seller_id}'
+        keys = _ref(full_path).get(shallow=True)
+        return list(keys.keys()) if isinstance(keys, dict) else []
+    except Exception as e:
+        print(f"Error listing keys for seller {seller_id}: {e}")
+        return []
+
+
+def load_company_info(seller_id):
+    """
+    Load only a seller's company_info.
+    
+    Returns:
+        dict: Company info (empty if not set)
+    """
+    company_info = load_seller_field(seller_id, 'company_info')
+    return company_info if isinstance(company_info, dict) else {}
+
+
+def load_products(seller_id):
+    """
+    Load only a seller's products.
+    
+    Returns:
+        list: Products (empty if none)
+    """
+    return products_to_list(load_seller_field(seller_id, 'products'))
+
+
+def load_orders(seller_id, order_status=None, buyer_phone=None):
+    """
+    Load a seller's orders, optionally filtered on the server.
+    
+    Filters use indexed order_by_child queries (see database.rules.json). If the
+    index is not deployed yet the orders are read in full and filtered here.
+    
+    Args:
+        seller_id (str): Seller ID
+        order_status (str): Only orders with this order_status
+        buyer_phone (str): Only orders placed by this buyer
+        
+    Returns:
+        list: Orders in placement order
+    """
+    filters = {}
+    if order_status:
+        filters['order_status'] = order_status
+    if buyer_phone:
+        filters['buyer_phone'] = buyer_phone
+    
+    try:
+        initialize_firebase()
+        safe_seller_id = sanitize_email_for_firebase(seller_id)
+        orders_ref = _ref(f'sellers/{safe_seller_id}/orders')
+        
+        orders = None
+        if SELLER_MIRROR_ENABLED:
+            found, orders = _seller_mirror.peek(safe_seller_id, 'orders')
+            if not found:
+                orders = None
+        
+        if orders is None and filters:
+            field, value = next(iter(filters.items()))
+            try:
+                orders = orders_ref.order_by_child(field).equal_to(value).get()
+            except Exception as e:
+                print(f"⚠️ Indexed order query on {field} failed, reading all orders: {e}")
+        
+        if orders is None:
+            orders = orders_ref.get()
+        
+        return [
+            order for order in orders_to_list(orders)
+            if all(str(order.get(field)) == str(value) for field, value in filters.items())
+        ]
+    except Exception as e:
+        print(f"Error loading orders for seller {seller_id}: {e}")
+        return []
+
+
 def load_sellers_data():
     """
     Load all sellers data from Firebase (for backward compatibility).
@@ -257,7 +752,7 @@ def load_sellers_data():
     """
     try:
         initialize_firebase()
-        sellers_ref = db.reference('sellers')
+        sellers_ref = _ref('sellers')
         data = sellers_ref.get()
         
         if data is None:
@@ -285,7 +780,22 @@ def save_seller_data(seller_id, seller_data):
         initialize_firebase()
         # Sanitize email for Firebase path (emails contain . and @ which are not allowed)
         safe_seller_id = sanitize_email_for_firebase(seller_id)
-        seller_ref = db.reference(f'sellers/{safe_seller_id}')
+        seller_ref = _ref(f'sellers/{safe_seller_id}')
+        
+        # Legacy callers may still pass orders as a list - store them in the v2 keyed layout
+        if isinstance(seller_data.get('orders'), list):
+            seller_data = dict(seller_data)
+            seller_data['orders'] = _orders_to_v2_map(seller_data['orders']) or None
+            seller_data['order_layout'] = ORDER_LAYOUT_V2
+            _order_layouts[safe_seller_id] = ORDER_LAYOUT_V2
+            # Whole-list writes carry no listing fields; backfill them on the next listing
+            seller_data['order_listing'] = None
+            _order_listing_ready.discard(safe_seller_id)
+        if isinstance(seller_data.get('products'), list):
+            seller_data = dict(seller_data)
+            seller_data['products'] = _products_to_keyed_map(seller_data['products']) or None
+            _keyed_product_sellers.add(safe_seller_id)
+        
         # Use update() instead of set() to preserve other data (conv_history, customers, etc.)
         seller_ref.update(seller_data)
         return True
@@ -306,7 +816,7 @@ def save_sellers_data(sellers_data):
     """
     try:
         initialize_firebase()
-        sellers_ref = db.reference('sellers')
+        sellers_ref = _ref('sellers')
         sellers_ref.set(sellers_data)
         return True
     except Exception as e:
@@ -314,48 +824,1178 @@ def save_sellers_data(sellers_data):
         return False
 
 
-def add_order(seller_id, order):
-    """Add a new order to specific seller's orders list"""
+# ==================== PRODUCTS ====================
+# sellers/<id>/products is a map keyed by product_key(product_id), so creating,
+# editing or deleting a product writes one child instead of the whole catalog.
+# Sellers still on the legacy positional list are converted on their first
+# product write. New product IDs come from sellers/<id>/counters/product_seq.
+
+# safe_seller_ids whose products are known to be keyed
+_keyed_product_sellers = set()
+
+
+def product_key(product_id):
+    """
+    Get the map key for a product.
+    Prefixed so Firebase never coerces the map into an array.
+    """
+    return f"product_{product_id}"
+
+
+def _product_sort_key(product):
+    product_id = product.get('id')
+    if isinstance(product_id, (int, float)):
+        return (0, product_id, '')
+    return (1, 0, str(product_id))
+
+
+def products_to_list(products):
+    """
+    Normalize a products node from either layout into a list of products.
+    
+    Args:
+        products: Raw value of sellers/<id>/products (list with None holes, or keyed map)
+        
+    Returns:
+        list: Products ordered by ID, without None entries
+    """
+    if isinstance(products, dict):
+        return sorted((product for product in products.values() if isinstance(product, dict)), key=_product_sort_key)
+    return [product for product in (products or []) if isinstance(product, dict)]
+
+
+def _products_to_keyed_map(products):
+    """Convert a products node from either layout into the keyed map"""
+    keyed = {}
+    items = products.items() if isinstance(products, dict) else enumerate(products or [])
+    for key, product in items:
+        if not isinstance(product, dict):
+            continue
+        key = str(key)
+        if key.startswith('product_'):
+            keyed[key] = product
+        elif product.get('id') is None:
+            keyed[f"product_legacy_{key}"] = product
+        else:
+            keyed[product_key(product['id'])] = product
+    return keyed
+
+
+def _ensure_products_keyed(safe_seller_id):
+    """Make sure a seller's products are keyed before a single-product write"""
+    if safe_seller_id in _keyed_product_sellers:
+        return
+    
+    products_ref = _ref(f'sellers/{safe_seller_id}/products')
+    keys = products_ref.get(shallow=True)
+    if keys and not (isinstance(keys, dict) and all(str(key).startswith('product_') for key in keys)):
+        # Transaction so a concurrent legacy write is not lost
+        products_ref.transaction(lambda current: _products_to_keyed_map(current) or None)
+        print(f"✅ Products converted to keyed layout for seller {safe_seller_id}")
+    _keyed_product_sellers.add(safe_seller_id)
+
+
+def _highest_product_id(safe_seller_id):
+    """Find the highest existing product ID, used to seed a missing counter"""
+    keys = _ref(f'sellers/{safe_seller_id}/products').get(shallow=True) or {}
+    highest = 0
+    for key in keys:
+        suffix = str(key)[len('product_'):]
+        if suffix.isdigit():
+            highest = max(highest, int(suffix))
+    return highest
+
+
+def allocate_product_id(seller_id):
+    """
+    Allocate the next product ID for a seller.
+    
+    Args:
+        seller_id (str): Seller ID
+        
+    Returns:
+        int: New product ID, or None if the counter could not be reached
+    """
+    try:
+        initialize_firebase()
+        safe_seller_id = sanitize_email_for_firebase(seller_id)
+        _ensure_products_keyed(safe_seller_id)
+        
+        counter_ref = _ref(f'sellers/{safe_seller_id}/counters/product_seq')
+        seed = None
+        if counter_ref.get() is None:
+            seed = _highest_product_id(safe_seller_id)
+        
+        def increment(current):
+            base = current if isinstance(current, int) else (seed or 0)
+            return base + 1
+        
+        return counter_ref.transaction(increment)
+    except Exception as e:
+        print(f"❌ Error allocating product ID for seller {seller_id}: {e}")
+        return None
+
+
+def add_product(seller_id, product):
+    """
+    Write a new product under its own key.
+    
+    Args:
+        seller_id (str): Seller ID
+        product (dict): Product data with an 'id' from allocate_product_id
+        
+    Returns:
+        bool: True if successful, False otherwise
+    """
     try:
         initialize_firebase()
-        orders_ref = db.reference(f'sellers/{seller_id}/orders')
-        orders = orders_ref.get() or []
-        orders.append(order)
-        orders_ref.set(orders)
+        safe_seller_id = sanitize_email_for_firebase(seller_id)
+        _ensure_products_keyed(safe_seller_id)
+        _ref(f'sellers/{safe_seller_id}/products/{product_key(product["id"])}').set(product)
         return True
     except Exception as e:
-        print(f"Error adding order to Firebase: {e}")
+        print(f"❌ Error adding product for seller {seller_id}: {e}")
         return False
 
 
-def update_order_status(seller_id, order_id, order_status=None, payment_status=None):
-    """Update order status in Firebase for specific seller - updates only the specific order"""
+def update_product_fields(seller_id, product_id, fields):
+    """
+    Update only the given fields of one product.
+    
+    Args:
+        seller_id (str): Seller ID
+        product_id (int): Product ID
+        fields (dict): Fields to update
+        
+    Returns:
+        dict: The updated product, or None if not found or on error
+    """
     try:
         initialize_firebase()
         safe_seller_id = sanitize_email_for_firebase(seller_id)
-        orders_ref = db.reference(f'sellers/{safe_seller_id}/orders')
-        orders = orders_ref.get() or []
+        _ensure_products_keyed(safe_seller_id)
         
-        for i, order in enumerate(orders):
-            if order is None:
-                continue
-            if order.get('order_id') == order_id or order.get('id') == order_id:
-                # Update only the specific order at index i
-                order_ref = db.reference(f'sellers/{safe_seller_id}/orders/{i}')
-                updates = {}
-                if order_status:
-                    updates['order_status'] = order_status
-                if payment_status:
-                    updates['payment_status'] = payment_status
-                order_ref.update(updates)
-                return True
+        product_ref = _ref(f'sellers/{safe_seller_id}/products/{product_key(product_id)}')
+        product = product_ref.get()
+        if not product:
+            return None
+        if fields:
+            product_ref.update(fields)
+            product.update(fields)
+        return product
+    except Exception as e:
+        print(f"❌ Error updating product {product_id}: {e}")
+        return None
+
+
+def delete_product(seller_id, product_id):
+    """
+    Delete one product.
+    
+    Args:
+        seller_id (str): Seller ID
+        product_id (int): Product ID
         
+    Returns:
+        bool: True if successful (including when it did not exist), False otherwise
+    """
+    try:
+        initialize_firebase()
+        safe_seller_id = sanitize_email_for_firebase(seller_id)
+        _ensure_products_keyed(safe_seller_id)
+        _ref(f'sellers/{safe_seller_id}/products/{product_key(product_id)}').delete()
+        return True
+    except Exception as e:
+        print(f"❌ Error deleting product {product_id}: {e}")
         return False
+
+
+def update_company_info_fields(seller_id, fields):
+    """
+    Update only the given company_info fields of a seller.
+    
+    Args:
+        seller_id (str): Seller ID
+        fields (dict): company_info field -> value
+        
+    Returns:
+        bool: True if successful, False otherwise
+    """
+    try:
+        initialize_firebase()
+        safe_seller_id = sanitize_email_for_firebase(seller_id)
+        if fields:
+            _ref(f'sellers/{safe_seller_id}/company_info').update(fields)
+        return True
     except Exception as e:
-        print(f"Error updating order status in Firebase: {e}")
+        print(f"❌ Error updating company info for seller {seller_id}: {e}")
         return False
 
 
+# ==================== ORDERS ====================
+# Order layouts under sellers/<id>/orders:
+#   v1 - positional list (legacy), located by scanning
+#   v2 - map keyed by order_key(order_id), read and updated one child at a time
+# sellers/<id>/order_layout records the layout; writes migrate v1 sellers online.
+
+ORDER_LAYOUT_V1 = 1
+ORDER_LAYOUT_V2 = 2
+
+# safe_seller_id -> layout, only v2 is cached since v1 sellers migrate on first write
+_order_layouts = {}
+
+
+def order_key(order_id):
+    """
+    Get the v2 map key for an order.
+    Prefixed so Firebase never coerces the map into an array.
+    """
+    return f"order_{order_id}"
+
+
+def _order_matches(order, order_id):
+    return order.get('order_id') == order_id or order.get('id') == order_id
+
+
+def _order_sort_key(order):
+    order_id = order.get('order_id', order.get('id'))
+    if isinstance(order_id, (int, float)):
+        return (0, order_id, '')
+    return (1, 0, str(order_id))
+
+
+def _iter_order_items(orders):
+    """Yield (child_key, order) pairs for either order layout, skipping holes"""
+    if isinstance(orders, dict):
+        items = orders.items()
+    elif isinstance(orders, list):
+        items = enumerate(orders)
+    else:
+        return
+    for key, order in items:
+        if isinstance(order, dict):
+            yield str(key), order
+
+
+def orders_to_list(orders):
+    """
+    Normalize an orders node from either layout into a list of orders.
+    
+    Args:
+        orders: Raw value of sellers/<id>/orders (list with None holes, or v2 map)
+        
+    Returns:
+        list: Orders in placement order, without None entries
+    """
+    if isinstance(orders, dict):
+        return sorted((order for _, order in _iter_order_items(orders)), key=_order_sort_key)
+    return [order for _, order in _iter_order_items(orders)]
+
+
+def _orders_to_v2_map(orders):
+    """
+    Convert an orders node from either layout into the v2 keyed map.
+    Legacy numbering (len(orders)+1) could hand out an ID twice after a
+    cancellation; the later order with a repeated ID is kept as
+    order_<id>_dup<n> instead of overwriting the earlier one.
+    """
+    migrated = {}
+    for key, order in _iter_order_items(orders):
+        order_id = order.get('order_id', order.get('id'))
+        if key.startswith('order_') or order_id is None:
+            new_key = key if key.startswith('order_') else f"order_legacy_{key}"
+        else:
+            new_key = order_key(order_id)
+        if new_key in migrated:
+            base, n = new_key, 1
+            while f"{base}_dup{n}" in migrated:
+                n += 1
+            new_key = f"{base}_dup{n}"
+            print(f"⚠️ Duplicate order ID {order_id}: keeping both, the later order is stored as {new_key}")
+        migrated[new_key] = order
+    return migrated
+
+
+def get_order_layout(seller_id):
+    """
+    Get the order layout version for a seller.
+    
+    Args:
+        seller_id (str): Seller ID
+        
+    Returns:
+        int: ORDER_LAYOUT_V1 or ORDER_LAYOUT_V2
+    """
+    safe_seller_id = sanitize_email_for_firebase(seller_id)
+    if _order_layouts.get(safe_seller_id) == ORDER_LAYOUT_V2:
+        return ORDER_LAYOUT_V2
+    
+    initialize_firebase()
+    layout = _ref(f'sellers/{safe_seller_id}/order_layout').get()
+    if layout == ORDER_LAYOUT_V2:
+        _order_layouts[safe_seller_id] = ORDER_LAYOUT_V2
+        return ORDER_LAYOUT_V2
+    return ORDER_LAYOUT_V1
+
+
+def migrate_orders_to_v2(seller_id):
+    """
+    Migrate a seller's orders from the positional list to the v2 keyed map.
+    Runs as a transaction on the orders node so it is safe while the seller is live.
+    
+    Args:
+        seller_id (str): Seller ID
+        
+    Returns:
+        bool: True if the seller is on the v2 layout afterwards, False otherwise
+    """
+    try:
+        initialize_firebase()
+        safe_seller_id = sanitize_email_for_firebase(seller_id)
+        orders_ref = _ref(f'sellers/{safe_seller_id}/orders')
+        
+        def to_v2(current):
+            return _orders_to_v2_map(current) or None
+        
+        migrated = orders_ref.transaction(to_v2)
+        
+        # Mark the layout and index every migrated order in one write
+        updates = {f'sellers/{safe_seller_id}/order_layout': ORDER_LAYOUT_V2}
+        for order in orders_to_list(migrated):
+            order_id = order.get('order_id', order.get('id'))
+            if order_id is not None:
+                updates[order_index_path(order_id, safe_seller_id)] = _order_index_entry(order)
+        _ref().update(updates)
+        _order_layouts[safe_seller_id] = ORDER_LAYOUT_V2
+        
+        print(f"✅ Orders migrated to keyed layout for seller {seller_id}")
+        return True
+    except Exception as e:
+        print(f"❌ Error migrating orders for seller {seller_id}: {e}")
+        return False
+
+
+def _ensure_orders_v2(safe_seller_id):
+    """Make sure a seller is on the v2 layout before a keyed write"""
+    if get_order_layout(safe_seller_id) == ORDER_LAYOUT_V2:
+        return True
+    return migrate_orders_to_v2(safe_seller_id)
+
+
+def _find_order(safe_seller_id, order_id):
+    """
+    Locate an order in either layout.
+    
+    Returns:
+        tuple: (child_key, order) or (None, None) if not found
+    """
+    if get_order_layout(safe_seller_id) == ORDER_LAYOUT_V2:
+        key = order_key(order_id)
+        order = _ref(f'sellers/{safe_seller_id}/orders/{key}').get()
+        return (key, order) if order else (None, None)
+    
+    # v1 compatibility: scan the positional list
+    orders = _ref(f'sellers/{safe_seller_id}/orders').get()
+    for key, order in _iter_order_items(orders):
+        if _order_matches(order, order_id):
+            return key, order
+    return None, None
+
+
+def get_order(seller_id, order_id):
+    """
+    Get a single order for a seller.
+    
+    Args:
+        seller_id (str): Seller ID
+        order_id (int): Order ID
+        
+    Returns:
+        dict: Order data or None if not found
+    """
+    try:
+        initialize_firebase()
+        safe_seller_id = sanitize_email_for_firebase(seller_id)
+        _, order = _find_order(safe_seller_id, order_id)
+        return order
+    except Exception as e:
+        print(f"❌ Error getting order {order_id}: {e}")
+        return None
+
+
+ORDER_READ_CONCURRENCY = max(1, int(os.environ.get('ORDER_READ_CONCURRENCY', '16')))
+
+
+def get_orders(seller_id, order_ids):
+    """
+    Get several orders for a seller. Keyed orders are read concurrently, so
+    the cost is about one round trip and only the requested orders download.
+    
+    Args:
+        seller_id (str): Seller ID
+        order_ids (list): Order IDs
+        
+    Returns:
+        dict: order_id -> order for the orders that exist, or None on error
+    """
+    try:
+        initialize_firebase()
+        safe_seller_id = sanitize_email_for_firebase(seller_id)
+        order_ids = list(dict.fromkeys(order_ids))
+        if not order_ids:
+            return {}
+        
+        if get_order_layout(safe_seller_id) != ORDER_LAYOUT_V2:
+            # v1 compatibility: one read of the positional list
+            wanted = {str(order_id): order_id for order_id in order_ids}
+            orders = _ref(f'sellers/{safe_seller_id}/orders').get()
+            found = {}
+            for _, order in _iter_order_items(orders):
+                order_id = wanted.get(str(order.get('order_id', order.get('id'))))
+                if order_id is not None:
+                    found[order_id] = order
+            return found
+        
+        def read(order_id):
+            return order_id, _ref(f'sellers/{safe_seller_id}/orders/{order_key(order_id)}').get()
+        
+        with ThreadPoolExecutor(max_workers=min(ORDER_READ_CONCURRENCY, len(order_ids))) as pool:
+            return {order_id: order for order_id, order in pool.map(read, order_ids) if order}
+    except Exception as e:
+        print(f"❌ Error getting orders: {e}")
+        return None
+
+
+def update_order_fields(seller_id, order_id, fields, check_exists=True, batch=None, current=None):
+    """
+    Update selected fields of a single order with a partial update() write.
+    Changes to listed fields (statuses, buyer phone) also rewrite the order's
+    listing fields and move its order_stats counts in the same write.
+    
+    Args:
+        seller_id (str): Seller ID
+        order_id (int): Order ID
+        fields (dict): Field name -> new value (None removes the field)
+        check_exists (bool): Verify the order exists first (skip if the caller just read it)
+        batch (WriteBatch): Optional batch to queue the write on instead of committing it
+        current (dict): The order as the caller just read it; saves a read when listed fields change
+        
+    Returns:
+        bool: True if successful (or queued), False if the order was not found or on error
+    """
+    try:
+        initialize_firebase()
+        safe_seller_id = sanitize_email_for_firebase(seller_id)
+        if not fields:
+            return True
+        if not _ensure_orders_v2(safe_seller_id):
+            return False
+        
+        key = order_key(order_id)
+        order_path = f'sellers/{safe_seller_id}/orders/{key}'
+        order_ref = _ref(order_path)
+        listed = any(field in fields for field in _LISTED_ORDER_FIELDS)
+        if listed and current is None:
+            current = order_ref.get()
+            if not current:
+                print(f"⚠️ Order {order_id} not found")
+                return False
+        elif check_exists and current is None and not order_ref.get(shallow=True):
+            print(f"⚠️ Order {order_id} not found")
+            return False
+        
+        stats = {}
+        if listed:
+            updated = dict(current, **fields)
+            listing = order_listing_fields(key, updated)
+            fields = dict(fields, **{name: value for name, value in listing.items() if current.get(name) != value})
+            stats = _order_stats_deltas(current, updated)
+        
+        if batch is not None:
+            batch.update(order_path, fields)
+            for path, delta in stats.items():
+                batch.increment(_order_stats_path(safe_seller_id, path), delta)
+            return True
+        if not stats:
+            order_ref.update(fields)
+            return True
+        updates = {f'{order_path}/{field}': value for field, value in fields.items()}
+        updates.update({_order_stats_path(safe_seller_id, path): server_increment(delta) for path, delta in stats.items()})
+        _ref().update(updates)
+        return True
+    except Exception as e:
+        print(f"❌ Error updating order {order_id}: {e}")
+        return False
+
+
+# Order fields that feed the listing fields and order_stats
+_LISTED_ORDER_FIELDS = ('order_status', 'payment_status', 'buyer_phone', 'created_at')
+
+
+def _order_write_paths(safe_seller_id, order):
+    """Paths written when an order is created: the keyed order (with listing fields) and its index entry"""
+    order_id = order.get('order_id', order.get('id'))
+    key = order_key(order_id)
+    return {
+        f'sellers/{safe_seller_id}/orders/{key}': dict(order, **order_listing_fields(key, order)),
+        order_index_path(order_id, safe_seller_id): _order_index_entry(order)
+    }
+
+
+def add_order(seller_id, order, batch=None):
+    """
+    Add a new order to specific seller's orders map
+    
+    Args:
+        seller_id (str): Seller ID
+        order (dict): Order to add (must carry order_id)
+        batch (WriteBatch): Optional batch to queue the write on instead of committing it
+        
+    Returns:
+        bool: True if successful (or queued), False otherwise
+    """
+    try:
+        initialize_firebase()
+        safe_seller_id = sanitize_email_for_firebase(seller_id)
+        if not _ensure_orders_v2(safe_seller_id):
+            return False
+        paths = _order_write_paths(safe_seller_id, order)
+        stats = _order_stats_deltas(None, order)
+        if batch is not None:
+            for path, value in paths.items():
+                batch.set(path, value)
+            for path, delta in stats.items():
+                batch.increment(_order_stats_path(safe_seller_id, path), delta)
+            return True
+        # Order, its index entry and its counts land in one atomic multi-path update
+        paths.update({_order_stats_path(safe_seller_id, path): server_increment(delta) for path, delta in stats.items()})
+        _ref().update(paths)
+        return True
+    except Exception as e:
+        print(f"Error adding order to Firebase: {e}")
+        return False
+
+
+def update_order_status(seller_id, order_id, order_status=None, payment_status=None):
+    """Update order status in Firebase for specific seller - updates only the specific order"""
+    updates = {}
+    if order_status:
+        updates['order_status'] = order_status
+    if payment_status:
+        updates['payment_status'] = payment_status
+    return update_order_fields(seller_id, order_id, updates)
+
+
+# ==================== ORDER NUMBERING ====================
+# Per-seller order numbers come from a transaction-backed counter at
+# sellers/<id>/counters/order_seq. Each process reserves a block of
+# ORDER_ID_BLOCK_SIZE numbers at a time and hands them out locally, so most
+# allocations need no network round trip. Unused numbers in a block are
+# skipped if the process restarts; numbers are never handed out twice.
+
+ORDER_ID_BLOCK_SIZE = max(1, int(os.environ.get('ORDER_ID_BLOCK_SIZE', '10')))
+
+_order_id_blocks = {}   # safe_seller_id -> [next_id, last_id]
+_order_id_locks = {}
+_order_id_locks_guard = threading.Lock()
+
+
+def _highest_order_id(safe_seller_id):
+    """Find the highest existing order number, used to seed a missing counter"""
+    orders_ref = _ref(f'sellers/{safe_seller_id}/orders')
+    keys = orders_ref.get(shallow=True) or {}
+    
+    highest = 0
+    if isinstance(keys, dict) and all(str(key).startswith('order_') for key in keys):
+        for key in keys:
+            suffix = str(key)[len('order_'):]
+            if suffix.isdigit():
+                highest = max(highest, int(suffix))
+        return highest
+    
+    # Legacy list layout: order numbers are not in the keys, read the orders
+    for order in orders_to_list(orders_ref.get()):
+        order_id = order.get('order_id', order.get('id'))
+        if isinstance(order_id, int):
+            highest = max(highest, order_id)
+    return highest
+
+
+def _reserve_order_id_block(safe_seller_id, block_size):
+    """
+    Reserve block_size order numbers from the seller's counter.
+    
+    Returns:
+        list: [first_id, last_id] of the reserved block
+    """
+    counter_ref = _ref(f'sellers/{safe_seller_id}/counters/order_seq')
+    seed = None
+    if counter_ref.get() is None:
+        seed = _highest_order_id(safe_seller_id)
+    
+    def reserve(current):
+        base = current if isinstance(current, int) else (seed or 0)
+        return base + block_size
+    
+    last_id = counter_ref.transaction(reserve)
+    return [last_id - block_size + 1, last_id]
+
+
+def allocate_order_id(seller_id):
+    """
+    Allocate the next order number for a seller.
+    Safe under concurrent checkouts across threads and processes.
+    
+    Args:
+        seller_id (str): Seller ID
+        
+    Returns:
+        int: New order ID, or None if the counter could not be reached
+    """
+    safe_seller_id = sanitize_email_for_firebase(seller_id)
+    with _order_id_locks_guard:
+        lock = _order_id_locks.setdefault(safe_seller_id, threading.Lock())
+    
+    with lock:
+        block = _order_id_blocks.get(safe_seller_id)
+        if not block or block[0] > block[1]:
+            try:
+                initialize_firebase()
+                block = _reserve_order_id_block(safe_seller_id, ORDER_ID_BLOCK_SIZE)
+            except Exception as e:
+                print(f"❌ Error allocating order ID for seller {seller_id}: {e}")
+                return None
+            _order_id_blocks[safe_seller_id] = block
+        
+        order_id = block[0]
+        block[0] += 1
+        return order_id
+
+
+# ==================== ORDER INDEX ====================
+# order_index/<order_id>/<safe_seller_id> -> {'buyer_phone': ...}
+# Order IDs are numbered per seller, so each index node lists every seller
+# that owns an order with that number (normally one or a handful).
+
+def order_index_path(order_id, safe_seller_id):
+    """Get the order_index path for an order owned by a seller"""
+    return f'order_index/{order_id}/{safe_seller_id}'
+
+
+def _order_index_entry(order):
+    return {'buyer_phone': order.get('buyer_phone') or ''}
+
+
+def lookup_order_sellers(order_id, buyer_phone=None):
+    """
+    Find which sellers own an order ID using the order index.
+    
+    Args:
+        order_id (int): Order ID
+        buyer_phone (str): Optional buyer phone to narrow down the candidates
+        
+    Returns:
+        dict: safe_seller_id -> index entry (empty if not indexed)
+    """
+    try:
+        initialize_firebase()
+        entries = _ref(f'order_index/{order_id}').get() or {}
+        if not isinstance(entries, dict):
+            return {}
+        if buyer_phone:
+            matching = {
+                seller: entry for seller, entry in entries.items()
+                if not isinstance(entry, dict) or not entry.get('buyer_phone')
+                or str(entry.get('buyer_phone')) == str(buyer_phone)
+            }
+            return matching
+        return entries
+    except Exception as e:
+        print(f"❌ Error looking up order index for {order_id}: {e}")
+        return {}
+
+
+def backfill_order_index(seller_id):
+    """
+    Write order_index entries for all of a seller's existing orders.
+    
+    Args:
+        seller_id (str): Seller ID
+        
+    Returns:
+        bool: True if successful, False otherwise
+    """
+    try:
+        initialize_firebase()
+        safe_seller_id = sanitize_email_for_firebase(seller_id)
+        orders = _ref(f'sellers/{safe_seller_id}/orders').get()
+        
+        updates = {}
+        for order in orders_to_list(orders):
+            order_id = order.get('order_id', order.get('id'))
+            if order_id is not None:
+                updates[order_index_path(order_id, safe_seller_id)] = _order_index_entry(order)
+        
+        if updates:
+            _ref().update(updates)
+        print(f"✅ Indexed {len(updates)} orders for seller {seller_id}")
+        return True
+    except Exception as e:
+        print(f"❌ Error backfilling order index for {seller_id}: {e}")
+        return False
+
+
+# ==================== ORDER LISTING ====================
+# Every order carries composite listing fields so the dashboard pages through
+# orders with one ordered, indexed range query per page (see database.rules.json):
+#   idx_created   "<created_at>|<order key>"
+#   idx_status    "<order_status>|<created_at>|<order key>"
+#   idx_payment   "<payment_status>|<created_at>|<order key>"
+#   idx_buyer     "<buyer_phone>|<created_at>|<order key>"
+# The order key suffix makes each value unique, so a page cursor is exact even
+# when orders share a timestamp. sellers/<id>/order_stats keeps running counts
+# ({'total', 'order_status': {...}, 'payment_status': {...}}) that move with
+# server-side increments in the same write as the status change.
+# sellers/<id>/order_listing records that a seller's older orders were backfilled.
+
+ORDER_LISTING_VERSION = 1
+ORDER_PAGE_SIZE = max(1, int(os.environ.get('ORDER_PAGE_SIZE', '50')))
+ORDER_PAGE_MAX = max(1, int(os.environ.get('ORDER_PAGE_MAX', '200')))
+# Orders one page may read when a second filter has to be applied in memory
+ORDER_PAGE_MAX_SCAN = max(1, int(os.environ.get('ORDER_PAGE_MAX_SCAN', '1000')))
+
+# Filter -> listing field, most selective first: the first filter given picks the index
+ORDER_LISTING_FILTERS = {
+    'buyer_phone': 'idx_buyer',
+    'order_status': 'idx_status',
+    'payment_status': 'idx_payment'
+}
+ORDER_STATS_FIELDS = ('order_status', 'payment_status')
+
+# Highest character Firebase sorts on, closes a prefix range
+_RANGE_END = '\uf8ff'
+
+# safe_seller_ids whose orders are known to be backfilled
+_order_listing_ready = set()
+
+
+def order_listing_fields(key, order):
+    """
+    Listing fields for an order.
+    
+    Args:
+        key (str): The order's child key (order_key(order_id))
+        order (dict): Order data
+        
+    Returns:
+        dict: idx_created, idx_status, idx_payment and idx_buyer values
+    """
+    tail = f"{order.get('created_at') or ''}|{key}"
+    return {
+        'idx_created': tail,
+        'idx_status': f"{order.get('order_status') or ''}|{tail}",
+        'idx_payment': f"{order.get('payment_status') or ''}|{tail}",
+        'idx_buyer': f"{order.get('buyer_phone') or ''}|{tail}"
+    }
+
+
+def _stats_key(value):
+    return _safe_key(value) if value not in (None, '') else 'Unknown'
+
+
+def _order_stats_deltas(old, new):
+    """
+    Count changes under order_stats for an order moving from old to new.
+    
+    Args:
+        old (dict): Order before the change, or None for a new order
+        new (dict): Order after the change, or None for a deleted order
+        
+    Returns:
+        dict: Path relative to order_stats -> delta
+    """
+    deltas = {}
+    if new is None:
+        deltas['total'] = -1
+        for field in ORDER_STATS_FIELDS:
+            deltas[f'{field}/{_stats_key(old.get(field))}'] = -1
+        return deltas
+    if old is None:
+        deltas['total'] = 1
+    for field in ORDER_STATS_FIELDS:
+        new_key = _stats_key(new.get(field))
+        if old is not None:
+            old_key = _stats_key(old.get(field))
+            if old_key == new_key:
+                continue
+            deltas[f'{field}/{old_key}'] = -1
+        deltas[f'{field}/{new_key}'] = 1
+    return deltas
+
+
+def _order_stats_path(safe_seller_id, path=''):
+    return f'sellers/{safe_seller_id}/order_stats/{path}'.rstrip('/')
+
+
+def backfill_order_listing(seller_id):
+    """
+    Add listing fields to orders written before they existed and recount
+    order_stats. Orders that already have listing fields are not rewritten,
+    so this is safe to run again.
+    
+    Args:
+        seller_id (str): Seller ID
+        
+    Returns:
+        bool: True if the seller's orders are listable afterwards, False otherwise
+    """
+    try:
+        initialize_firebase()
+        safe_seller_id = sanitize_email_for_firebase(seller_id)
+        if not _ensure_orders_v2(safe_seller_id):
+            return False
+        
+        orders = _ref(f'sellers/{safe_seller_id}/orders').get()
+        stats = {'total': 0, 'order_status': {}, 'payment_status': {}}
+        updates = {f'sellers/{safe_seller_id}/order_listing': ORDER_LISTING_VERSION}
+        for key, order in _iter_order_items(orders):
+            if 'idx_created' not in order:
+                for field, value in order_listing_fields(key, order).items():
+                    updates[f'sellers/{safe_seller_id}/orders/{key}/{field}'] = value
+            stats['total'] += 1
+            for field in ORDER_STATS_FIELDS:
+                stat_key = _stats_key(order.get(field))
+                stats[field][stat_key] = stats[field].get(stat_key, 0) + 1
+        updates[_order_stats_path(safe_seller_id)] = stats
+        
+        _ref().update(updates)
+        _order_listing_ready.add(safe_seller_id)
+        print(f"✅ Order listing fields backfilled for seller {seller_id} ({stats['total']} orders)")
+        return True
+    except Exception as e:
+        print(f"❌ Error backfilling order listing for seller {seller_id}: {e}")
+        return False
+
+
+def _ensure_order_listing(safe_seller_id):
+    """Make sure a seller's older orders have listing fields before an indexed listing"""
+    if safe_seller_id in _order_listing_ready:
+        return True
+    if _ref(f'sellers/{safe_seller_id}/order_listing').get() == ORDER_LISTING_VERSION:
+        _order_listing_ready.add(safe_seller_id)
+        return True
+    return backfill_order_listing(safe_seller_id)
+
+
+def _order_range(safe_seller_id, index_field, start, end, limit):
+    """
+    Read the last `limit` orders whose index_field value lies in [start, end].
+    
+    Returns:
+        list: (listing value, key, order) tuples in ascending listing order
+    """
+    orders_ref = _ref(f'sellers/{safe_seller_id}/orders')
+    
+    orders, ranged = None, False
+    if SELLER_MIRROR_ENABLED:
+        found, orders = _seller_mirror.peek(safe_seller_id, 'orders')
+        if not found:
+            orders = None
+    if orders is None:
+        try:
+            orders = orders_ref.order_by_child(index_field).start_at(start).end_at(end).limit_to_last(limit).get()
+            ranged = True
+        except Exception as e:
+            print(f"⚠️ Indexed order query on {index_field} failed, reading all orders: {e}")
+            orders = orders_ref.get()
+    
+    rows = []
+    for key, order in _iter_order_items(orders):
+        value = order_listing_fields(key, order)[index_field]
+        if start <= value <= end:
+            rows.append((value, key, order))
+    rows.sort(key=lambda row: row[0])
+    return rows if ranged else rows[-limit:]
+
+
+def list_orders(seller_id, order_status=None, payment_status=None, buyer_phone=None,
+                date_from=None, date_to=None, limit=ORDER_PAGE_SIZE, cursor=None):
+    """
+    Get one page of a seller's orders, newest first.
+    
+    The first filter given (buyer_phone, order_status, payment_status) and the
+    date range run as an indexed range query; any further filter is applied to
+    the rows that query returns, reading at most ORDER_PAGE_MAX_SCAN orders.
+    
+    Args:
+        seller_id (str): Seller ID
+        order_status (str): Only orders with this order_status
+        payment_status (str): Only orders with this payment_status
+        buyer_phone (str): Only orders placed by this buyer
+        date_from (str): Only orders created at or after this ISO date/time
+        date_to (str): Only orders created on or before this ISO date/time
+        limit (int): Page size (capped at ORDER_PAGE_MAX)
+        cursor (str): next_cursor from the previous page
+        
+    Returns:
+        dict: {'orders': [...], 'next_cursor': str or None} (an empty page on error)
+    """
+    filters = {
+        name: value for name, value in
+        (('buyer_phone', buyer_phone), ('order_status', order_status), ('payment_status', payment_status))
+        if value
+    }
+    limit = max(1, min(int(limit or ORDER_PAGE_SIZE), ORDER_PAGE_MAX))
+    
+    try:
+        initialize_firebase()
+        safe_seller_id = sanitize_email_for_firebase(seller_id)
+        _ensure_order_listing(safe_seller_id)
+        
+        if filters:
+            primary = next(iter(filters))
+            index_field, prefix = ORDER_LISTING_FILTERS[primary], f"{filters[primary]}|"
+        else:
+            primary, index_field, prefix = None, 'idx_created', ''
+        start = prefix + (date_from or '')
+        end = prefix + (f"{date_to}{_RANGE_END}" if date_to else _RANGE_END)
+        # The cursor row was the last one returned, so the next page ends just before it
+        exclusive_end = bool(cursor)
+        if cursor:
+            end = min(end, prefix + cursor)
+        
+        page, scanned, exhausted = [], 0, False
+        while len(page) <= limit and scanned < ORDER_PAGE_MAX_SCAN:
+            batch_size = limit + 1 - len(page) + (1 if exclusive_end else 0)
+            rows = _order_range(safe_seller_id, index_field, start, end, batch_size)
+            exhausted = len(rows) < batch_size
+            rows.reverse()
+            if exclusive_end and rows and rows[0][0] == end:
+                rows = rows[1:]
+            if not rows:
+                exhausted = True
+                break
+            
+            for value, _, order in rows:
+                if all(str(order.get(name)) == str(expected) for name, expected in filters.items() if name != primary):
+                    page.append((value[len(prefix):], order))
+            scanned += len(rows)
+            if exhausted:
+                break
+            end, exclusive_end = rows[-1][0], True
+        
+        next_cursor = None
+        if len(page) > limit:
+            page = page[:limit]
+            next_cursor = page[-1][0]
+        elif not exhausted:
+            # Scan budget spent before the page filled: resume after the last row read
+            next_cursor = end[len(prefix):]
+        
+        return {'orders': [order for _, order in page], 'next_cursor': next_cursor}
+    except Exception as e:
+        print(f"❌ Error listing orders for seller {seller_id}: {e}")
+        return {'orders': [], 'next_cursor': None}
+
+
+def get_order_stats(seller_id):
+    """
+    Get a seller's order counts.
+    
+    Args:
+        seller_id (str): Seller ID
+        
+    Returns:
+        dict: {'total': int, 'order_status': {status: count}, 'payment_status': {status: count}}
+    """
+    stats = {'total': 0, 'order_status': {}, 'payment_status': {}}
+    try:
+        initialize_firebase()
+        safe_seller_id = sanitize_email_for_firebase(seller_id)
+        _ensure_order_listing(safe_seller_id)
+        stored = _ref(_order_stats_path(safe_seller_id)).get() or {}
+        stats['total'] = stored.get('total') or 0
+        for field in ORDER_STATS_FIELDS:
+            # Statuses with no orders left are dropped
+            stats[field] = {key: count for key, count in (stored.get(field) or {}).items() if count}
+    except Exception as e:
+        print(f"❌ Error loading order stats for seller {seller_id}: {e}")
+    return stats
+
+
+def count_orders(stats, order_status=None, payment_status=None):
+    """
+    Count matching orders from get_order_stats() output.
+    
+    Returns:
+        int: Count, or None if the combination is not counted (both filters at once)
+    """
+    if order_status and payment_status:
+        return None
+    if order_status:
+        return stats['order_status'].get(_stats_key(order_status), 0)
+    if payment_status:
+        return stats['payment_status'].get(_stats_key(payment_status), 0)
+    return stats['total']
+
+
+# ==================== TENANT CONFIG CACHE ====================
+# Per-tenant configuration (WhatsApp/Razorpay credentials, workflow config and
+# the phone_number_id -> seller mapping) changes rarely but is read on every
+# webhook and order update. It is cached in-process under keys like
+# ('whatsapp', seller) and ('phone', phone_number_id). The save_*/delete_*
+# functions invalidate entries explicitly; TENANT_CONFIG_TTL_SECONDS bounds
+# staleness for changes made by other processes. Each key carries a version
+# so a read that started before an invalidation never stores its stale result.
+# Loads run under TENANT_CONFIG_DEADLINE, shorter than a normal read, because
+# an expired entry can be served instead when the database is slow.
+
+TENANT_CONFIG_TTL_SECONDS = float(os.environ.get('TENANT_CONFIG_TTL_SECONDS', '60'))
+TENANT_CONFIG_DEADLINE = float(os.environ.get('TENANT_CONFIG_DEADLINE', '3'))
+
+
+class TenantConfigCache:
+    """Versioned in-process cache for tenant configuration"""
+    
+    def __init__(self, ttl=None):
+        self.ttl = TENANT_CONFIG_TTL_SECONDS if ttl is None else ttl
+        self._lock = threading.Lock()
+        self._entries = {}    # key -> (value, expires_at)
+        self._versions = {}   # key -> invalidation count
+        self.hits = 0
+        self.misses = 0
+        self.stale_served = 0
+    
+    def get(self, key, loader):
+        """
+        Get the cached value for key, calling loader() on a miss.
+        If loader() raises, an expired entry for key is served instead;
+        with no entry the exception propagates and nothing is cached.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.time():
+                self.hits += 1
+                return copy.deepcopy(entry[0])
+            self.misses += 1
+            version = self._versions.get(key, 0)
+        
+        try:
+            with time_limit(TENANT_CONFIG_DEADLINE):
+                value = loader()
+        except Exception as e:
+            # Serve the expired entry while the database is failing (e.g. circuit open)
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self.stale_served += 1
+                    print(f"⚠️ Serving stale tenant config for {key}: {e}")
+                    return copy.deepcopy(entry[0])
+            raise
+        
+        with self._lock:
+            if self._versions.get(key, 0) == version:
+                self._entries[key] = (copy.deepcopy(value), time.time() + self.ttl)
+        return value
+    
+    def peek(self, key):
+        """Get the cached value for key without loading, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return copy.deepcopy(entry[0]) if entry is not None else None
+    
+    def invalidate(self, *keys):
+        """Drop keys and bump their versions so in-flight loads are discarded"""
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+                self._versions[key] = self._versions.get(key, 0) + 1
+    
+    def clear(self):
+        with self._lock:
+            for key in list(self._entries):
+                self._versions[key] = self._versions.get(key, 0) + 1
+            self._entries.clear()
+    
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'stale_served': self.stale_served
+            }
+
+
+_tenant_config = TenantConfigCache()
+
+
+def get_tenant_config_stats():
+    """
+    Get tenant config cache counters.
+    
+    Returns:
+        dict: entries, ttl_seconds, hits, misses, stale_served
+    """
+    return _tenant_config.stats()
+
+
+# ==================== COLD DATA LAYOUT ====================
+# Bulky or rarely-read data lives outside sellers/<id> so the seller node (and
+# the dashboard's listener on it) carries only commerce data:
+#   conversations/<seller>/<buyer>         chat logs (was sellers/<id>/conv_history)
+#   seller_credentials/<seller>/whatsapp   (was sellers/<id>/what_creds)
+#   seller_credentials/<seller>/razorpay   (was sellers/<id>/razorpay_credentials)
+#   verify_tokens/<sha256(token)>          seller that owns a webhook verify token
+# While COLD_DATA_DUAL_READ is on, reads fall back to the legacy locations for
+# sellers that have not been migrated (scripts/migrate_cold_data.py).
+
+COLD_DATA_DUAL_READ = os.environ.get('COLD_DATA_DUAL_READ', 'true').lower() == 'true'
+
+_LEGACY_CREDENTIAL_FIELDS = {
+    'whatsapp': 'what_creds',
+    'razorpay': 'razorpay_credentials'
+}
+
+
+def _credentials_path(safe_seller_id, kind):
+    return f'seller_credentials/{safe_seller_id}/{kind}'
+
+
+def _legacy_credentials_path(safe_seller_id, kind):
+    return f'sellers/{safe_seller_id}/{_LEGACY_CREDENTIAL_FIELDS[kind]}'
+
+
+def _safe_key(value):
+    """Make an external ID (token, payment link ID) usable as a Firebase key"""
+    # Replace characters Firebase doesn't allow in keys: . $ # [ ] /
+    return str(value).replace('.', '_').replace('$', '_').replace('#', '_').replace('[', '_').replace(']', '_').replace('/', '_')
+
+
+def _verify_token_key(token):
+    """Key for a verify token mapping; hashed because _safe_key can map two tokens to one key"""
+    return hashlib.sha256(str(token).encode('utf-8')).hexdigest()
+
+
+def _read_credentials(safe_seller_id, kind):
+    """Read credentials from the credentials root, falling back to the seller node"""
+    creds = _ref(_credentials_path(safe_seller_id, kind)).get()
+    if creds is None and COLD_DATA_DUAL_READ:
+        creds = _ref(_legacy_credentials_path(safe_seller_id, kind)).get()
+    return creds
+
+
+def _write_credentials(safe_seller_id, kind, creds, extra_updates=None):
+    """Write credentials to the credentials root and drop any legacy copy, atomically"""
+    updates = {
+        _credentials_path(safe_seller_id, kind): creds,
+        _legacy_credentials_path(safe_seller_id, kind): None
+    }
+    updates.update(extra_updates or {})
+    _ref().update(updates)
+
+
 # ==================== RAZORPAY INTEGRATION ====================
 
 def save_razorpay_credentials(seller_id, api_key, api_secret, enabled=True):
@@ -374,15 +2014,14 @@ def save_razorpay_credentials(seller_id, api_key, api_secret, enabled=True):
     try:
         initialize_firebase()
         safe_seller_id = sanitize_email_for_firebase(seller_id)
-        credentials_ref = db.reference(f'sellers/{safe_seller_id}/razorpay_credentials')
-        
         credentials = {
             'api_key': api_key,
             'api_secret': api_secret,
             'enabled': enabled
         }
         
-        credentials_ref.set(credentials)
+        _write_credentials(safe_seller_id, 'razorpay', credentials)
+        _tenant_config.invalidate(('razorpay', safe_seller_id))
         print(f"✅ Razorpay credentials saved for seller {seller_id}")
         return True
     except Exception as e:
@@ -403,17 +2042,23 @@ def get_razorpay_credentials(seller_id):
     try:
         initialize_firebase()
         safe_seller_id = sanitize_email_for_firebase(seller_id)
-        credentials_ref = db.reference(f'sellers/{safe_seller_id}/razorpay_credentials')
-        credentials = credentials_ref.get()
-        return credentials
+        return _tenant_config.get(
+            ('razorpay', safe_seller_id),
+            lambda: _read_credentials(safe_seller_id, 'razorpay')
+        )
     except Exception as e:
         print(f"❌ Error getting Razorpay credentials: {e}")
         return None
 
 
+def _payment_link_path(payment_link_id):
+    return f'payment_links/{_safe_key(payment_link_id)}'
+
+
 def update_order_payment_link(seller_id, order_id, payment_link_id):
     """
-    Update order with Razorpay payment link ID
+    Update order with Razorpay payment link ID and index the link.
+    The order field and payment_links/<payment_link_id> are written together.
     
     Args:
         seller_id (str): Seller ID
@@ -423,24 +2068,88 @@ def update_order_payment_link(seller_id, order_id, payment_link_id):
     Returns:
         bool: True if successful, False otherwise
     """
+    batch = WriteBatch()
+    if not update_order_fields(seller_id, order_id, {'payment_link_id': payment_link_id}, batch=batch):
+        return False
+    batch.set(_payment_link_path(payment_link_id), {
+        'seller_id': sanitize_email_for_firebase(seller_id),
+        'order_id': order_id
+    })
+    if batch.commit():
+        print(f"✅ Payment link ID saved for order {order_id}")
+        return True
+    return False
+
+
+def get_payment_link(payment_link_id):
+    """
+    Look up which order a Razorpay payment link belongs to
+    
+    Args:
+        payment_link_id (str): Razorpay payment link ID
+        
+    Returns:
+        dict: {'seller_id', 'order_id', ...} or None if not indexed
+    """
     try:
         initialize_firebase()
-        safe_seller_id = sanitize_email_for_firebase(seller_id)
-        orders_ref = db.reference(f'sellers/{safe_seller_id}/orders')
-        orders = orders_ref.get() or []
+        return _ref(_payment_link_path(payment_link_id)).get()
+    except Exception as e:
+        print(f"❌ Error looking up payment link {payment_link_id}: {e}")
+        return None
+
+
+def complete_order_payment(payment_link_id, payment_id, seller_id=None):
+    """
+    Mark the order behind a paid payment link as Completed.
+    Resolves the order through payment_links/<id>; links created before the
+    index existed are found with an indexed payment_link_id query on the
+    seller's orders instead.
+    
+    Args:
+        payment_link_id (str): Razorpay payment link ID
+        payment_id (str): Razorpay payment ID
+        seller_id (str): Seller ID from the payment link notes (used for unindexed links)
         
-        for i, order in enumerate(orders):
-            if order.get('order_id') == order_id or order.get('id') == order_id:
-                orders[i]['payment_link_id'] = payment_link_id
-                orders_ref.set(orders)
-                print(f"✅ Payment link ID saved for order {order_id}")
-                return True
+    Returns:
+        int: Order ID that was updated, or None if not found or on error
+    """
+    try:
+        initialize_firebase()
+        link = get_payment_link(payment_link_id)
+        
+        if link:
+            safe_seller_id = link.get('seller_id')
+            order_id = link.get('order_id')
+        elif seller_id:
+            safe_seller_id = sanitize_email_for_firebase(seller_id)
+            matches = [
+                order for order in orders_to_list(
+                    _ref(f'sellers/{safe_seller_id}/orders').order_by_child('payment_link_id').equal_to(payment_link_id).get()
+                )
+                if order.get('payment_link_id') == payment_link_id
+            ]
+            if not matches:
+                return None
+            order_id = matches[0].get('order_id')
+        else:
+            return None
         
-        print(f"⚠️ Order {order_id} not found")
-        return False
+        batch = WriteBatch()
+        if not update_order_fields(safe_seller_id, order_id, {
+            'payment_status': 'Completed',
+            'razorpay_payment_id': payment_id
+        }, check_exists=False, batch=batch):
+            return None
+        batch.update(_payment_link_path(payment_link_id), {
+            'seller_id': safe_seller_id,
+            'order_id': order_id,
+            'payment_id': payment_id
+        })
+        return order_id if batch.commit() else None
     except Exception as e:
-        print(f"❌ Error updating order payment link: {e}")
-        return False
+        print(f"❌ Error completing payment for link {payment_link_id}: {e}")
+        return None
 
 
 # ==================== WORKFLOW AUTOMATION ====================
@@ -459,8 +2168,9 @@ def save_workflow_config(seller_id, workflow_config):
     try:
         initialize_firebase()
         safe_seller_id = sanitize_email_for_firebase(seller_id)
-        workflow_ref = db.reference(f'sellers/{safe_seller_id}/workflow_config')
+        workflow_ref = _ref(f'sellers/{safe_seller_id}/workflow_config')
         workflow_ref.set(workflow_config)
+        _tenant_config.invalidate(('workflow', safe_seller_id))
         print(f"✅ Workflow configuration saved for seller {seller_id}")
         return True
     except Exception as e:
@@ -481,15 +2191,61 @@ def get_workflow_config(seller_id):
     try:
         initialize_firebase()
         safe_seller_id = sanitize_email_for_firebase(seller_id)
-        workflow_ref = db.reference(f'sellers/{safe_seller_id}/workflow_config')
-        workflow_config = workflow_ref.get()
-        return workflow_config
+        return _tenant_config.get(
+            ('workflow', safe_seller_id),
+            lambda: _ref(f'sellers/{safe_seller_id}/workflow_config').get()
+        )
     except Exception as e:
         print(f"❌ Error getting workflow configuration: {e}")
         return None
 
 
 # ==================== CANCELLATION MANAGEMENT ====================
+# Pending requests are a keyed set sellers/<id>/cancellations/order_<id>, each
+# holding a summary of the order taken when the buyer asked. Listing reads
+# only the pending entries and fetches their orders by key, concurrently;
+# approving or rejecting deletes one child. Older requests may still sit in the legacy
+# sellers/<id>/cancellation list of order IDs, which is read and cleaned up
+# alongside.
+
+_CANCELLATION_SUMMARY_FIELDS = (
+    'order_id', 'buyer_name', 'buyer_phone', 'items', 'total_amount',
+    'order_status', 'payment_status', 'created_at'
+)
+
+
+def _cancellation_path(safe_seller_id, order_id=None):
+    base = f'sellers/{safe_seller_id}/cancellations'
+    return f'{base}/{order_key(order_id)}' if order_id is not None else base
+
+
+def _cancellation_summary(order):
+    summary = {field: order[field] for field in _CANCELLATION_SUMMARY_FIELDS if order.get(field) is not None}
+    summary['requested_at'] = datetime.now().isoformat()
+    return summary
+
+
+def _legacy_cancellation_ids(safe_seller_id):
+    ids = _ref(f'sellers/{safe_seller_id}/cancellation').get() or []
+    if isinstance(ids, dict):
+        ids = list(ids.values())
+    return [order_id for order_id in ids if order_id is not None]
+
+
+def _clear_cancellation(safe_seller_id, order_id, extra_updates=None):
+    """Remove a pending request from the keyed set and the legacy list"""
+    updates = {_cancellation_path(safe_seller_id, order_id): None}
+    updates.update(extra_updates or {})
+    _ref().update(updates)
+    
+    if order_id in _legacy_cancellation_ids(safe_seller_id):
+        def remove(ids):
+            ids = ids or []
+            if isinstance(ids, dict):
+                ids = list(ids.values())
+            return [other for other in ids if other is not None and other != order_id] or None
+        _ref(f'sellers/{safe_seller_id}/cancellation').transaction(remove)
+
 
 def get_cancellation_requests(seller_id):
     """
@@ -505,24 +2261,28 @@ def get_cancellation_requests(seller_id):
         initialize_firebase()
         safe_seller_id = sanitize_email_for_firebase(seller_id)
         
-        # Get cancellation order IDs
-        cancellation_ref = db.reference(f'sellers/{safe_seller_id}/cancellation')
-        cancellation_order_ids = cancellation_ref.get() or []
-        
-        if not cancellation_order_ids:
-            return []
-        
-        # Get full order details for these order IDs
-        orders_ref = db.reference(f'sellers/{safe_seller_id}/orders')
-        all_orders = orders_ref.get() or []
+        # Pending requests only - never the full orders list
+        pending = _ref(_cancellation_path(safe_seller_id)).get() or {}
+        summaries = {
+            summary.get('order_id'): summary
+            for summary in pending.values() if isinstance(summary, dict)
+        }
+        for order_id in _legacy_cancellation_ids(safe_seller_id):
+            summaries.setdefault(order_id, None)
         
-        # Filter orders by cancellation requests
+        # Fetch the orders by key, concurrently, for current status; keep the summary if one is gone
+        orders = get_orders(seller_id, list(summaries)) or {}
         cancellation_requests = []
-        for order in all_orders:
-            order_id = order.get('order_id') or order.get('id')
-            if order_id in cancellation_order_ids:
+        for order_id, summary in summaries.items():
+            order = orders.get(order_id)
+            if order:
+                if summary and summary.get('requested_at'):
+                    order = dict(order, requested_at=summary['requested_at'])
                 cancellation_requests.append(order)
+            elif summary:
+                cancellation_requests.append(summary)
         
+        cancellation_requests.sort(key=_order_sort_key)
         print(f"✅ Found {len(cancellation_requests)} cancellation requests for seller {seller_id}")
         return cancellation_requests
         
@@ -547,32 +2307,25 @@ def approve_cancellation_request(seller_id, order_id):
         safe_seller_id = sanitize_email_for_firebase(seller_id)
         
         # Get the order before deleting
-        orders_ref = db.reference(f'sellers/{safe_seller_id}/orders')
-        all_orders = orders_ref.get() or []
-        
-        order_to_delete = None
-        remaining_orders = []
-        
-        for order in all_orders:
-            if order.get('order_id') == order_id or order.get('id') == order_id:
-                order_to_delete = order
-            else:
-                remaining_orders.append(order)
+        if not _ensure_orders_v2(safe_seller_id):
+            return None
+        order_ref = _ref(f'sellers/{safe_seller_id}/orders/{order_key(order_id)}')
+        order_to_delete = order_ref.get()
         
         if not order_to_delete:
             print(f"⚠️ Order {order_id} not found")
             return None
         
-        # Delete order from orders list
-        orders_ref.set(remaining_orders)
-        
-        # Remove from cancellation list
-        cancellation_ref = db.reference(f'sellers/{safe_seller_id}/cancellation')
-        cancellation_order_ids = cancellation_ref.get() or []
-        
-        if order_id in cancellation_order_ids:
-            cancellation_order_ids.remove(order_id)
-            cancellation_ref.set(cancellation_order_ids)
+        # Delete the order, its index entry, its counts and the pending request in one write
+        updates = {
+            f'sellers/{safe_seller_id}/orders/{order_key(order_id)}': None,
+            order_index_path(order_id, safe_seller_id): None
+        }
+        updates.update({
+            _order_stats_path(safe_seller_id, path): server_increment(delta)
+            for path, delta in _order_stats_deltas(order_to_delete, None).items()
+        })
+        _clear_cancellation(safe_seller_id, order_id, updates)
         
         print(f"✅ Cancellation approved and order {order_id} deleted for seller {seller_id}")
         return {'success': True, 'order': order_to_delete}
@@ -598,26 +2351,14 @@ def reject_cancellation_request(seller_id, order_id):
         safe_seller_id = sanitize_email_for_firebase(seller_id)
         
         # Get the order
-        orders_ref = db.reference(f'sellers/{safe_seller_id}/orders')
-        all_orders = orders_ref.get() or []
-        
-        order_found = None
-        for order in all_orders:
-            if order.get('order_id') == order_id or order.get('id') == order_id:
-                order_found = order
-                break
+        _, order_found = _find_order(safe_seller_id, order_id)
         
         if not order_found:
             print(f"⚠️ Order {order_id} not found")
             return None
         
-        # Remove from cancellation list (order stays in orders)
-        cancellation_ref = db.reference(f'sellers/{safe_seller_id}/cancellation')
-        cancellation_order_ids = cancellation_ref.get() or []
-        
-        if order_id in cancellation_order_ids:
-            cancellation_order_ids.remove(order_id)
-            cancellation_ref.set(cancellation_order_ids)
+        # Remove the pending request (order stays in orders)
+        _clear_cancellation(safe_seller_id, order_id)
         
         print(f"✅ Cancellation rejected for order {order_id}, seller {seller_id}")
         return {'success': True, 'order': order_found}
@@ -627,13 +2368,19 @@ def reject_cancellation_request(seller_id, order_id):
         return None
 
 
-def request_order_cancellation(order_id):
+def request_order_cancellation(order_id, seller_id=None, buyer_phone=None):
     """
     Request cancellation for an order by adding it to seller's cancellation list.
     This is called when a buyer wants to cancel their order.
     
+    The owning seller is resolved through order_index/<order_id> instead of
+    scanning every seller. Order IDs are numbered per seller, so when the index
+    holds several sellers the buyer's phone number disambiguates.
+    
     Args:
         order_id (int): Order ID to cancel
+        seller_id (str): Seller ID if already known (skips the index lookup)
+        buyer_phone (str): Requesting buyer's phone, used to disambiguate and verify ownership
         
     Returns:
         dict: Result with 'success' and 'message' keys
@@ -642,22 +2389,23 @@ def request_order_cancellation(order_id):
         initialize_firebase()
         
         # First, find which seller this order belongs to
-        sellers_ref = db.reference('sellers')
-        all_sellers = sellers_ref.get() or {}
+        if seller_id:
+            candidate_sellers = [sanitize_email_for_firebase(seller_id)]
+        else:
+            candidate_sellers = list(lookup_order_sellers(order_id, buyer_phone).keys())
         
         seller_id_found = None
         order_found = None
         
-        # Search through all sellers to find the order
-        for seller_id, seller_data in all_sellers.items():
-            orders = seller_data.get('orders', [])
-            for order in orders:
-                if order.get('order_id') == order_id or order.get('id') == order_id:
-                    seller_id_found = seller_id
-                    order_found = order
-                    break
-            if order_found:
-                break
+        for candidate in candidate_sellers:
+            _, order = _find_order(candidate, order_id)
+            if not order:
+                continue
+            if buyer_phone and order.get('buyer_phone') and str(order.get('buyer_phone')) != str(buyer_phone):
+                continue
+            seller_id_found = candidate
+            order_found = order
+            break
         
         if not order_found:
             print(f"⚠️ Order {order_id} not found")
@@ -666,22 +2414,22 @@ def request_order_cancellation(order_id):
                 'message': f'Order with ID {order_id} not found'
             }
         
-        # Add order ID to seller's cancellation list
-        cancellation_ref = db.reference(f'sellers/{seller_id_found}/cancellation')
-        cancellation_order_ids = cancellation_ref.get() or []
+        # Add the order's summary to the seller's pending set; the conditional
+        # write only succeeds if no request for this order is pending yet
+        cancellation_ref = _ref(_cancellation_path(seller_id_found, order_id))
+        already_requested = order_id in _legacy_cancellation_ids(seller_id_found)
+        if not already_requested:
+            created, _, _ = cancellation_ref.set_if_unchanged(NULL_ETAG, _cancellation_summary(order_found))
+            already_requested = not created
         
         # Check if already requested
-        if order_id in cancellation_order_ids:
+        if already_requested:
             return {
                 'success': True,
                 'message': f'Cancellation for order #{order_id} has already been requested',
                 'already_requested': True
             }
         
-        # Add to cancellation list
-        cancellation_order_ids.append(order_id)
-        cancellation_ref.set(cancellation_order_ids)
-        
         print(f"✅ Cancellation requested for order {order_id}, seller {seller_id_found}")
         return {
             'success': True,
@@ -700,11 +2448,70 @@ def request_order_cancellation(order_id):
 
 
 # ==================== CONVERSATION HISTORY ====================
+# Each buyer's conversation is an append-only log of push-keyed messages.
+# Reads use an indexed timestamp query (see database.rules.json) and the log is
+# trimmed back to CONVERSATION_HISTORY_LIMIT once every CONVERSATION_TRIM_EVERY
+# appends, so a normal message costs a single write.
+
+CONVERSATION_HISTORY_LIMIT = int(os.environ.get('CONVERSATION_HISTORY_LIMIT', '10'))
+CONVERSATION_TRIM_EVERY = max(1, int(os.environ.get('CONVERSATION_TRIM_EVERY', '10')))
+
+_conv_append_counts = {}
+_conv_append_lock = threading.Lock()
+
+
+def _conversation_path(seller_id, buyer_phone):
+    safe_seller_id = sanitize_email_for_firebase(seller_id)
+    safe_buyer_id = sanitize_email_for_firebase(buyer_phone)
+    return f'conversations/{safe_seller_id}/{safe_buyer_id}'
+
+
+def _legacy_conversation_path(seller_id, buyer_phone):
+    safe_seller_id = sanitize_email_for_firebase(seller_id)
+    safe_buyer_id = sanitize_email_for_firebase(buyer_phone)
+    return f'sellers/{safe_seller_id}/conv_history/{safe_buyer_id}'
+
+
+def trim_conversation_history(seller_id, buyer_phone, keep=None):
+    """
+    Delete the oldest messages of a conversation beyond the retention limit
+    
+    Args:
+        seller_id (str): Seller ID
+        buyer_phone (str): Buyer's phone number
+        keep (int): Messages to keep (default: CONVERSATION_HISTORY_LIMIT)
+        
+    Returns:
+        int: Number of messages removed (0 on error)
+    """
+    if keep is None:
+        keep = CONVERSATION_HISTORY_LIMIT
+    try:
+        initialize_firebase()
+        path = _conversation_path(seller_id, buyer_phone)
+        conv_ref = _ref(path)
+        
+        # Count with a shallow read so message bodies are not downloaded
+        message_ids = conv_ref.get(shallow=True) or {}
+        excess = len(message_ids) - keep
+        if excess <= 0:
+            return 0
+        
+        oldest = conv_ref.order_by_child('timestamp').limit_to_first(excess).get() or {}
+        if oldest:
+            _ref().update({f'{path}/{msg_id}': None for msg_id in oldest})
+        return len(oldest)
+        
+    except Exception as e:
+        print(f"❌ Error trimming conversation history: {e}")
+        return 0
+
 
 def save_conversation_message(seller_id, buyer_phone, role, content):
     """
     Save a conversation message to Firebase
-    Keeps only last 10 messages per buyer
+    Appends under a push key; old messages are trimmed periodically to
+    CONVERSATION_HISTORY_LIMIT per buyer
     
     Args:
         seller_id (str): Seller ID
@@ -717,37 +2524,21 @@ def save_conversation_message(seller_id, buyer_phone, role, content):
     """
     try:
         initialize_firebase()
-        safe_seller_id = sanitize_email_for_firebase(seller_id)
-        safe_buyer_id = sanitize_email_for_firebase(buyer_phone)
-        
-        # Reference to conversation history
-        conv_ref = db.reference(f'sellers/{safe_seller_id}/conv_history/{safe_buyer_id}')
-        
-        # Get existing messages
-        existing_messages = conv_ref.get() or {}
-        
-        # Create new message
-        import time
-        timestamp = int(time.time() * 1000)  # milliseconds
-        message_id = f"msg_{timestamp}"
+        path = _conversation_path(seller_id, buyer_phone)
         
         new_message = {
-            "timestamp": timestamp,
+            "timestamp": int(time.time() * 1000),  # milliseconds
             "role": role,
             "content": content
         }
+        _ref(path).push(new_message)
         
-        # Add new message
-        existing_messages[message_id] = new_message
-        
-        # Keep only last 10 messages
-        sorted_messages = sorted(existing_messages.items(), key=lambda x: x[1]['timestamp'])
-        if len(sorted_messages) > 10:
-            sorted_messages = sorted_messages[-10:]
-        
-        # Save back to Firebase
-        trimmed_messages = {msg_id: msg_data for msg_id, msg_data in sorted_messages}
-        conv_ref.set(trimmed_messages)
+        # Amortized trim: one cleanup every CONVERSATION_TRIM_EVERY appends
+        with _conv_append_lock:
+            count = _conv_append_counts.get(path, 0) + 1
+            _conv_append_counts[path] = count % CONVERSATION_TRIM_EVERY
+        if count >= CONVERSATION_TRIM_EVERY:
+            trim_conversation_history(seller_id, buyer_phone)
         
         print(f"✅ Saved {role} message to Firebase for {buyer_phone}")
         return True
@@ -771,25 +2562,24 @@ def get_conversation_history(seller_id, buyer_phone, limit=10):
     """
     try:
         initialize_firebase()
-        safe_seller_id = sanitize_email_for_firebase(seller_id)
-        safe_buyer_id = sanitize_email_for_firebase(buyer_phone)
-        
-        # Reference to conversation history
-        conv_ref = db.reference(f'sellers/{safe_seller_id}/conv_history/{safe_buyer_id}')
+        conv_ref = _ref(_conversation_path(seller_id, buyer_phone))
         
-        # Get all messages
-        all_messages = conv_ref.get() or {}
+        # Server-side ordering and limit; the result comes back in timestamp order
+        recent_messages = list((conv_ref.order_by_child('timestamp').limit_to_last(limit).get() or {}).values())
         
-        if not all_messages:
-            return []
-        
-        # Sort by timestamp and limit
-        sorted_messages = sorted(all_messages.items(), key=lambda x: x[1]['timestamp'])
-        sorted_messages = sorted_messages[-limit:]
+        if COLD_DATA_DUAL_READ and len(recent_messages) < limit:
+            # Include messages still stored under the seller node (not migrated yet)
+            legacy_ref = _ref(_legacy_conversation_path(seller_id, buyer_phone))
+            legacy_messages = legacy_ref.order_by_child('timestamp').limit_to_last(limit).get() or {}
+            if legacy_messages:
+                recent_messages = sorted(
+                    list(legacy_messages.values()) + recent_messages,
+                    key=lambda msg: msg.get('timestamp', 0)
+                )[-limit:]
         
         # Format for agent
         messages = []
-        for msg_id, msg_data in sorted_messages:
+        for msg_data in recent_messages:
             messages.append({
                 "role": msg_data["role"],
                 "content": msg_data["content"],
@@ -817,12 +2607,11 @@ def clear_conversation_history(seller_id, buyer_phone):
     """
     try:
         initialize_firebase()
-        safe_seller_id = sanitize_email_for_firebase(seller_id)
-        safe_buyer_id = sanitize_email_for_firebase(buyer_phone)
-        
-        # Reference to conversation history
-        conv_ref = db.reference(f'sellers/{safe_seller_id}/conv_history/{safe_buyer_id}')
-        conv_ref.delete()
+        # Remove the conversation from both the current and the legacy location
+        _ref().update({
+            _conversation_path(seller_id, buyer_phone): None,
+            _legacy_conversation_path(seller_id, buyer_phone): None
+        })
         
         print(f"✅ Cleared conversation history for {buyer_phone}")
         return True
@@ -836,7 +2625,7 @@ def clear_conversation_history(seller_id, buyer_phone):
 
 def get_agent_memory_ref():
     """Get reference to agent_memory node in Firebase"""
-    return db.reference('agent_memory')
+    return _ref('agent_memory')
 
 
 def save_agent_memory(phone_number, memory_data):
@@ -852,7 +2641,7 @@ def save_agent_memory(phone_number, memory_data):
     """
     try:
         initialize_firebase()
-        memory_ref = db.reference(f'agent_memory/{phone_number}')
+        memory_ref = _ref(f'agent_memory/{phone_number}')
         memory_ref.set(memory_data)
         return True
     except Exception as e:
@@ -872,7 +2661,7 @@ def load_agent_memory(phone_number):
     """
     try:
         initialize_firebase()
-        memory_ref = db.reference(f'agent_memory/{phone_number}')
+        memory_ref = _ref(f'agent_memory/{phone_number}')
         return memory_ref.get()
     except Exception as e:
         print(f"Error loading agent memory from Firebase: {e}")
@@ -883,7 +2672,7 @@ def clear_agent_memory(phone_number):
     """Clear agent memory for a specific buyer"""
     try:
         initialize_firebase()
-        memory_ref = db.reference(f'agent_memory/{phone_number}')
+        memory_ref = _ref(f'agent_memory/{phone_number}')
         memory_ref.delete()
         return True
     except Exception as e:
@@ -968,7 +2757,7 @@ def is_message_processed(msg_id):
         # Sanitize message ID to make it Firebase-compatible
         # Replace special characters that Firebase doesn't allow: . $ # [ ] /
         safe_msg_id = msg_id.replace('.', '_').replace('$', '_').replace('#', '_').replace('[', '_').replace(']', '_').replace('/', '_')
-        msg_ref = db.reference(f'processed_msgs/{safe_msg_id}')
+        msg_ref = _ref(f'processed_msgs/{safe_msg_id}')
         value = msg_ref.get()
         
         if value is True:
@@ -996,7 +2785,7 @@ def mark_message_as_processed(msg_id):
         # Sanitize message ID to make it Firebase-compatible
         # Replace special characters that Firebase doesn't allow: . $ # [ ] /
         safe_msg_id = msg_id.replace('.', '_').replace('$', '_').replace('#', '_').replace('[', '_').replace(']', '_').replace('/', '_')
-        msg_ref = db.reference(f'processed_msgs/{safe_msg_id}')
+        msg_ref = _ref(f'processed_msgs/{safe_msg_id}')
         msg_ref.set(True)
         print(f"✅ Message {msg_id} marked as processed")
         return True
@@ -1005,6 +2794,117 @@ def mark_message_as_processed(msg_id):
         return False
 
 
+# Claims live in date buckets msg_dedup/<YYYY-MM-DD>/<msg_id>, chosen from the
+# message's own timestamp so every redelivery of a message hits the same bucket.
+# Buckets older than MESSAGE_DEDUP_RETENTION_DAYS are dropped with one delete
+# each, at most once a day per process.
+
+MESSAGE_DEDUP_LRU_SIZE = int(os.environ.get('MESSAGE_DEDUP_LRU_SIZE', '10000'))
+MESSAGE_DEDUP_RETENTION_DAYS = int(os.environ.get('MESSAGE_DEDUP_RETENTION_DAYS', '2'))
+
+_claimed_msgs = OrderedDict()
+_claimed_msgs_lock = threading.Lock()
+_dedup_last_expiry_day = None
+
+
+def _safe_msg_id(msg_id):
+    # Replace special characters that Firebase doesn't allow: . $ # [ ] /
+    return msg_id.replace('.', '_').replace('$', '_').replace('#', '_').replace('[', '_').replace(']', '_').replace('/', '_')
+
+
+def _dedup_bucket(msg_timestamp=None):
+    """Date bucket (UTC) for a message's unix timestamp, or for now if unknown"""
+    try:
+        seconds = float(msg_timestamp)
+    except (TypeError, ValueError):
+        seconds = time.time()
+    return datetime.fromtimestamp(seconds, timezone.utc).strftime('%Y-%m-%d')
+
+
+def _remember_claim(msg_id):
+    """Record a message ID in the local LRU; returns False if it was already there"""
+    with _claimed_msgs_lock:
+        if msg_id in _claimed_msgs:
+            _claimed_msgs.move_to_end(msg_id)
+            return False
+        _claimed_msgs[msg_id] = True
+        while len(_claimed_msgs) > MESSAGE_DEDUP_LRU_SIZE:
+            _claimed_msgs.popitem(last=False)
+        return True
+
+
+def claim_message(msg_id, msg_timestamp=None):
+    """
+    Atomically claim a WhatsApp message for processing.
+    Redeliveries seen by this process are rejected from a local LRU without a
+    network call; otherwise the claim is a single conditional write that only
+    succeeds if no other worker has claimed the message.
+    
+    Args:
+        msg_id (str): WhatsApp message ID
+        msg_timestamp (str|int): Message's unix timestamp from the webhook payload
+        
+    Returns:
+        bool: True if this caller should process the message, False if it is a duplicate
+    """
+    if not msg_id:
+        return True
+    if not _remember_claim(msg_id):
+        print(f"⚠️ Message {msg_id} already processed - skipping (local)")
+        return False
+    
+    try:
+        initialize_firebase()
+        _maybe_expire_dedup_buckets()
+        bucket = _dedup_bucket(msg_timestamp)
+        msg_ref = _ref(f'msg_dedup/{bucket}/{_safe_msg_id(msg_id)}')
+        claimed, _, _ = msg_ref.set_if_unchanged(NULL_ETAG, int(time.time() * 1000))
+        
+        if not claimed:
+            print(f"⚠️ Message {msg_id} already processed - skipping (deduplication)")
+        return claimed
+    except Exception as e:
+        print(f"❌ Error claiming message: {e}")
+        # If the claim fails, process the message rather than risk dropping it
+        return True
+
+
+def expire_message_dedup_buckets(retention_days=None):
+    """
+    Delete dedup buckets older than the retention window
+    
+    Args:
+        retention_days (int): Days of buckets to keep (default: MESSAGE_DEDUP_RETENTION_DAYS)
+        
+    Returns:
+        int: Number of buckets removed (0 on error)
+    """
+    if retention_days is None:
+        retention_days = MESSAGE_DEDUP_RETENTION_DAYS
+    try:
+        initialize_firebase()
+        cutoff = _dedup_bucket(time.time() - retention_days * 86400)
+        buckets = _ref('msg_dedup').get(shallow=True) or {}
+        expired = [bucket for bucket in buckets if bucket < cutoff]
+        if expired:
+            _ref().update({f'msg_dedup/{bucket}': None for bucket in expired})
+            print(f"✅ Expired {len(expired)} message dedup buckets")
+        return len(expired)
+    except Exception as e:
+        print(f"❌ Error expiring message dedup buckets: {e}")
+        return 0
+
+
+def _maybe_expire_dedup_buckets():
+    """Run bucket expiry at most once per day in this process"""
+    global _dedup_last_expiry_day
+    today = _dedup_bucket()
+    if _dedup_last_expiry_day == today:
+        return
+    _dedup_last_expiry_day = today
+    expire_message_dedup_buckets()
+
+
 # ==================== MIGRATION UTILITIES ====================
 
 def migrate_json_to_firebase():
@@ -1036,6 +2936,113 @@ def migrate_json_to_firebase():
         return False
 
 
+def migrate_all_sellers_orders_to_v2():
+    """
+    Migrate every seller still on the positional orders list to the v2 keyed layout.
+    Seller IDs are listed with a shallow read so no order data is downloaded up front.
+    
+    Returns:
+        dict: {'migrated': int, 'failed': list of seller IDs}
+    """
+    result = {'migrated': 0, 'failed': []}
+    try:
+        initialize_firebase()
+        seller_ids = _ref('sellers').get(shallow=True) or {}
+    except Exception as e:
+        print(f"Error listing sellers for order migration: {e}")
+        return result
+    
+    for safe_seller_id in seller_ids:
+        if get_order_layout(safe_seller_id) == ORDER_LAYOUT_V2:
+            continue
+        if migrate_orders_to_v2(safe_seller_id):
+            result['migrated'] += 1
+        else:
+            result['failed'].append(safe_seller_id)
+    
+    print(f"✓ Migrated orders for {result['migrated']} sellers ({len(result['failed'])} failed)")
+    return result
+
+
+
+def migrate_seller_cold_data(seller_id, dry_run=False):
+    """
+    Move a seller's conversations and credentials out of sellers/<id> into
+    their own roots. Copies and legacy deletes go out in one multi-path update,
+    so a seller is never left half-migrated.
+    
+    Args:
+        seller_id (str): Seller ID
+        dry_run (bool): Only report what would move
+        
+    Returns:
+        dict: {'conversations': int, 'credentials': list of kinds} or None on error
+    """
+    try:
+        initialize_firebase()
+        safe_seller_id = sanitize_email_for_firebase(seller_id)
+        seller_path = f'sellers/{safe_seller_id}'
+        updates = {}
+        summary = {'conversations': 0, 'credentials': []}
+        
+        conversations = _ref(f'{seller_path}/conv_history').get() or {}
+        for safe_buyer_id, messages in conversations.items():
+            if not isinstance(messages, dict):
+                continue
+            for msg_id, message in messages.items():
+                updates[f'conversations/{safe_seller_id}/{safe_buyer_id}/{msg_id}'] = message
+            summary['conversations'] += 1
+        if conversations:
+            updates[f'{seller_path}/conv_history'] = None
+        
+        for kind in _LEGACY_CREDENTIAL_FIELDS:
+            creds = _ref(_legacy_credentials_path(safe_seller_id, kind)).get()
+            if creds is None:
+                continue
+            # Credentials already written to the new root win over the legacy copy
+            if _ref(_credentials_path(safe_seller_id, kind)).get() is None:
+                updates[_credentials_path(safe_seller_id, kind)] = creds
+            updates[_legacy_credentials_path(safe_seller_id, kind)] = None
+            if kind == 'whatsapp' and isinstance(creds, dict) and creds.get('verify_token'):
+                updates[f'verify_tokens/{_verify_token_key(creds["verify_token"])}'] = safe_seller_id
+            summary['credentials'].append(kind)
+        
+        if updates and not dry_run:
+            _ref().update(updates)
+        
+        print(f"{'Would move' if dry_run else '✅ Moved'} {summary['conversations']} conversations and "
+              f"{summary['credentials'] or 'no'} credentials for seller {seller_id}")
+        return summary
+    except Exception as e:
+        print(f"❌ Error migrating cold data for seller {seller_id}: {e}")
+        return None
+
+
+def backfill_all_order_indexes():
+    """
+    Build order_index entries for every seller's existing orders.
+    Needed once for sellers whose orders were written before the index existed.
+    
+    Returns:
+        dict: {'indexed': int, 'failed': list of seller IDs}
+    """
+    result = {'indexed': 0, 'failed': []}
+    try:
+        initialize_firebase()
+        seller_ids = _ref('sellers').get(shallow=True) or {}
+    except Exception as e:
+        print(f"Error listing sellers for order index backfill: {e}")
+        return result
+    
+    for safe_seller_id in seller_ids:
+        if backfill_order_index(safe_seller_id):
+            result['indexed'] += 1
+        else:
+            result['failed'].append(safe_seller_id)
+    
+    print(f"✓ Indexed orders for {result['indexed']} sellers ({len(result['failed'])} failed)")
+    return result
+
 # ==================== WHATSAPP CREDENTIALS MANAGEMENT ====================
 
 def save_whatsapp_credentials(seller_id, phone_number_id, business_account_id, access_token, verify_token):
@@ -1056,18 +3063,35 @@ def save_whatsapp_credentials(seller_id, phone_number_id, business_account_id, a
         initialize_firebase()
         safe_seller_id = sanitize_email_for_firebase(seller_id)
         
-        # Save credentials under seller's what_creds
-        creds_ref = db.reference(f'sellers/{safe_seller_id}/what_creds')
-        creds_ref.set({
+        creds = {
             'phone_number_id': phone_number_id,
             'business_account_id': business_account_id,
             'access_token': access_token,
             'verify_token': verify_token
-        })
+        }
         
-        # Save phone number ID to seller mapping
-        numbers_ref = db.reference(f'numbers/{phone_number_id}')
-        numbers_ref.set(safe_seller_id)
+        # Mappings for the seller's previous number and token are removed in the same write
+        previous = _read_credentials(safe_seller_id, 'whatsapp') or {}
+        mappings = {}
+        previous_phone_id = previous.get('phone_number_id')
+        if previous_phone_id and previous_phone_id != phone_number_id:
+            mappings[f'numbers/{previous_phone_id}'] = None
+        previous_token = previous.get('verify_token')
+        if previous_token and previous_token != verify_token:
+            mappings[f'verify_tokens/{_verify_token_key(previous_token)}'] = None
+            mappings[f'verify_tokens/{_safe_key(previous_token)}'] = None
+        
+        # Credentials, phone number ID -> seller and verify token -> seller mappings in one write
+        mappings[f'numbers/{phone_number_id}'] = safe_seller_id
+        if verify_token:
+            mappings[f'verify_tokens/{_verify_token_key(verify_token)}'] = safe_seller_id
+        _write_credentials(safe_seller_id, 'whatsapp', creds, mappings)
+        _tenant_config.invalidate(
+            ('whatsapp', safe_seller_id),
+            ('phone', phone_number_id),
+            ('phone', previous_phone_id),
+            ('legacy_verify_tokens', None)
+        )
         
         print(f"✅ WhatsApp credentials saved for seller {seller_id}")
         return True
@@ -1089,9 +3113,10 @@ def get_whatsapp_credentials(seller_id):
     try:
         initialize_firebase()
         safe_seller_id = sanitize_email_for_firebase(seller_id)
-        creds_ref = db.reference(f'sellers/{safe_seller_id}/what_creds')
-        creds = creds_ref.get()
-        return creds
+        return _tenant_config.get(
+            ('whatsapp', safe_seller_id),
+            lambda: _read_credentials(safe_seller_id, 'whatsapp')
+        )
     except Exception as e:
         print(f"❌ Error getting WhatsApp credentials: {e}")
         return None
@@ -1111,17 +3136,25 @@ def delete_whatsapp_credentials(seller_id):
         initialize_firebase()
         safe_seller_id = sanitize_email_for_firebase(seller_id)
         
-        # First get the phone_number_id to delete the mapping
-        creds_ref = db.reference(f'sellers/{safe_seller_id}/what_creds')
-        creds = creds_ref.get()
+        # First get the phone_number_id and verify token to delete the mappings
+        creds = _read_credentials(safe_seller_id, 'whatsapp')
         
+        # Delete the credentials (both locations) and mappings together
+        updates = {
+            _credentials_path(safe_seller_id, 'whatsapp'): None,
+            _legacy_credentials_path(safe_seller_id, 'whatsapp'): None
+        }
         if creds and creds.get('phone_number_id'):
-            # Delete the phone number mapping
-            numbers_ref = db.reference(f'numbers/{creds["phone_number_id"]}')
-            numbers_ref.delete()
-        
-        # Delete the credentials
-        creds_ref.delete()
+            updates[f'numbers/{creds["phone_number_id"]}'] = None
+        if creds and creds.get('verify_token'):
+            updates[f'verify_tokens/{_verify_token_key(creds["verify_token"])}'] = None
+            updates[f'verify_tokens/{_safe_key(creds["verify_token"])}'] = None
+        _ref().update(updates)
+        _tenant_config.invalidate(
+            ('whatsapp', safe_seller_id),
+            ('phone', (creds or {}).get('phone_number_id')),
+            ('legacy_verify_tokens', None)
+        )
         
         print(f"✅ WhatsApp credentials deleted for seller {seller_id}")
         return True
@@ -1142,14 +3175,62 @@ def get_seller_by_phone_number_id(phone_number_id):
     """
     try:
         initialize_firebase()
-        numbers_ref = db.reference(f'numbers/{phone_number_id}')
-        seller_id = numbers_ref.get()
-        return seller_id
+        return _tenant_config.get(
+            ('phone', phone_number_id),
+            lambda: _ref(f'numbers/{phone_number_id}').get()
+        )
     except Exception as e:
         print(f"❌ Error getting seller by phone number ID: {e}")
         return None
 
 
+def get_seller_by_verify_token(token):
+    """
+    Get the seller that owns a webhook verify token
+    
+    Args:
+        token (str): Webhook verify token sent by Meta
+        
+    Returns:
+        str: Seller ID or None if not found
+    """
+    if not token:
+        return None
+    try:
+        initialize_firebase()
+        # Hashed mapping first, then the _safe_key mapping written before hashing;
+        # either one only counts if the seller's credentials hold this exact token
+        for key in (_verify_token_key(token), _safe_key(token)):
+            seller_id = _ref(f'verify_tokens/{key}').get()
+            if seller_id and _owns_verify_token(seller_id, token):
+                return seller_id
+        if not COLD_DATA_DUAL_READ:
+            return None
+        
+        # Unmigrated sellers: scan legacy credentials at most once per cache TTL
+        owners = _tenant_config.get(('legacy_verify_tokens', None), _scan_legacy_verify_tokens)
+        seller_id = owners.get(_verify_token_key(token))
+        return seller_id if seller_id and _owns_verify_token(seller_id, token) else None
+    except Exception as e:
+        print(f"❌ Error getting seller by verify token: {e}")
+        return None
+
+
+def _owns_verify_token(safe_seller_id, token):
+    creds = get_whatsapp_credentials(safe_seller_id)
+    return isinstance(creds, dict) and creds.get('verify_token') == token
+
+
+def _scan_legacy_verify_tokens():
+    """Map verify token hash -> seller for every seller still holding legacy WhatsApp credentials"""
+    owners = {}
+    for safe_seller_id in list_seller_ids():
+        legacy_token = _ref(f'{_legacy_credentials_path(safe_seller_id, "whatsapp")}/verify_token').get()
+        if legacy_token:
+            owners[_verify_token_key(legacy_token)] = safe_seller_id
+    return owners
+
+
 # ==================== CUSTOMER MANAGEMENT (Per-Seller) ====================
 
 def get_customer(seller_id, phone_number):
@@ -1168,7 +3249,7 @@ def get_customer(seller_id, phone_number):
         safe_seller_id = sanitize_email_for_firebase(seller_id)
         # Sanitize phone number for Firebase compatibility (+ is not allowed in keys)
         safe_phone = phone_number.replace('+', '_plus_') if phone_number else phone_number
-        customer_ref = db.reference(f'sellers/{safe_seller_id}/customers/{safe_phone}')
+        customer_ref = _ref(f'sellers/{safe_seller_id}/customers/{safe_phone}')
         return customer_ref.get()
     except Exception as e:
         print(f"❌ Error getting customer: {e}")
@@ -1192,7 +3273,7 @@ def update_customer(seller_id, phone_number, customer_data):
         safe_seller_id = sanitize_email_for_firebase(seller_id)
         # Sanitize phone number for Firebase compatibility (+ is not allowed in keys)
         safe_phone = phone_number.replace('+', '_plus_') if phone_number else phone_number
-        customer_ref = db.reference(f'sellers/{safe_seller_id}/customers/{safe_phone}')
+        customer_ref = _ref(f'sellers/{safe_seller_id}/customers/{safe_phone}')
         customer_ref.set(customer_data)
         print(f"✅ Customer {phone_number} updated for seller {seller_id}")
         return True
@@ -1217,7 +3298,7 @@ def get_customer_cart(seller_id, phone_number):
         safe_seller_id = sanitize_email_for_firebase(seller_id)
         # Sanitize phone number for Firebase compatibility
         safe_phone = phone_number.replace('+', '_plus_') if phone_number else phone_number
-        cart_ref = db.reference(f'sellers/{safe_seller_id}/customers/{safe_phone}/cart')
+        cart_ref = _ref(f'sellers/{safe_seller_id}/customers/{safe_phone}/cart')
         cart = cart_ref.get()
         return cart if cart else []
     except Exception as e:
@@ -1225,7 +3306,7 @@ def get_customer_cart(seller_id, phone_number):
         return []
 
 
-def update_customer_cart(seller_id, phone_number, cart):
+def update_customer_cart(seller_id, phone_number, cart, batch=None):
     """
     Update customer's cart for a specific seller
     
@@ -1233,44 +3314,56 @@ def update_customer_cart(seller_id, phone_number, cart):
         seller_id (str): Seller ID
         phone_number (str): Customer's phone number
         cart (list): Cart items
+        batch (WriteBatch): Optional batch to queue the write on instead of committing it
         
     Returns:
-        bool: True if successful, False otherwise
+        bool: True if successful (or queued), False otherwise
     """
     try:
-        initialize_firebase()
         safe_seller_id = sanitize_email_for_firebase(seller_id)
         # Sanitize phone number for Firebase compatibility
         safe_phone = phone_number.replace('+', '_plus_') if phone_number else phone_number
-        cart_ref = db.reference(f'sellers/{safe_seller_id}/customers/{safe_phone}/cart')
-        cart_ref.set(cart)
+        path = f'sellers/{safe_seller_id}/customers/{safe_phone}/cart'
+        if batch is not None:
+            batch.set(path, cart)
+            return True
+        initialize_firebase()
+        _ref(path).set(cart)
         return True
     except Exception as e:
         print(f"❌ Error updating customer cart: {e}")
         return False
 
 
-def add_customer_order_ref(seller_id, phone_number, order_ref):
+def customer_order_ref_path(safe_seller_id, phone_number, order_id):
+    """Get the path of a customer's reference to one of their orders"""
+    # Sanitize phone number for Firebase compatibility
+    safe_phone = phone_number.replace('+', '_plus_') if phone_number else phone_number
+    return f'sellers/{safe_seller_id}/customers/{safe_phone}/orders/{order_key(order_id)}'
+
+
+def add_customer_order_ref(seller_id, phone_number, order_ref, batch=None):
     """
-    Add order reference to customer's orders list
+    Add order reference to customer's orders.
+    Writes only the new child (keyed by order ID) rather than the whole list.
     
     Args:
         seller_id (str): Seller ID
         phone_number (str): Customer's phone number
         order_ref (dict): Order reference with seller_id and order_id
+        batch (WriteBatch): Optional batch to queue the write on instead of committing it
         
     Returns:
-        bool: True if successful, False otherwise
+        bool: True if successful (or queued), False otherwise
     """
     try:
-        initialize_firebase()
         safe_seller_id = sanitize_email_for_firebase(seller_id)
-        # Sanitize phone number for Firebase compatibility
-        safe_phone = phone_number.replace('+', '_plus_') if phone_number else phone_number
-        orders_ref = db.reference(f'sellers/{safe_seller_id}/customers/{safe_phone}/orders')
-        orders = orders_ref.get() or []
-        orders.append(order_ref)
-        orders_ref.set(orders)
+        path = customer_order_ref_path(safe_seller_id, phone_number, order_ref.get('order_id'))
+        if batch is not None:
+            batch.set(path, order_ref)
+            return True
+        initialize_firebase()
+        _ref(path).set(order_ref)
         print(f"✅ Order reference added to customer {phone_number}")
         return True
     except Exception as e:
@@ -1286,13 +3379,70 @@ if __name__ == "__main__":
     
     # Uncomment to migrate existing JSON data to Firebase
     # migrate_json_to_firebase()
+    
+    # Uncomment to move all sellers to the keyed (v2) orders layout and build the order index
+    # migrate_all_sellers_orders_to_v2()
+    # backfill_all_order_indexes()
 
 
 # ==================== CUSTOMER MANAGEMENT ====================
+# sellers/<id>/customers is a registry keyed by sanitized phone number; each
+# child is the customer's profile (see get_customer). Membership is a key
+# lookup and registering a customer writes a single child. Early sellers
+# stored a plain list of phone numbers here; migrate_customer_registry()
+# folds that shape into the map and get_customer_ids() does so on demand.
+
+def _customer_key(buyer_phone):
+    """Registry key for a phone number (+ is not allowed in Firebase keys)"""
+    return buyer_phone.replace('+', '_plus_') if buyer_phone else buyer_phone
+
+
+def _registry_from_legacy(customers):
+    """Convert a customers node holding list entries into the keyed registry"""
+    if isinstance(customers, list):
+        items = [(str(index), value) for index, value in enumerate(customers)]
+    elif isinstance(customers, dict):
+        items = list(customers.items())
+    else:
+        return customers
+    
+    registry = {}
+    legacy_phones = []
+    for key, value in items:
+        if isinstance(value, dict):
+            registry[key] = value
+        elif value:
+            legacy_phones.append(str(value))
+    for phone in legacy_phones:
+        registry.setdefault(_customer_key(phone), {}).setdefault('phone_number', phone)
+    return registry or None
+
+
+def migrate_customer_registry(seller_id):
+    """
+    Convert a seller's legacy customers list into the keyed registry.
+    Runs as a transaction so concurrent registrations are not lost.
+    
+    Args:
+        seller_id (str): Seller ID
+        
+    Returns:
+        bool: True if successful, False otherwise
+    """
+    try:
+        initialize_firebase()
+        safe_seller_id = sanitize_email_for_firebase(seller_id)
+        _ref(f'sellers/{safe_seller_id}/customers').transaction(_registry_from_legacy)
+        print(f"✅ Customer registry migrated for seller {seller_id}")
+        return True
+    except Exception as e:
+        print(f"❌ Error migrating customer registry for {seller_id}: {e}")
+        return False
+
 
 def add_customer_id(seller_id, buyer_phone):
     """
-    Add a buyer_phone to the customers list (if not already present)
+    Register a buyer_phone in the seller's customer registry (no-op if present)
     
     Args:
         seller_id (str): Seller ID
@@ -1305,18 +3455,9 @@ def add_customer_id(seller_id, buyer_phone):
         initialize_firebase()
         safe_seller_id = sanitize_email_for_firebase(seller_id)
         
-        # Reference to customers list
-        customers_ref = db.reference(f'sellers/{safe_seller_id}/customers')
-        customers = customers_ref.get() or []
-        
-        # Add buyer_phone if not already in list
-        if buyer_phone not in customers:
-            customers.append(buyer_phone)
-            customers_ref.set(customers)
-            print(f"✅ Added customer ID: {buyer_phone}")
-        else:
-            print(f"ℹ️ Customer ID already exists: {buyer_phone}")
-        
+        # Single child write; it leaves the rest of an existing profile untouched
+        _ref(f'sellers/{safe_seller_id}/customers/{_customer_key(buyer_phone)}/phone_number').set(buyer_phone)
+        print(f"✅ Added customer ID: {buyer_phone}")
         return True
     except Exception as e:
         print(f"❌ Error adding customer ID: {e}")
@@ -1325,7 +3466,7 @@ def add_customer_id(seller_id, buyer_phone):
 
 def get_customer_ids(seller_id):
     """
-    Get all customer IDs (buyer_phone list) for a seller
+    Get all customer IDs (buyer phones) for a seller
     
     Args:
         seller_id (str): Seller ID
@@ -1337,11 +3478,39 @@ def get_customer_ids(seller_id):
         initialize_firebase()
         safe_seller_id = sanitize_email_for_firebase(seller_id)
         
-        customers_ref = db.reference(f'sellers/{safe_seller_id}/customers')
-        customers = customers_ref.get() or []
+        # Keys only - profiles are not downloaded
+        customers_ref = _ref(f'sellers/{safe_seller_id}/customers')
+        keys = customers_ref.get(shallow=True) or {}
         
+        # Index 0 only exists in the legacy list shape (no phone number is "0")
+        if isinstance(keys, dict) and '0' in keys:
+            migrate_customer_registry(seller_id)
+            keys = customers_ref.get(shallow=True) or {}
+        
+        customers = [key.replace('_plus_', '+') for key in keys] if isinstance(keys, dict) else []
         print(f"✅ Retrieved {len(customers)} customer IDs")
         return customers
     except Exception as e:
         print(f"❌ Error getting customer IDs: {e}")
         return []
+
+
+def migrate_all_customer_registries():
+    """
+    Convert every seller still holding a legacy customers list.
+    
+    Returns:
+        dict: {'migrated': int, 'failed': list of seller IDs}
+    """
+    result = {'migrated': 0, 'failed': []}
+    for safe_seller_id in list_seller_ids():
+        keys = _ref(f'sellers/{safe_seller_id}/customers').get(shallow=True) or {}
+        if not isinstance(keys, dict) or '0' not in keys:
+            continue
+        if migrate_customer_registry(safe_seller_id):
+            result['migrated'] += 1
+        else:
+            result['failed'].append(safe_seller_id)
+    
+    print(f"✓ Migrated customer registries for {result['migrated']} sellers ({len(result['failed'])} failed)")
+    return result
@@ -0,0 +1,20 @@
+import api from './axios';
+
+// /api/orders returns one page at a time; the server caps a page at ORDER_PAGE_MAX
+const ALL_ORDERS_PAGE_SIZE = 200;
+
+// Every order for the signed-in seller, newest first, following next_cursor
+// until it runs out. For totals that need each order (revenue, per-customer
+// counts); lists should page with /api/orders directly.
+export async function fetchAllOrders(params = {}) {
+    const orders = [];
+    let cursor = null;
+    do {
+        const response = await api.get('/orders', {
+            params: { ...params, limit: ALL_ORDERS_PAGE_SIZE, ...(cursor ? { cursor } : {}) }
+        });
+        orders.push(...(response.data.orders || []));
+        cursor = response.data.next_cursor || null;
+    } while (cursor);
+    return orders;
+}
@@ -26,7 +26,8 @@ export function TopBar() {
 
     const fetchRecentOrders = async () => {
         try {
-            const res = await api.get('/orders');
+            // Pages come newest first, so the five most recent are one small page
+            const res = await api.get('/orders', { params: { limit: 5 } });
             const orders = (res.data.orders || []).slice(0, 5);
             setRecentOrders(orders);
         } catch (error) {
@@ -1,6 +1,7 @@
 import React, { useEffect, useState } from 'react';
 import { User, Phone, ShoppingBag, Calendar, X, Clock, CheckCircle, Truck, XCircle, MessageCircle, Send, RefreshCw } from 'lucide-react';
 import api from '../api/axios';
+import { fetchAllOrders } from '../api/orders';
 import { motion, AnimatePresence } from 'framer-motion';
 import { cn } from '../lib/utils';
 import { useToast } from '../hooks/useToast';
@@ -103,11 +104,12 @@ export default function Customers() {
         // --- Fallback path ---
         const fetchData = async () => {
             try {
-                const [customersRes, ordersRes] = await Promise.all([
+                // Per-customer order counts need every order, not the first page
+                const [customersRes, orders] = await Promise.all([
                     api.get('/customers'),
-                    api.get('/orders')
+                    fetchAllOrders()
                 ]);
-                buildCustomerList(customersRes.data.customers || {}, ordersRes.data.orders || []);
+                buildCustomerList(customersRes.data.customers || {}, orders);
             } catch (err) {
                 console.error('Error fetching customers data:', err);
                 setLoading(false);
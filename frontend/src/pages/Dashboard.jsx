@@ -2,6 +2,7 @@ import React, { useEffect, useState } from 'react';
 import { motion, AnimatePresence } from 'framer-motion';
 import { TrendingUp, Users, ShoppingBag, DollarSign, ArrowUpRight, ArrowDownRight, MessageSquare, Power, X, Sparkles, Activity, Zap, Link2 } from 'lucide-react';
 import api from '../api/axios';
+import { fetchAllOrders } from '../api/orders';
 import { cn } from '../lib/utils';
 import { staggerContainer, staggerItem, fadeInUp } from '../lib/motion';
 import { LineChart, Line, XAxis, YAxis, CartesianGrid, Tooltip, ResponsiveContainer, AreaChart, Area } from 'recharts';
@@ -345,15 +346,16 @@ export default function Dashboard() {
         // --- Fallback path (API) when Firebase auth is not ready ---
         const fetchData = async () => {
             try {
-                const [ordersRes, productsRes] = await Promise.all([
-                    api.get('/orders'),
+                // Totals and the revenue chart need every order, not the first page
+                const [orders, productsRes] = await Promise.all([
+                    fetchAllOrders(),
                     api.get('/products')
                 ]);
                 const dashboardData = {
-                    orders: ordersRes.data.orders || [],
+                    orders,
                     products: productsRes.data.products || []
                 };
-                const customerIds = [...new Set((ordersRes.data.orders || []).map(o => o.buyer_phone).filter(Boolean))];
+                const customerIds = [...new Set(orders.map(o => o.buyer_phone).filter(Boolean))];
                 processDashboardData(dashboardData, customerIds);
                 setLoading(false);
             } catch (error) {
@@ -1,4 +1,4 @@
-import React, { useEffect, useState } from 'react';
+import React, { useEffect, useRef, useState } from 'react';
 import { Search, Filter, ChevronDown, CheckCircle, Clock, Truck, XCircle, MoreHorizontal, CreditCard, Loader2, MapPin, X, Package, Calendar, User } from 'lucide-react';
 import api from '../api/axios';
 import { cn } from '../lib/utils';
@@ -7,11 +7,14 @@ import { staggerContainer, tableRowVariants } from '../lib/motion';
 import { ToastContainer } from '../components/Toast';
 import { useToast } from '../hooks/useToast';
 import { database } from '../firebase/config';
-import { ref, onValue } from 'firebase/database';
+import { ref, onValue, query, orderByChild, limitToLast } from 'firebase/database';
 import { EmptyOrders } from '../components/EmptyStates';
 import { SkeletonTable } from '../components/Skeleton';
 import { useFirebaseAuth } from '../contexts/FirebaseAuthContext';
 
+// Orders fetched per page from /api/orders (newest first)
+const PAGE_SIZE = 50;
+
 const StatusBadge = ({ status }) => {
     const styles = {
         'Received': 'bg-gradient-to-r from-yellow-500/20 to-amber-500/10 text-yellow-400 border-yellow-500/30 shadow-[0_0_10px_-3px_rgba(234,179,8,0.3)]',
@@ -69,6 +72,11 @@ export default function Orders() {
     const [orders, setOrders] = useState([]);
     const [filteredOrders, setFilteredOrders] = useState([]);
     const [loading, setLoading] = useState(true);
+    const [nextCursor, setNextCursor] = useState(null);
+    const [loadingMore, setLoadingMore] = useState(false);
+    const [orderTotal, setOrderTotal] = useState(null);
+    // Bumped on every filter change so responses for older filters are dropped
+    const filterGeneration = useRef(0);
     const [statusFilter, setStatusFilter] = useState('All');
     const [paymentFilter, setPaymentFilter] = useState('All');
     const [sortBy, setSortBy] = useState('newest'); // newest, oldest, highest, lowest
@@ -110,50 +118,99 @@ export default function Orders() {
         fetchSellerInfo();
     }, []);
 
-    useEffect(() => {
-        if (!sellerId) return;
+    const fetchOrdersPage = async (cursor = null) => {
+        const params = { limit: PAGE_SIZE };
+        if (statusFilter !== 'All') params.status = statusFilter;
+        if (paymentFilter !== 'All') params.payment_status = paymentFilter;
+        if (cursor) params.cursor = cursor;
+        const generation = filterGeneration.current;
+
+        const response = await api.get('/orders', { params });
+        if (generation !== filterGeneration.current) return;
+        const page = response.data.orders || [];
+        setOrders(prev => {
+            if (!cursor) return page;
+            const seen = new Set(prev.map(o => o.order_id));
+            return [...prev, ...page.filter(o => !seen.has(o.order_id))];
+        });
+        setNextCursor(response.data.next_cursor || null);
+        setOrderTotal(response.data.total ?? null);
+    };
 
-        const sanitizeEmail = (email) =>
-            email.replace(/\./g, '_dot_').replace(/@/g, '_at_').replace(/\//g, '_slash_');
+    const loadMoreOrders = async () => {
+        if (!nextCursor || loadingMore) return;
+        setLoadingMore(true);
+        try {
+            await fetchOrdersPage(nextCursor);
+        } catch (err) {
+            console.error('Error fetching more orders:', err);
+        } finally {
+            setLoadingMore(false);
+        }
+    };
 
+    useEffect(() => {
+        if (!sellerId) return;
         fetchCompanyInfo();
         fetchRazorpayStatus();
+    }, [sellerId]);
 
-        // --- Real-time path ---
-        if (firebaseReady) {
-            const sellerIdSafe = sanitizeEmail(sellerId);
-            const ordersRef = ref(database, `sellers/${sellerIdSafe}/orders`);
+    // First page from the server whenever the filters change
+    useEffect(() => {
+        if (!sellerId) return;
 
-            const unsubscribe = onValue(ordersRef, (snapshot) => {
-                const data = snapshot.val();
-                if (data) {
-                    const ordersArray = Array.isArray(data) ? data : Object.values(data);
-                    setOrders(ordersArray.filter(Boolean));
-                } else {
-                    setOrders([]);
-                }
-                setLoading(false);
-            }, (error) => {
-                console.error('Firebase orders error:', error);
-                setLoading(false);
+        const generation = ++filterGeneration.current;
+        setNextCursor(null);
+        setLoading(true);
+        fetchOrdersPage()
+            .catch(err => console.error('Error fetching orders:', err))
+            .finally(() => {
+                if (generation === filterGeneration.current) setLoading(false);
             });
+    }, [sellerId, statusFilter, paymentFilter]);
 
-            return () => unsubscribe();
-        }
+    // Live updates for the newest page only, merged into the loaded pages
+    useEffect(() => {
+        if (!sellerId || !firebaseReady) return;
 
-        // --- Fallback path ---
-        const fetchOrders = async () => {
-            try {
-                const response = await api.get('/orders');
-                setOrders(response.data.orders || []);
-                setLoading(false);
-            } catch (error) {
-                console.error('Error fetching orders:', error);
-                setLoading(false);
-            }
-        };
-        fetchOrders();
-    }, [sellerId, firebaseReady]);
+        const sanitizeEmail = (email) =>
+            email.replace(/\./g, '_dot_').replace(/@/g, '_at_').replace(/\//g, '_slash_');
+
+        const sellerIdSafe = sanitizeEmail(sellerId);
+        const recentOrdersQuery = query(
+            ref(database, `sellers/${sellerIdSafe}/orders`),
+            orderByChild('idx_created'),
+            limitToLast(PAGE_SIZE)
+        );
+
+        const unsubscribe = onValue(recentOrdersQuery, (snapshot) => {
+            const recent = Object.values(snapshot.val() || {}).filter(Boolean);
+            // The snapshot holds every order from its oldest idx_created onwards
+            // (all of them if it is not full or reaches orders without one, which
+            // sort first); loaded orders in that range missing from it were deleted
+            const covered = recent.map(o => o.idx_created);
+            const oldest = recent.length < PAGE_SIZE || covered.some(value => !value)
+                ? ''
+                : covered.reduce((min, value) => (value < min ? value : min));
+            const recentIds = new Set(recent.map(o => o.order_id));
+            setOrders(prev => {
+                const byId = new Map(prev
+                    .filter(o => recentIds.has(o.order_id) || !o.idx_created || o.idx_created < oldest)
+                    .map(o => [o.order_id, o]));
+                recent.forEach(order => {
+                    const matches = (statusFilter === 'All' || order.order_status === statusFilter) &&
+                        (paymentFilter === 'All' || order.payment_status === paymentFilter);
+                    if (byId.has(order.order_id) || matches) {
+                        byId.set(order.order_id, order);
+                    }
+                });
+                return Array.from(byId.values());
+            });
+        }, (error) => {
+            console.error('Firebase orders error:', error);
+        });
+        return () => unsubscribe();
+    }, [sellerId, firebaseReady, statusFilter, paymentFilter]);
 
     useEffect(() => {
         filterAndSortOrders();
@@ -752,6 +809,23 @@ Thank you! 🙏`;
                         </table>
                     </div>
                 )}
+                {!loading && (nextCursor || orderTotal !== null) && (
+                    <div className="flex items-center justify-between px-4 py-3 border-t border-slate-800/60 text-sm text-slate-500">
+                        <span>
+                            Showing {filteredOrders.length}{orderTotal !== null ? ` of ${orderTotal}` : ''} orders
+                        </span>
+                        {nextCursor && (
+                            <button
+                                onClick={loadMoreOrders}
+                                disabled={loadingMore}
+                                className="flex items-center gap-2 px-4 py-2 text-slate-300 hover:text-white hover:bg-slate-800 rounded-xl transition-colors disabled:opacity-50"
+                            >
+                                {loadingMore && <Loader2 className="w-4 h-4 animate-spin" />}
+                                Load more
+                            </button>
+                        )}
+                    </div>
+                )}
             </motion.div>
 
             {/* Message Preview Modal */}
@@ -1,6 +1,7 @@
 import React, { useEffect, useState } from 'react';
 import { CreditCard, Wallet, AlertCircle, CheckCircle, Clock } from 'lucide-react';
 import api from '../api/axios';
+import { fetchAllOrders } from '../api/orders';
 import { motion } from 'framer-motion';
 import { database } from '../firebase/config';
 import { ref, onValue } from 'firebase/database';
@@ -90,8 +91,8 @@ export default function Payments() {
         // --- Fallback path ---
         const fetchPayments = async () => {
             try {
-                const response = await api.get('/orders');
-                computeStats(response.data.orders || []);
+                // Collected and pending totals need every order, not the first page
+                computeStats(await fetchAllOrders());
             } catch (error) {
                 console.error('Error fetching orders:', error);
                 setLoading(false);
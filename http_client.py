@@ -0,0 +1,156 @@
+"""
+HTTP Client
+Shared, pooled requests sessions for outbound API traffic (WhatsApp Graph API
+and media downloads). Reusing one session keeps TLS connections alive across
+calls instead of handshaking with graph.facebook.com on every reply.
+"""
+
+from dotenv import load_dotenv
+load_dotenv()
+import os
+import socket
+import threading
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import resilience
+
+
+HTTP_POOL_CONNECTIONS = int(os.environ.get('HTTP_POOL_CONNECTIONS', '10'))
+HTTP_POOL_MAXSIZE = int(os.environ.get('HTTP_POOL_MAXSIZE', '20'))
+HTTP_CONNECT_TIMEOUT = float(os.environ.get('HTTP_CONNECT_TIMEOUT', '3.05'))
+HTTP_READ_TIMEOUT = float(os.environ.get('HTTP_READ_TIMEOUT', '15'))
+HTTP_RETRIES = int(os.environ.get('HTTP_RETRIES', '2'))
+HTTP_TCP_KEEPALIVE = os.environ.get('HTTP_TCP_KEEPALIVE', 'true').lower() == 'true'
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+class PooledAdapter(HTTPAdapter):
+    """HTTPAdapter with a default (connect, read) timeout and optional TCP keepalive"""
+
+    def __init__(self, timeout=None, tcp_keepalive=HTTP_TCP_KEEPALIVE, **kwargs):
+        self.timeout = timeout or (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+        self.tcp_keepalive = tcp_keepalive
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        if self.tcp_keepalive:
+            # Keep idle pooled sockets from being silently dropped by NATs/load balancers
+            from urllib3.connection import HTTPConnection
+            kwargs['socket_options'] = HTTPConnection.default_socket_options + [
+                (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            ]
+        super().init_poolmanager(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        return super().send(request, **kwargs)
+
+
+def _retry_policy():
+    """
+    Connection failures are retried for every method (nothing was sent).
+    Read errors and 429/5xx responses are only retried for GET/HEAD, so a
+    message send is never duplicated.
+    """
+    return Retry(
+        total=HTTP_RETRIES + 1,
+        connect=HTTP_RETRIES,
+        read=HTTP_RETRIES,
+        status=HTTP_RETRIES,
+        backoff_factor=0.3,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(['GET', 'HEAD']),
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+
+
+def _record_response(response, *args, **kwargs):
+    """Response hook: per-host latency/error counters in resilience.metrics"""
+    host = urlparse(response.url).hostname or 'unknown'
+    resilience.metrics.record(
+        f'http {response.request.method} {host}',
+        response.elapsed.total_seconds(),
+        error=response.status_code >= 400
+    )
+
+
+def create_session(pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE, retries=None, timeout=None):
+    """
+    Build a requests session with a pooled, retrying adapter.
+
+    Args:
+        pool_connections (int): Number of per-host pools to keep
+        pool_maxsize (int): Connections kept alive per host
+        retries (Retry): urllib3 retry policy (default: _retry_policy())
+        timeout (tuple): Default (connect, read) timeout in seconds
+
+    Returns:
+        requests.Session
+    """
+    session = requests.Session()
+    adapter = PooledAdapter(
+        timeout=timeout,
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+        max_retries=retries or _retry_policy()
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.hooks['response'].append(_record_response)
+    return session
+
+
+def get_session(name='graph'):
+    """
+    Get the shared session for a client, creating it on first use.
+
+    Args:
+        name (str): Client name; each name gets its own pools
+
+    Returns:
+        requests.Session
+    """
+    session = _sessions.get(name)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(name)
+            if session is None:
+                session = create_session()
+                _sessions[name] = session
+    return session
+
+
+def get_connection_stats():
+    """
+    Per-host connection pool counters for every shared session.
+
+    Returns:
+        dict: session name -> host -> {'connections_opened', 'requests', 'idle'}.
+        requests > connections_opened means connections are being reused.
+    """
+    stats = {}
+    with _sessions_lock:
+        sessions = dict(_sessions)
+    for name, session in sessions.items():
+        hosts = {}
+        for adapter in set(session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                host = hosts.setdefault(pool.host, {'connections_opened': 0, 'requests': 0, 'idle': 0})
+                host['connections_opened'] += pool.num_connections
+                host['requests'] += pool.num_requests
+                # The pool queue is pre-filled with None placeholders; count real sockets
+                host['idle'] += sum(1 for conn in list(pool.pool.queue) if conn is not None) if pool.pool is not None else 0
+        stats[name] = hosts
+    return stats
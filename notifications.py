@@ -0,0 +1,302 @@
+"""
+Order Notifications
+Buyer notifications for order and payment status changes. The dashboard
+endpoint commits the state change and emits an event; notification workers
+render the message, create the Razorpay payment link when one is needed and
+deliver it over WhatsApp. Progress is recorded on the order itself under
+notification/<event type>:
+
+    {'status': 'queued' | 'sent' | 'failed' | 'skipped', 'order_status' or
+     'payment_status': value the event was emitted for, 'updated_at': ISO time,
+     'error': reason (failed/skipped only)}
+"""
+
+from dotenv import load_dotenv
+load_dotenv()
+import os
+import tempfile
+import threading
+import uuid
+from datetime import datetime
+
+import webhook_queue
+
+
+NOTIFICATIONS_ASYNC = os.environ.get('NOTIFICATIONS_ASYNC', 'true').lower() == 'true'
+NOTIFICATION_QUEUE = os.environ.get('NOTIFICATION_QUEUE', 'local').lower()
+NOTIFICATION_QUEUE_PATH = os.environ.get('NOTIFICATION_QUEUE_PATH', os.path.join(os.path.dirname(__file__), 'notification_queue.db'))
+NOTIFICATION_WORKERS = int(os.environ.get('NOTIFICATION_WORKERS', '4'))
+# Invoice PDFs uploaded with a status change wait here until a worker sends them
+NOTIFICATION_SPOOL_DIR = os.environ.get('NOTIFICATION_SPOOL_DIR', os.path.join(tempfile.gettempdir(), 'order_notifications'))
+
+EVENT_ORDER_STATUS = 'order_status'
+EVENT_PAYMENT_STATUS = 'payment_status'
+
+
+# ==================== TEMPLATES ====================
+
+def _items_display(order):
+    """Items list for multi-item orders, or the single product name"""
+    items = order.get('items') or []
+    if len(items) == 1:
+        return f"{items[0]['product_name']} x{items[0]['quantity']}"
+    if items:
+        return "\n".join([f"- {item['product_name']} x{item['quantity']}" for item in items])
+    return order.get('product_name', 'your order')
+
+
+def render_order_status_message(order, order_status):
+    """Order status update sent to the buyer"""
+    return (
+        f"🛒 *Order Status Update* 🛒\n\n"
+        f"Order ID: #{order.get('order_id')}\n"
+        f"Items:\n{_items_display(order)}\n\n"
+        f"Status: *{order_status}*\n\n"
+        f"Thank you for your order!"
+    )
+
+
+def _payment_request_message(order, total_amount, payment_line):
+    return (
+        f"💳 *Payment Request* 💳\n\n"
+        f"Order ID: #{order.get('order_id')}\n"
+        f"Items:\n{_items_display(order)}\n"
+        f"Amount: *₹{total_amount:.2f}*\n\n"
+        f"{payment_line}\n\n"
+        f"Thank you! 🙏"
+    )
+
+
+def _upi_request_message(seller_id, order, total_amount):
+    """Payment request pointing at the seller's UPI ID (fallback when there is no payment link)"""
+    from firebase_db import load_company_info
+    upi_id = (load_company_info(seller_id) or {}).get('upi_id', '')
+    if upi_id:
+        return _payment_request_message(
+            order, total_amount,
+            f"Please pay to UPI ID:\n📱 *{upi_id}*\n\n"
+            f"After payment, please share the transaction screenshot for verification."
+        )
+    return _payment_request_message(order, total_amount, "Please contact the seller for payment details.")
+
+
+def render_payment_message(seller_id, order, payment_status):
+    """
+    Payment status message sent to the buyer. For 'Requested' this creates a
+    Razorpay payment link when the seller has Razorpay enabled.
+
+    Returns:
+        str: Message text, or None if this status has no notification
+    """
+    from firebase_db import get_razorpay_credentials
+    from razorpay_helper import create_payment_link
+
+    order_id = order.get('order_id')
+    total_amount = order.get('total_amount') or order.get('amount', 0)
+
+    if payment_status == "Requested":
+        razorpay_credentials = get_razorpay_credentials(seller_id)
+        if not (razorpay_credentials and razorpay_credentials.get('enabled')):
+            return _upi_request_message(seller_id, order, total_amount)
+
+        print(f"🔗 Creating Razorpay payment link for order {order_id}...")
+        payment_result = create_payment_link(
+            seller_id=seller_id,
+            order_id=order_id,
+            amount=total_amount,
+            customer_name=order.get('buyer_name', 'Customer'),
+            customer_phone=order.get('buyer_phone'),
+            description=f"Payment for Order #{order_id}"
+        )
+        if not payment_result.get('success'):
+            print(f"⚠️ Payment link creation failed: {payment_result.get('error')}")
+            return _upi_request_message(seller_id, order, total_amount)
+        return _payment_request_message(
+            order, total_amount,
+            f"Please complete your payment using this secure link:\n"
+            f"🔗 {payment_result.get('payment_link')}\n\n"
+            f"After payment, your order will be automatically confirmed."
+        )
+
+    if payment_status == "Completed":
+        return (
+            f"✅ *Payment Confirmed* ✅\n\n"
+            f"Order ID: #{order_id}\n"
+            f"Items:\n{_items_display(order)}\n"
+            f"Amount: ₹{total_amount:.2f}\n\n"
+            f"Your payment has been received and confirmed!\n"
+            f"Your order will be processed shortly.\n\n"
+            f"Thank you for your purchase! 🎉"
+        )
+
+    if payment_status == "Pending":
+        return (
+            f"⏳ *Payment Status Update* ⏳\n\n"
+            f"Order ID: #{order_id}\n"
+            f"Items:\n{_items_display(order)}\n"
+            f"Amount: ₹{total_amount:.2f}\n\n"
+            f"Payment status: *Pending*\n\n"
+            f"We'll notify you once payment is requested.\n\n"
+            f"Thank you! 🙏"
+        )
+
+    return None
+
+
+# ==================== EVENTS ====================
+
+def notification_status(event_type, value, status, error=None):
+    """Value stored at orders/<order>/notification/<event_type>"""
+    entry = {
+        'status': status,
+        event_type: value,
+        'updated_at': datetime.now().isoformat()
+    }
+    if error:
+        entry['error'] = error
+    return entry
+
+
+def build_event(seller_id, order_id, event_type, value, custom_message=None, invoice=None):
+    """
+    Build a notification event and the order fields that mark it queued.
+
+    Args:
+        seller_id (str): Seller ID
+        order_id (int): Order ID
+        event_type (str): EVENT_ORDER_STATUS or EVENT_PAYMENT_STATUS
+        value (str): The new order or payment status
+        custom_message (str): Seller-written text to send instead of the template
+        invoice: Uploaded PDF (werkzeug FileStorage) to send with the message
+
+    Returns:
+        tuple: (event dict, order fields to write with the status change)
+    """
+    event = {
+        'event_id': uuid.uuid4().hex,
+        'key': f'{seller_id}:{order_id}',
+        'type': event_type,
+        'seller_id': seller_id,
+        'order_id': order_id,
+        'value': value
+    }
+    if custom_message:
+        event['custom_message'] = custom_message
+    if invoice is not None:
+        # The upload only lives as long as the request, so spool it for the worker
+        os.makedirs(NOTIFICATION_SPOOL_DIR, exist_ok=True)
+        path = os.path.join(NOTIFICATION_SPOOL_DIR, f"{event['event_id']}.pdf")
+        invoice.save(path)
+        event['invoice_path'] = path
+    fields = {f'notification/{event_type}': notification_status(event_type, value, 'queued')}
+    return event, fields
+
+
+def _render(event, order):
+    seller_id = event['seller_id']
+    value = event['value']
+    if event['type'] == EVENT_ORDER_STATUS:
+        return event.get('custom_message') or render_order_status_message(order, value)
+    # A payment request always carries the payment instructions, even with a custom message
+    if event.get('custom_message') and value != "Requested":
+        return event['custom_message']
+    return render_payment_message(seller_id, order, value)
+
+
+def handle_notification_event(event):
+    """
+    Render and deliver one notification event (runs on a notification worker),
+    then record the outcome on the order.
+    """
+    from firebase_db import get_order, get_whatsapp_credentials, update_order_fields
+    from whatsapp_msg import send_whatsapp_message, send_whatsapp_media
+    from outbound import PRIORITY_NOTICE
+
+    seller_id, order_id = event['seller_id'], event['order_id']
+    event_type, value = event['type'], event['value']
+    invoice_path = event.get('invoice_path')
+    status, error = 'failed', None
+    order = None
+    try:
+        order = get_order(seller_id, order_id)
+        buyer_phone = (order or {}).get('buyer_phone')
+        message = _render(event, order) if buyer_phone else None
+        if not buyer_phone:
+            status, error = 'skipped', 'Order or buyer phone not found'
+        elif not message:
+            status, error = 'skipped', f'No notification for {event_type} {value}'
+        else:
+            whatsapp_creds = get_whatsapp_credentials(seller_id)
+            if invoice_path and event_type == EVENT_PAYMENT_STATUS and value == 'Requested':
+                print(f"📎 Invoice PDF attached, sending via WhatsApp...")
+                result = send_whatsapp_media(buyer_phone, invoice_path, message, seller_id=seller_id, whatsapp_creds=whatsapp_creds)
+            else:
+                result = send_whatsapp_message(buyer_phone, message, seller_id, whatsapp_creds, priority=PRIORITY_NOTICE)
+            if result:
+                status = 'sent'
+                print(f"✅ {event_type} notification for order {order_id} sent to {buyer_phone}")
+            else:
+                error = 'WhatsApp send failed'
+    except Exception as e:
+        error = str(e)
+        print(f"❌ Error delivering {event_type} notification for order {order_id}: {e}")
+    finally:
+        if invoice_path and os.path.exists(invoice_path):
+            os.remove(invoice_path)
+
+    # Skip the existence check only when the order was just read; a deleted
+    # order must not come back as a ghost holding only the marker
+    update_order_fields(seller_id, order_id, {
+        f'notification/{event_type}': notification_status(event_type, value, status, error)
+    }, check_exists=order is None)
+    return status
+
+
+# ==================== DISPATCH ====================
+
+_queue = None
+_pool = None
+_lock = threading.Lock()
+
+
+def _get_pool():
+    global _queue, _pool
+    if _pool is None:
+        with _lock:
+            if _pool is None:
+                if NOTIFICATION_QUEUE == 'sqlite':
+                    _queue = webhook_queue.SQLiteQueue(NOTIFICATION_QUEUE_PATH)
+                else:
+                    _queue = webhook_queue.LocalQueue()
+                # Keyed by seller:order so one order's notifications go out in the order emitted
+                pool = webhook_queue.WorkerPool(_queue, handle_notification_event, NOTIFICATION_WORKERS)
+                pool.start()
+                _pool = pool
+    return _pool
+
+
+def emit(events):
+    """
+    Hand notification events to the workers.
+
+    Args:
+        events (list): Events from build_event, in the order they should be delivered
+    """
+    for event in events:
+        if NOTIFICATIONS_ASYNC:
+            _get_pool().queue.put(event)
+        else:
+            handle_notification_event(event)
+
+
+def get_stats():
+    """
+    Get notification queue depth and worker counters for this process.
+
+    Returns:
+        dict: Same fields as webhook_queue.get_stats()
+    """
+    if _pool is None:
+        return {'queue': NOTIFICATION_QUEUE, 'workers': 0, 'depth': 0, 'processed': 0, 'failed': 0,
+                'coalesced': 0, 'active_keys': 0, 'parked': 0}
+    return _pool.stats()
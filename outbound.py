@@ -0,0 +1,269 @@
+"""
+Outbound Dispatcher
+Paces outbound WhatsApp Graph API sends against Meta's per-number throughput
+limits. Every send is queued with a priority lane, waits for a token from its
+phone_number_id's token bucket, and is retried with backoff on 429 and on
+connection errors raised before the request went out. A POST that may have
+reached Meta (read timeout, 5xx) is not retried, so a buyer never gets the
+same message twice. Sender threads run sends in parallel up to the allowed
+rate instead of serially inside request handlers.
+"""
+
+from dotenv import load_dotenv
+load_dotenv()
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future
+
+import requests
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+import resilience
+
+
+OUTBOUND_WORKERS = int(os.environ.get('OUTBOUND_WORKERS', '8'))
+# Messages per second per phone_number_id, and how many may go out back-to-back
+OUTBOUND_RATE_PER_SECOND = float(os.environ.get('OUTBOUND_RATE_PER_SECOND', '20'))
+OUTBOUND_BURST = int(os.environ.get('OUTBOUND_BURST', '40'))
+OUTBOUND_MAX_ATTEMPTS = int(os.environ.get('OUTBOUND_MAX_ATTEMPTS', '4'))
+
+# Priority lanes: lower runs first
+PRIORITY_REPLY = 0    # agent replies and messages a seller sends by hand
+PRIORITY_NOTICE = 1   # order/payment/cancellation notices
+LANE_NAMES = {PRIORITY_REPLY: 'reply', PRIORITY_NOTICE: 'notice'}
+
+# Only statuses that mean the message was not accepted; a 5xx may follow a delivered send
+RETRY_STATUSES = (429,)
+
+
+class TokenBucket:
+    """Token bucket refilled at `rate` tokens per second up to `burst`"""
+
+    def __init__(self, rate=OUTBOUND_RATE_PER_SECOND, burst=OUTBOUND_BURST):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self):
+        """
+        Take a token if one is available.
+
+        Returns:
+            float: 0 if a token was taken, else seconds until one will be
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+
+class _SendJob:
+    __slots__ = ('phone_number_id', 'send', 'priority', 'attempts', 'future', 'submitted_at')
+
+    def __init__(self, phone_number_id, send, priority):
+        self.phone_number_id = phone_number_id
+        self.send = send
+        self.priority = priority
+        self.attempts = 0
+        self.future = Future()
+        self.submitted_at = time.monotonic()
+
+
+def _retry_after(response, attempt):
+    """Seconds to wait before retrying: Retry-After if the server sent one, else jittered backoff"""
+    header = response.headers.get('Retry-After') if response is not None else None
+    if header:
+        try:
+            return min(60.0, float(header))
+        except ValueError:
+            pass
+    return random.uniform(0, min(30.0, 0.5 * (2 ** attempt)))
+
+
+def _not_sent(error):
+    """True if a send failed while connecting, before any of the request reached the server"""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    if isinstance(error, requests.exceptions.ConnectionError) and error.args:
+        reason = error.args[0]
+        if isinstance(reason, MaxRetryError):
+            reason = reason.reason
+        return isinstance(reason, NewConnectionError)
+    return False
+
+
+class OutboundDispatcher:
+    """Priority queue of sends drained by sender threads, paced per phone_number_id"""
+
+    def __init__(self, workers=OUTBOUND_WORKERS, rate=OUTBOUND_RATE_PER_SECOND, burst=OUTBOUND_BURST,
+                 max_attempts=OUTBOUND_MAX_ATTEMPTS):
+        self.workers = workers
+        self.rate = rate
+        self.burst = burst
+        self.max_attempts = max_attempts
+        self._cond = threading.Condition()
+        self._ready = []     # (priority, seq, job)
+        self._delayed = []   # (not_before, seq, job): rate-limited or backing off
+        self._seq = itertools.count()
+        self._buckets = {}
+        self._threads = []
+        self._stopping = False
+        self.counters = {'sent': 0, 'failed': 0, 'retried': 0, 'throttled': 0}
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f'outbound-sender-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=5.0):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def submit(self, phone_number_id, send, priority=PRIORITY_REPLY):
+        """
+        Queue a send.
+
+        Args:
+            phone_number_id (str): Sending WhatsApp number; each has its own rate limit
+            send (callable): Performs the HTTP call and returns the requests.Response
+            priority (int): PRIORITY_REPLY or PRIORITY_NOTICE
+
+        Returns:
+            Future: Resolves to the final Response, or raises the final connection error
+        """
+        job = _SendJob(phone_number_id, send, priority)
+        with self._cond:
+            heapq.heappush(self._ready, (priority, next(self._seq), job))
+            self._cond.notify()
+        return job.future
+
+    def _bucket(self, phone_number_id):
+        with self._cond:
+            bucket = self._buckets.get(phone_number_id)
+            if bucket is None:
+                bucket = self._buckets[phone_number_id] = TokenBucket(self.rate, self.burst)
+            return bucket
+
+    def _delay(self, job, seconds):
+        with self._cond:
+            heapq.heappush(self._delayed, (time.monotonic() + seconds, next(self._seq), job))
+            self._cond.notify()
+
+    def _next(self):
+        with self._cond:
+            while not self._stopping:
+                now = time.monotonic()
+                while self._delayed and self._delayed[0][0] <= now:
+                    _, seq, job = heapq.heappop(self._delayed)
+                    heapq.heappush(self._ready, (job.priority, seq, job))
+                if self._ready:
+                    return heapq.heappop(self._ready)[2]
+                timeout = self._delayed[0][0] - now if self._delayed else 0.5
+                self._cond.wait(min(timeout, 0.5))
+            return None
+
+    def _run(self):
+        while True:
+            job = self._next()
+            if job is None:
+                return
+            wait = self._bucket(job.phone_number_id).take()
+            if wait > 0:
+                self._count('throttled')
+                self._delay(job, wait)
+                continue
+            self._attempt(job)
+
+    def _attempt(self, job):
+        job.attempts += 1
+        response, error = None, None
+        try:
+            response = job.send()
+        except Exception as e:
+            error = e
+
+        retryable = _not_sent(error) if error is not None else response.status_code in RETRY_STATUSES
+        if retryable and job.attempts < self.max_attempts:
+            self._count('retried')
+            delay = _retry_after(response, job.attempts)
+            print(f"⏳ WhatsApp send to {job.phone_number_id} got "
+                  f"{error or response.status_code}; retry {job.attempts}/{self.max_attempts - 1} in {delay:.1f}s")
+            self._delay(job, delay)
+            return
+        self._finish(job, response=response, error=error)
+
+    def _finish(self, job, response=None, error=None):
+        failed = error is not None or response.status_code >= 400
+        self._count('failed' if failed else 'sent')
+        resilience.metrics.record(
+            f'whatsapp send {LANE_NAMES.get(job.priority, job.priority)}',
+            time.monotonic() - job.submitted_at,
+            error=failed
+        )
+        if error is not None:
+            job.future.set_exception(error)
+        else:
+            job.future.set_result(response)
+
+    def _count(self, name):
+        with self._cond:
+            self.counters[name] += 1
+
+    def stats(self):
+        with self._cond:
+            depth = {name: 0 for name in LANE_NAMES.values()}
+            for _, _, job in self._ready + self._delayed:
+                lane = LANE_NAMES.get(job.priority, str(job.priority))
+                depth[lane] = depth.get(lane, 0) + 1
+            return dict(self.counters, queued=depth, numbers=len(self._buckets),
+                        rate_per_second=self.rate, workers=self.workers)
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher():
+    """Get the process-wide dispatcher, starting its sender threads on first use"""
+    global _dispatcher
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                dispatcher = OutboundDispatcher()
+                dispatcher.start()
+                _dispatcher = dispatcher
+    return _dispatcher
+
+
+def submit(phone_number_id, send, priority=PRIORITY_REPLY):
+    """Queue a send on the process-wide dispatcher (see OutboundDispatcher.submit)"""
+    return get_dispatcher().submit(phone_number_id, send, priority)
+
+
+def get_stats():
+    """
+    Get delivery counters for this process.
+
+    Returns:
+        dict: sent, failed, retried, throttled, queued per lane, numbers, rate_per_second, workers
+    """
+    if _dispatcher is None:
+        return {'sent': 0, 'failed': 0, 'retried': 0, 'throttled': 0,
+                'queued': {name: 0 for name in LANE_NAMES.values()}, 'numbers': 0,
+                'rate_per_second': OUTBOUND_RATE_PER_SECOND, 'workers': 0}
+    return _dispatcher.stats()
@@ -7,7 +7,7 @@ import os
 import hmac
 import hashlib
 import razorpay
-from firebase_db import get_razorpay_credentials, update_order_payment_link, load_seller_data, save_seller_data
+from firebase_db import get_razorpay_credentials, update_order_payment_link, complete_order_payment
 
 
 def get_razorpay_client(seller_id):
@@ -158,37 +158,15 @@ def handle_payment_success(payment_link_id, payment_id, seller_id):
         dict: {'success': bool, 'order_id': int, 'error': str}
     """
     try:
-        # Load seller data to find the order
-        seller_data = load_seller_data(seller_id)
-        orders = seller_data.get('orders', [])
+        # Resolve the order through the payment link index and update it in one write
+        order_id = complete_order_payment(payment_link_id, payment_id, seller_id)
         
-        # Find order with matching payment_link_id
-        order_found = None
-        order_index = None
-        
-        for i, order in enumerate(orders):
-            if order.get('payment_link_id') == payment_link_id:
-                order_found = order
-                order_index = i
-                break
-        
-        if not order_found:
+        if order_id is None:
             return {
                 'success': False,
                 'error': f'Order not found for payment link {payment_link_id}'
             }
         
-        order_id = order_found.get('order_id')
-        
-        # Update payment status
-        orders[order_index]['payment_status'] = 'Completed'
-        orders[order_index]['razorpay_payment_id'] = payment_id
-        orders[order_index]['payment_completed_at'] = None  # You can add timestamp if needed
-        
-        # Save updated data
-        seller_data['orders'] = orders
-        save_seller_data(seller_id, seller_data)
-        
         print(f"✅ Payment completed for Order #{order_id}")
         print(f"   Payment ID: {payment_id}")
         
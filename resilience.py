@@ -0,0 +1,346 @@
+"""
+Resilience
+Shared call wrapper for remote dependencies: per-operation deadlines, jittered
+retries for idempotent calls, a circuit breaker that fails fast while a
+dependency is down, and per-operation latency/error counters.
+
+A deadline covers the whole call: DeadlineAdapter cuts every HTTP request made
+inside call() (SDK-level retries included) down to the time left, and
+time_limit() tightens the deadline for everything run inside it.
+"""
+
+from dotenv import load_dotenv
+load_dotenv()
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import requests
+from firebase_admin import exceptions as firebase_exceptions
+
+
+FIREBASE_HTTP_TIMEOUT = float(os.environ.get('FIREBASE_HTTP_TIMEOUT', '10'))
+FIREBASE_READ_DEADLINE = float(os.environ.get('FIREBASE_READ_DEADLINE', '8'))
+FIREBASE_WRITE_DEADLINE = float(os.environ.get('FIREBASE_WRITE_DEADLINE', '10'))
+FIREBASE_READ_RETRIES = int(os.environ.get('FIREBASE_READ_RETRIES', '2'))
+FIREBASE_BREAKER_THRESHOLD = int(os.environ.get('FIREBASE_BREAKER_THRESHOLD', '5'))
+FIREBASE_BREAKER_RESET_SECONDS = float(os.environ.get('FIREBASE_BREAKER_RESET_SECONDS', '30'))
+
+# Latency samples kept per operation for percentiles
+_LATENCY_SAMPLES = 512
+
+# Errors worth retrying and counting against the breaker. Anything else
+# (permission denied, invalid argument, bugs) is the caller's problem.
+TRANSIENT_ERRORS = (
+    firebase_exceptions.UnavailableError,
+    firebase_exceptions.DeadlineExceededError,
+    firebase_exceptions.InternalError,
+    firebase_exceptions.ResourceExhaustedError,
+    firebase_exceptions.UnknownError,
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+    ConnectionError,
+    TimeoutError,
+)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency whose circuit is open"""
+
+
+class DeadlineExceeded(Exception):
+    """Raised when an operation's retries ran out of time"""
+
+
+# ==================== CIRCUIT BREAKER ====================
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    closed -> open after `threshold` transient failures in a row. While open,
+    calls fail immediately with CircuitOpenError. After `reset_seconds` one
+    probe call is let through (half-open); success closes the circuit, failure
+    re-opens it.
+    """
+
+    def __init__(self, name, threshold=FIREBASE_BREAKER_THRESHOLD, reset_seconds=FIREBASE_BREAKER_RESET_SECONDS):
+        self.name = name
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self.opened_count = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._opened_at is None:
+            return 'closed'
+        if time.monotonic() - self._opened_at >= self.reset_seconds:
+            return 'half_open'
+        return 'open'
+
+    def allow(self):
+        """Whether a call may go through now"""
+        with self._lock:
+            state = self._state()
+            if state == 'closed':
+                return True
+            if state == 'half_open' and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.threshold:
+                if self._opened_at is None or self._probing:
+                    self.opened_count += 1
+                self._opened_at = time.monotonic()
+                self._probing = False
+                print(f"⚠️ Circuit '{self.name}' open after {self._failures} consecutive failures")
+
+    def release(self):
+        """End a probe that finished with a non-transient error"""
+        with self._lock:
+            self._probing = False
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'state': self._state(),
+                'consecutive_failures': self._failures,
+                'opened_count': self.opened_count
+            }
+
+
+# ==================== METRICS ====================
+
+class OperationMetrics:
+    """Per-operation call, error, retry and latency counters"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ops = {}
+
+    def _op(self, name):
+        op = self._ops.get(name)
+        if op is None:
+            op = {
+                'calls': 0, 'errors': 0, 'retries': 0, 'short_circuited': 0,
+                'latency_total': 0.0, 'latency_max': 0.0,
+                'samples': deque(maxlen=_LATENCY_SAMPLES)
+            }
+            self._ops[name] = op
+        return op
+
+    def record(self, name, latency, error=False):
+        with self._lock:
+            op = self._op(name)
+            op['calls'] += 1
+            op['errors'] += int(error)
+            op['latency_total'] += latency
+            op['latency_max'] = max(op['latency_max'], latency)
+            op['samples'].append(latency)
+
+    def incr(self, name, counter):
+        with self._lock:
+            self._op(name)[counter] += 1
+
+    def snapshot(self):
+        """
+        Get counters for every operation seen so far.
+
+        Returns:
+            dict: operation -> calls, errors, retries, short_circuited and
+            latency figures in milliseconds (avg, p50, p95, p99, max)
+        """
+        with self._lock:
+            result = {}
+            for name, op in self._ops.items():
+                samples = sorted(op['samples'])
+
+                def pct(p):
+                    if not samples:
+                        return 0.0
+                    return round(samples[min(len(samples) - 1, int(p * len(samples)))] * 1000, 2)
+
+                result[name] = {
+                    'calls': op['calls'],
+                    'errors': op['errors'],
+                    'retries': op['retries'],
+                    'short_circuited': op['short_circuited'],
+                    'avg_ms': round(op['latency_total'] / op['calls'] * 1000, 2) if op['calls'] else 0.0,
+                    'p50_ms': pct(0.50),
+                    'p95_ms': pct(0.95),
+                    'p99_ms': pct(0.99),
+                    'max_ms': round(op['latency_max'] * 1000, 2)
+                }
+            return result
+
+    def reset(self):
+        with self._lock:
+            self._ops.clear()
+
+
+metrics = OperationMetrics()
+firebase_breaker = CircuitBreaker('firebase')
+
+
+# ==================== DEADLINES ====================
+
+_local = threading.local()
+
+
+def time_left():
+    """Seconds left before the innermost deadline on this thread, or None outside one"""
+    give_up_at = getattr(_local, 'give_up_at', None)
+    return None if give_up_at is None else give_up_at - time.monotonic()
+
+
+@contextmanager
+def time_limit(seconds):
+    """Give everything inside the block at most `seconds`, or less if an outer deadline is closer"""
+    outer = getattr(_local, 'give_up_at', None)
+    give_up_at = time.monotonic() + seconds
+    _local.give_up_at = give_up_at if outer is None else min(outer, give_up_at)
+    try:
+        yield
+    finally:
+        _local.give_up_at = outer
+
+
+def cap_timeout(timeout):
+    """
+    Cut a requests timeout (seconds, (connect, read) or None) down to the time left.
+
+    Raises:
+        requests.exceptions.ConnectTimeout: No time is left; nothing was sent
+    """
+    left = time_left()
+    if left is None:
+        return timeout
+    if left <= 0:
+        raise requests.exceptions.ConnectTimeout('deadline reached before the request was sent')
+    if isinstance(timeout, tuple):
+        return tuple(left if part is None else min(part, left) for part in timeout)
+    return left if timeout is None else min(timeout, left)
+
+
+class DeadlineAdapter(requests.adapters.BaseAdapter):
+    """Transport adapter wrapper that caps each request's timeout at the time left"""
+
+    def __init__(self, adapter):
+        super().__init__()
+        self.adapter = adapter
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        return self.adapter.send(request, stream=stream, timeout=cap_timeout(timeout),
+                                 verify=verify, cert=cert, proxies=proxies)
+
+    def close(self):
+        self.adapter.close()
+
+
+# ==================== CALL WRAPPER ====================
+
+def _backoff(attempt, base=0.1, cap=2.0):
+    """Full-jitter exponential backoff"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def call(operation, fn, idempotent=False, deadline=None, retries=None, breaker=None):
+    """
+    Run fn() with a circuit breaker, deadline and (for idempotent calls) retries.
+
+    Args:
+        operation (str): Metrics name, e.g. 'get sellers/*/orders'
+        fn (callable): The remote call
+        idempotent (bool): Retry transient failures when True
+        deadline (float): Seconds the whole call, retries included, may take
+            (default FIREBASE_READ_DEADLINE for idempotent calls, else
+            FIREBASE_WRITE_DEADLINE; an enclosing time_limit() can shorten it)
+        retries (int): Retry attempts for idempotent calls
+        breaker (CircuitBreaker): Breaker to consult (default: firebase_breaker)
+
+    Returns:
+        The result of fn()
+
+    Raises:
+        CircuitOpenError: The breaker is open; fn was not called
+        DeadlineExceeded: The deadline passed, or a transient failure left no time to retry
+    """
+    breaker = breaker or firebase_breaker
+    if deadline is None:
+        deadline = FIREBASE_READ_DEADLINE if idempotent else FIREBASE_WRITE_DEADLINE
+    retries = (FIREBASE_READ_RETRIES if retries is None else retries) if idempotent else 0
+    outer = getattr(_local, 'give_up_at', None)
+    give_up_at = time.monotonic() + deadline
+    if outer is not None:
+        give_up_at = min(give_up_at, outer)
+    attempt = 0
+
+    while True:
+        if time.monotonic() >= give_up_at:
+            raise DeadlineExceeded(f"{operation} exceeded its deadline before it could run")
+        if not breaker.allow():
+            metrics.incr(operation, 'short_circuited')
+            raise CircuitOpenError(f"{breaker.name} circuit open; skipped {operation}")
+
+        started = time.monotonic()
+        _local.give_up_at = give_up_at
+        try:
+            result = fn()
+        except TRANSIENT_ERRORS as e:
+            metrics.record(operation, time.monotonic() - started, error=True)
+            breaker.record_failure()
+            if attempt >= retries:
+                raise
+            delay = _backoff(attempt)
+            if time.monotonic() + delay >= give_up_at:
+                raise DeadlineExceeded(f"{operation} exceeded {deadline}s deadline: {e}") from e
+            attempt += 1
+            metrics.incr(operation, 'retries')
+            time.sleep(delay)
+            continue
+        except Exception:
+            metrics.record(operation, time.monotonic() - started, error=True)
+            breaker.release()
+            raise
+        finally:
+            _local.give_up_at = outer
+
+        metrics.record(operation, time.monotonic() - started)
+        breaker.record_success()
+        return result
+
+
+def get_metrics():
+    """
+    Get dependency health: breaker state and per-operation counters.
+
+    Returns:
+        dict: {'firebase': {'breaker': {...}, 'operations': {...}}}
+    """
+    return {
+        'firebase': {
+            'breaker': firebase_breaker.snapshot(),
+            'operations': metrics.snapshot()
+        }
+    }
@@ -0,0 +1,41 @@
+"""
+Move conversations and credentials out of sellers/<id> into their own roots.
+
+Usage:
+    python scripts/migrate_cold_data.py [--dry-run] [--seller SELLER_ID]
+
+Safe to re-run: sellers that were already migrated have nothing left to move.
+Once every seller is migrated, set COLD_DATA_DUAL_READ=false.
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from firebase_db import initialize_firebase, list_seller_ids, migrate_seller_cold_data
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move cold seller data to separate roots")
+    parser.add_argument('--dry-run', action='store_true', help="Report what would move without writing")
+    parser.add_argument('--seller', help="Migrate a single seller ID")
+    args = parser.parse_args()
+
+    initialize_firebase()
+    seller_ids = [args.seller] if args.seller else list_seller_ids()
+
+    failed = []
+    for seller_id in seller_ids:
+        if migrate_seller_cold_data(seller_id, dry_run=args.dry_run) is None:
+            failed.append(seller_id)
+
+    print(f"Processed {len(seller_ids)} sellers ({len(failed)} failed)")
+    if failed:
+        print("Failed: " + ", ".join(failed))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
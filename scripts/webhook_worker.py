@@ -0,0 +1,36 @@
+"""
+Drain the durable webhook queue in a separate process.
+
+Usage:
+    WEBHOOK_QUEUE=sqlite python scripts/webhook_worker.py [--workers N]
+
+Run the web app with WEBHOOK_QUEUE=sqlite and WEBHOOK_WORKER_MODE=external so
+it only enqueues; start as many of these processes as agent throughput needs.
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import webhook_queue
+from firebase_db import initialize_firebase
+from whatsapp_msg import handle_webhook_job, merge_webhook_jobs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Process queued WhatsApp webhook messages")
+    parser.add_argument('--workers', type=int, default=webhook_queue.WEBHOOK_WORKERS, help="Worker threads in this process")
+    args = parser.parse_args()
+
+    if webhook_queue.WEBHOOK_QUEUE != 'sqlite':
+        print("WEBHOOK_QUEUE must be 'sqlite' for an external worker to see the web app's jobs")
+        sys.exit(1)
+
+    initialize_firebase()
+    webhook_queue.run_workers(handle_webhook_job, workers=args.workers, coalesce=merge_webhook_jobs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,755 @@
+"""
+Storage Backends
+Path-addressed storage used by firebase_db. The Firebase backend hands out
+Realtime Database references; the SQLite backend keeps the same tree in an
+embedded database file so single-node deployments, benchmarks and tests can
+run without a network round trip.
+"""
+
+from dotenv import load_dotenv
+load_dotenv()
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+from firebase_admin import db
+
+import resilience
+
+
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'firebase').lower()
+SQLITE_DB_PATH = os.environ.get('SQLITE_DB_PATH', os.path.join(os.path.dirname(__file__), 'shopping_assistant.db'))
+
+# ETag reported for a location that holds no data (matches the Realtime Database)
+NULL_ETAG = 'null_etag'
+
+
+def _split(path):
+    """Split a slash-separated path into its non-empty segments"""
+    if not path:
+        return []
+    return [part for part in str(path).split('/') if part]
+
+
+# ==================== FIREBASE BACKEND ====================
+
+class FirebaseBackend:
+    """Realtime Database backend (the default)"""
+
+    name = 'firebase'
+
+    def __init__(self):
+        self._capped_sessions = set()
+        self._lock = threading.Lock()
+
+    def reference(self, path=None):
+        ref = db.reference(path) if path else db.reference()
+        self._cap_http_timeouts(ref)
+        return ResilientReference(ref, path)
+
+    def _cap_http_timeouts(self, ref):
+        """Wrap the SDK session's adapters once so no request outlives its call's deadline"""
+        session = getattr(getattr(ref, '_client', None), 'session', None)
+        if not isinstance(session, requests.Session) or id(session) in self._capped_sessions:
+            return
+        with self._lock:
+            if id(session) in self._capped_sessions:
+                return
+            for prefix, adapter in list(session.adapters.items()):
+                if not isinstance(adapter, resilience.DeadlineAdapter):
+                    session.mount(prefix, resilience.DeadlineAdapter(adapter))
+            self._capped_sessions.add(id(session))
+
+
+def _operation_name(method, path):
+    """Metrics name for a call: method plus the path with IDs wildcarded"""
+    parts = _split(path)
+    if not parts:
+        return f'{method} /'
+    name = parts[0]
+    if parts[0] == 'sellers' and len(parts) > 2:
+        name += '/*/' + parts[2]
+    elif len(parts) > 1:
+        name += '/*'
+    return f'{method} {name}'
+
+
+class ResilientReference:
+    """
+    Realtime Database reference whose network calls go through resilience.call.
+    Reads are retried with jittered backoff inside FIREBASE_READ_DEADLINE;
+    writes get FIREBASE_WRITE_DEADLINE and are not retried (a timed-out write
+    may still have landed) but share the circuit breaker and metrics. Everything else passes through to the SDK reference.
+    """
+
+    def __init__(self, ref, path=None):
+        self._ref = ref
+        self._path = path
+
+    def _call(self, method, fn, idempotent=False):
+        return resilience.call(_operation_name(method, self._path), fn, idempotent=idempotent)
+
+    def get(self, *args, **kwargs):
+        return self._call('get', lambda: self._ref.get(*args, **kwargs), idempotent=True)
+
+    def set(self, value):
+        return self._call('set', lambda: self._ref.set(value))
+
+    def update(self, value):
+        return self._call('update', lambda: self._ref.update(value))
+
+    def delete(self):
+        return self._call('delete', lambda: self._ref.delete())
+
+    def push(self, value=''):
+        return self._call('push', lambda: self._ref.push(value))
+
+    def transaction(self, transaction_update):
+        return self._call('transaction', lambda: self._ref.transaction(transaction_update))
+
+    def set_if_unchanged(self, expected_etag, value):
+        return self._call('set_if_unchanged', lambda: self._ref.set_if_unchanged(expected_etag, value))
+
+    def child(self, path):
+        return ResilientReference(self._ref.child(path), f'{self._path or ""}/{path}')
+
+    def order_by_child(self, path):
+        return ResilientQuery(self._ref.order_by_child(path), self._path)
+
+    def order_by_key(self):
+        return ResilientQuery(self._ref.order_by_key(), self._path)
+
+    def order_by_value(self):
+        return ResilientQuery(self._ref.order_by_value(), self._path)
+
+    def __getattr__(self, name):
+        return getattr(self._ref, name)
+
+
+class ResilientQuery:
+    """Query counterpart of ResilientReference: filters chain, get() is guarded"""
+
+    def __init__(self, query, path=None):
+        self._query = query
+        self._path = path
+
+    def get(self):
+        return resilience.call(_operation_name('query', self._path), self._query.get, idempotent=True)
+
+    def __getattr__(self, name):
+        attr = getattr(self._query, name)
+        if not callable(attr):
+            return attr
+
+        def chained(*args, **kwargs):
+            return ResilientQuery(attr(*args, **kwargs), self._path)
+        return chained
+
+
+# ==================== SQLITE BACKEND ====================
+# Every leaf value of the tree is one row keyed by its full path, e.g.
+#   sellers/acme/orders/order_7/buyer_phone -> "919999999999"
+# Subtree reads are primary-key range scans and lists are rebuilt with the same
+# rules the Realtime Database uses. Each row also records its key (last path
+# segment) and its container, the path two segments up (sellers/acme/orders
+# above). Ordering a location's children by a child field is then one range of
+# idx_nodes_children: container = location, key = field, sorted by (vtype,
+# value). The vtype letters b < n < s sort booleans, numbers and strings in the
+# Realtime Database's order.
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS nodes (
+    path      TEXT PRIMARY KEY,
+    container TEXT,
+    key       TEXT NOT NULL,
+    vtype     TEXT NOT NULL,
+    value
+);
+CREATE INDEX IF NOT EXISTS idx_nodes_children ON nodes(container, key, vtype, value, path);
+"""
+
+# Indexes of the earlier layout (seller and depth columns), dropped on upgrade
+_OLD_INDEXES = (
+    'idx_nodes_seller', 'idx_nodes_child', 'idx_nodes_order_id',
+    'idx_nodes_buyer_phone', 'idx_nodes_payment_link_id', 'idx_nodes_created_at'
+)
+
+
+def _container(parts):
+    return '/'.join(parts[:-2]) if len(parts) >= 2 else None
+
+
+_PUSH_CHARS = '-0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ_abcdefghijklmnopqrstuvwxyz'
+
+
+def _encode_scalar(value):
+    """Map a JSON scalar to (vtype, stored value)"""
+    if isinstance(value, bool):
+        return 'b', int(value)
+    if isinstance(value, (int, float)):
+        return 'n', value
+    return 's', str(value)
+
+
+def _decode_scalar(vtype, value):
+    if vtype == 'b':
+        return bool(value)
+    return value
+
+
+def _flatten(parts, value, rows):
+    """Append (parts, value) leaf pairs for a JSON value; empty containers store nothing"""
+    if isinstance(value, dict):
+        for key, child in value.items():
+            _flatten(parts + _split(key), child, rows)
+    elif isinstance(value, (list, tuple)):
+        for index, child in enumerate(value):
+            _flatten(parts + [str(index)], child, rows)
+    elif value is not None:
+        rows.append((parts, value))
+
+
+def _as_array(node):
+    """Convert dicts with integer keys to lists, like the Realtime Database does"""
+    if not isinstance(node, dict):
+        return node
+    for key in node:
+        node[key] = _as_array(node[key])
+    if not node or not all(key.isdigit() and (key == '0' or not key.startswith('0')) for key in node):
+        return node
+    highest = max(int(key) for key in node)
+    if len(node) * 2 <= highest + 1:
+        return node
+    array = [None] * (highest + 1)
+    for key, child in node.items():
+        array[int(key)] = child
+    return array
+
+
+def _sort_rank(value):
+    """Ordering used by queries: missing/null, false, true, numbers, strings"""
+    if value is None:
+        return (0, 0, '')
+    if isinstance(value, bool):
+        return (1, int(value), '')
+    if isinstance(value, (int, float)):
+        return (2, value, '')
+    return (3, 0, str(value))
+
+
+class SQLiteEvent:
+    """Change event with the same fields as firebase_admin.db.Event"""
+
+    __slots__ = ('event_type', 'path', 'data')
+
+    def __init__(self, event_type, path, data):
+        self.event_type = event_type
+        self.path = path
+        self.data = data
+
+
+class SQLiteListenerRegistration:
+    """Handle returned by SQLiteReference.listen()"""
+
+    def __init__(self, backend, parts, callback):
+        self._backend = backend
+        self.parts = parts
+        self.callback = callback
+        self.closed = False
+
+    def close(self):
+        with self._backend._lock:
+            self.closed = True
+            if self in self._backend._listeners:
+                self._backend._listeners.remove(self)
+
+
+class SQLiteBackend:
+    """Embedded SQLite backend storing the tree as leaf rows"""
+
+    name = 'sqlite'
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or SQLITE_DB_PATH
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._upgrade_schema()
+        self._conn.executescript(_SCHEMA)
+        self._last_push_time = 0
+        self._last_push_random = []
+        self._listeners = []
+        self._changed = None
+        # Held from commit until that commit's events are delivered, so listeners see writes in order
+        self._notify_lock = threading.Lock()
+
+    def reference(self, path=None):
+        return SQLiteReference(self, _split(path))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _upgrade_schema(self):
+        """Move a database from the seller/depth layout to the container column"""
+        columns = [row[1] for row in self._conn.execute('PRAGMA table_info(nodes)')]
+        if not columns or 'container' in columns:
+            return
+        self._conn.execute('BEGIN IMMEDIATE')
+        try:
+            for index in _OLD_INDEXES:
+                self._conn.execute(f'DROP INDEX IF EXISTS {index}')
+            self._conn.execute('ALTER TABLE nodes ADD COLUMN container TEXT')
+            paths = [path for (path,) in self._conn.execute('SELECT path FROM nodes')]
+            self._conn.executemany(
+                'UPDATE nodes SET container = ? WHERE path = ?',
+                [(_container(_split(path)), path) for path in paths]
+            )
+            for column in ('seller', 'depth'):
+                if column in columns:
+                    self._conn.execute(f'ALTER TABLE nodes DROP COLUMN {column}')
+            self._conn.execute('COMMIT')
+        except Exception:
+            self._conn.execute('ROLLBACK')
+            raise
+
+    # ---------- low-level tree operations (caller holds the lock) ----------
+
+    def _read(self, parts):
+        prefix = '/'.join(parts)
+        if not prefix:
+            rows = self._conn.execute('SELECT path, vtype, value FROM nodes').fetchall()
+        else:
+            rows = self._conn.execute(
+                'SELECT path, vtype, value FROM nodes WHERE path = ? OR (path > ? AND path < ?)',
+                (prefix, prefix + '/', prefix + '0')
+            ).fetchall()
+
+        tree = None
+        for path, vtype, value in rows:
+            rel = _split(path)[len(parts):]
+            value = _decode_scalar(vtype, value)
+            if not rel:
+                return value
+            if tree is None:
+                tree = {}
+            node = tree
+            for key in rel[:-1]:
+                node = node.setdefault(key, {})
+            node[rel[-1]] = value
+        return _as_array(tree)
+
+    def _shallow(self, parts):
+        """Direct children of a location: scalars keep their value, containers become True (as in RTDB)"""
+        prefix = '/'.join(parts)
+        depth = len(parts)
+        if not prefix:
+            rows = self._conn.execute('SELECT path, vtype, value FROM nodes').fetchall()
+        else:
+            rows = self._conn.execute(
+                'SELECT path, vtype, value FROM nodes WHERE path > ? AND path < ?',
+                (prefix + '/', prefix + '0')
+            ).fetchall()
+        children = OrderedDict()
+        for path, vtype, value in rows:
+            rel = _split(path)[depth:]
+            children[rel[0]] = _decode_scalar(vtype, value) if len(rel) == 1 else True
+        return children
+
+    def _child_keys(self, parts):
+        prefix = '/'.join(parts)
+        depth = len(parts)
+        if not prefix:
+            rows = self._conn.execute('SELECT path FROM nodes').fetchall()
+        else:
+            rows = self._conn.execute(
+                'SELECT path FROM nodes WHERE path > ? AND path < ?',
+                (prefix + '/', prefix + '0')
+            ).fetchall()
+        keys = OrderedDict()
+        for (path,) in rows:
+            keys[_split(path)[depth]] = True
+        return keys
+
+    def _delete(self, parts):
+        if self._changed is not None:
+            self._changed.append(tuple(parts))
+        prefix = '/'.join(parts)
+        if not prefix:
+            self._conn.execute('DELETE FROM nodes')
+            return
+        self._conn.execute(
+            'DELETE FROM nodes WHERE path = ? OR (path > ? AND path < ?)',
+            (prefix, prefix + '/', prefix + '0')
+        )
+        # A scalar at an ancestor path would shadow the new subtree
+        ancestors = ['/'.join(parts[:i]) for i in range(1, len(parts))]
+        if ancestors:
+            self._conn.execute(
+                f"DELETE FROM nodes WHERE path IN ({','.join('?' * len(ancestors))})",
+                ancestors
+            )
+
+    def _resolve_server_values(self, parts, value):
+        """Apply {'.sv': {'increment': n}} placeholders against the stored value, as the server does"""
+        if not isinstance(value, dict):
+            return value
+        if set(value) == {'.sv'}:
+            current = self._read(parts)
+            delta = value['.sv'].get('increment', 0) if isinstance(value['.sv'], dict) else 0
+            base = current if isinstance(current, (int, float)) and not isinstance(current, bool) else 0
+            return base + delta
+        return {key: self._resolve_server_values(parts + _split(key), child) for key, child in value.items()}
+
+    def _write(self, parts, value):
+        value = self._resolve_server_values(parts, value)
+        self._delete(parts)
+        rows = []
+        _flatten(list(parts), value, rows)
+        self._conn.executemany(
+            'INSERT INTO nodes (path, container, key, vtype, value) VALUES (?, ?, ?, ?, ?)',
+            [
+                ('/'.join(leaf), _container(leaf), leaf[-1]) + _encode_scalar(leaf_value)
+                for leaf, leaf_value in rows
+            ]
+        )
+
+    def _run(self, operation):
+        """Run operation() inside one write transaction, then notify listeners of what changed"""
+        with self._lock:
+            self._changed = []
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                result = operation()
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                self._changed = None
+                raise
+            self._conn.execute('COMMIT')
+            events = self._listener_events(self._changed) if self._listeners else []
+            self._changed = None
+            self._notify_lock.acquire()
+        try:
+            self._deliver(events)
+        finally:
+            self._notify_lock.release()
+        return result
+
+    # ---------- local listeners ----------
+
+    def _listener_events(self, changed):
+        """Build a 'put' event for every listener whose subtree a committed write touched"""
+        changed = set(changed)
+        # A write below another written path is covered by the outer one
+        roots = [p for p in changed if not any(q != p and p[:len(q)] == q for q in changed)]
+        events = []
+        for registration in self._listeners:
+            listened = registration.parts
+            for written in roots:
+                if written[:len(listened)] == listened:
+                    rel = written[len(listened):]
+                    events.append((registration, SQLiteEvent('put', '/' + '/'.join(rel), self._read(list(written)))))
+                elif listened[:len(written)] == written:
+                    # Written above the listener: resend its whole subtree once
+                    events.append((registration, SQLiteEvent('put', '/', self._read(list(listened)))))
+                    break
+        return events
+
+    def _deliver(self, events):
+        for registration, event in events:
+            if registration.closed:
+                continue
+            try:
+                registration.callback(event)
+            except Exception as e:
+                print(f"⚠️ SQLite listener callback failed for /{'/'.join(registration.parts)}: {e}")
+
+    def _listen(self, parts, callback):
+        registration = SQLiteListenerRegistration(self, tuple(parts), callback)
+        with self._lock:
+            snapshot = self._read(list(parts))
+            self._listeners.append(registration)
+            self._notify_lock.acquire()
+        try:
+            # Like the Realtime Database, the first event carries the full snapshot
+            self._deliver([(registration, SQLiteEvent('put', '/', snapshot))])
+        finally:
+            self._notify_lock.release()
+        return registration
+
+    def _push_key(self):
+        """Chronologically sortable 20-character key, in the same format as Firebase push IDs"""
+        with self._lock:
+            now = int(time.time() * 1000)
+            if now == self._last_push_time and self._last_push_random:
+                # Same millisecond: increment the random suffix to keep keys ordered
+                for i in range(11, -1, -1):
+                    if self._last_push_random[i] < 63:
+                        self._last_push_random[i] += 1
+                        break
+                    self._last_push_random[i] = 0
+            else:
+                self._last_push_random = [random.randrange(64) for _ in range(12)]
+            self._last_push_time = now
+
+            time_chars = []
+            for _ in range(8):
+                time_chars.append(_PUSH_CHARS[now % 64])
+                now //= 64
+            return ''.join(reversed(time_chars)) + ''.join(_PUSH_CHARS[i] for i in self._last_push_random)
+
+
+def _etag(value):
+    if value is None:
+        return NULL_ETAG
+    return hashlib.sha1(json.dumps(value, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class SQLiteReference:
+    """Subset of firebase_admin.db.Reference used by firebase_db"""
+
+    def __init__(self, backend, parts):
+        self._backend = backend
+        self._parts = list(parts)
+
+    @property
+    def key(self):
+        return self._parts[-1] if self._parts else None
+
+    @property
+    def path(self):
+        return '/' + '/'.join(self._parts)
+
+    def child(self, path):
+        return SQLiteReference(self._backend, self._parts + _split(path))
+
+    def get(self, shallow=False):
+        with self._backend._lock:
+            if shallow:
+                children = self._backend._shallow(self._parts)
+                if children:
+                    return dict(children)
+                return self._backend._read(self._parts)
+            return self._backend._read(self._parts)
+
+    def set(self, value):
+        self._backend._run(lambda: self._backend._write(self._parts, value))
+
+    def update(self, value):
+        if not isinstance(value, dict) or not value:
+            raise ValueError('Value argument must be a non-empty dictionary.')
+
+        def apply():
+            for path, child in value.items():
+                self._backend._write(self._parts + _split(path), child)
+        self._backend._run(apply)
+
+    def delete(self):
+        self._backend._run(lambda: self._backend._delete(self._parts))
+
+    def push(self, value=''):
+        child = self.child(self._backend._push_key())
+        child.set(value)
+        return child
+
+    def transaction(self, transaction_update):
+        def apply():
+            current = self._backend._read(self._parts)
+            new_value = transaction_update(current)
+            self._backend._write(self._parts, new_value)
+            return new_value
+        return self._backend._run(apply)
+
+    def set_if_unchanged(self, expected_etag, value):
+        if value is None:
+            raise ValueError('Value must not be none.')
+
+        def apply():
+            current = self._backend._read(self._parts)
+            if _etag(current) != expected_etag:
+                return False, current, _etag(current)
+            self._backend._write(self._parts, value)
+            return True, value, _etag(value)
+        return self._backend._run(apply)
+
+    def listen(self, callback):
+        """
+        Register callback for changes under this location (in-process writes only).
+        
+        Returns:
+            SQLiteListenerRegistration: call close() to stop listening
+        """
+        return self._backend._listen(self._parts, callback)
+
+    def order_by_child(self, path):
+        return SQLiteQuery(self, order_by=path)
+
+    def order_by_key(self):
+        return SQLiteQuery(self, order_by=None)
+
+
+class SQLiteQuery:
+    """Subset of firebase_admin.db.Query: ordering, ranges and limits over direct children"""
+
+    def __init__(self, ref, order_by):
+        self._ref = ref
+        self._order_by = order_by
+        self._start = None
+        self._end = None
+        self._limit_first = None
+        self._limit_last = None
+
+    def start_at(self, start):
+        self._start = start
+        return self
+
+    def end_at(self, end):
+        self._end = end
+        return self
+
+    def equal_to(self, value):
+        self._start = value
+        self._end = value
+        return self
+
+    def limit_to_first(self, limit):
+        self._limit_first = limit
+        return self
+
+    def limit_to_last(self, limit):
+        self._limit_last = limit
+        return self
+
+    def _field_query(self, parts, columns, start=None, end=None, descending=False, limit=None):
+        """
+        SQL over idx_nodes_children for children of parts ordered by the
+        single-segment child field self._order_by. Children without the field
+        have no row here.
+        """
+        query = f'SELECT {columns} FROM nodes WHERE container = ? AND key = ?'
+        params = ['/'.join(parts), self._order_by]
+        if start is not None:
+            query += ' AND (vtype, value) >= (?, ?)'
+            params += list(_encode_scalar(start))
+        if end is not None:
+            query += ' AND (vtype, value) <= (?, ?)'
+            params += list(_encode_scalar(end))
+        order = ' DESC' if descending else ''
+        query += f' ORDER BY vtype{order}, value{order}, path{order}'
+        if limit is not None:
+            query += ' LIMIT ?'
+            params.append(limit)
+        return query, params
+
+    def _ordered_in_sql(self, backend, parts):
+        """
+        Child keys in query order with start, end and limit applied in SQL, or
+        None when children missing the field could be part of the result (they
+        sort first, so only an unbounded start lets them in).
+        """
+        if self._order_by is None or len(_split(self._order_by)) != 1:
+            return None
+        if self._start is None and self._limit_last is None:
+            return None
+        if self._limit_last is not None:
+            limit, descending = self._limit_last, True
+        else:
+            limit, descending = self._limit_first, False
+        if limit == 0:
+            return []
+        query, params = self._field_query(parts, 'path', self._start, self._end, descending, limit)
+        keys = [_split(path)[len(parts)] for (path,) in backend._conn.execute(query, params)]
+        if self._start is None and len(keys) < limit:
+            return None
+        if self._limit_last is not None:
+            keys.reverse()
+            if self._limit_first is not None:
+                keys = keys[:self._limit_first]
+        return keys
+
+    def _child_values(self, backend, parts):
+        """Sort value for each direct child that has the order_by field"""
+        child_parts = _split(self._order_by)
+        if len(child_parts) == 1:
+            query, params = self._field_query(parts, 'path, vtype, value')
+        else:
+            # Nested field: its container is the first segment of the child path
+            prefix = '/'.join(parts)
+            query = 'SELECT path, vtype, value FROM nodes WHERE key = ? AND path > ? AND path < ?'
+            params = [child_parts[-1], prefix + '/' if prefix else '', prefix + '0' if prefix else '\uffff']
+        suffix = '/' + '/'.join(child_parts)
+        values = {}
+        for path, vtype, value in backend._conn.execute(query, params):
+            rel = _split(path)[len(parts):]
+            if rel[1:] == child_parts and path.endswith(suffix):
+                values[rel[0]] = _decode_scalar(vtype, value)
+        return values
+
+    def _ordered_in_python(self, backend, parts):
+        """Child keys in query order, sorting every child (orders by key, or when missing fields count)"""
+        keys = list(backend._child_keys(parts))
+        if self._order_by is None:
+            ordered = [(key, key) for key in keys]
+            ordered.sort(key=lambda item: (0, int(item[0]), '') if item[0].isdigit() else (1, 0, item[0]))
+            rank = lambda value: (0, int(value), '') if str(value).isdigit() else (1, 0, str(value))
+        else:
+            values = self._child_values(backend, parts)
+            ordered = [(key, values.get(key)) for key in keys]
+            ordered.sort(key=lambda item: (_sort_rank(item[1]), item[0]))
+            rank = _sort_rank
+
+        if self._start is not None:
+            ordered = [item for item in ordered if rank(item[1]) >= rank(self._start)]
+        if self._end is not None:
+            ordered = [item for item in ordered if rank(item[1]) <= rank(self._end)]
+        if self._limit_first is not None:
+            ordered = ordered[:self._limit_first]
+        if self._limit_last is not None:
+            ordered = ordered[-self._limit_last:] if self._limit_last else []
+        return [key for key, _ in ordered]
+
+    def get(self):
+        backend = self._ref._backend
+        parts = self._ref._parts
+        with backend._lock:
+            keys = self._ordered_in_sql(backend, parts)
+            if keys is None:
+                keys = self._ordered_in_python(backend, parts)
+            result = OrderedDict()
+            for key in keys:
+                result[key] = backend._read(parts + [key])
+            return result
+
+
+# ==================== BACKEND SELECTION ====================
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """Get the configured storage backend (STORAGE_BACKEND=firebase|sqlite)"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                if STORAGE_BACKEND == 'sqlite':
+                    _backend = SQLiteBackend()
+                    print(f"✅ Using SQLite storage at {_backend.db_path}")
+                else:
+                    _backend = FirebaseBackend()
+    return _backend
+
+
+def set_backend(backend):
+    """Replace the active storage backend (tests and benchmarks)"""
+    global _backend
+    with _backend_lock:
+        _backend = backend
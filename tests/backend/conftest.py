@@ -0,0 +1,32 @@
+import pytest
+import firebase_db
+import storage_backend
+from unittest.mock import patch
+
+
+@pytest.fixture(autouse=True)
+def reset_firebase_db_caches():
+    """Start every test with firebase_db's in-process caches empty"""
+    firebase_db._tenant_config.clear()
+    firebase_db._keyed_product_sellers.clear()
+    firebase_db._order_listing_ready.clear()
+    firebase_db._order_layouts.clear()
+    firebase_db._order_id_blocks.clear()
+    firebase_db._conv_append_counts.clear()
+    firebase_db._claimed_msgs.clear()
+    yield
+
+
+@pytest.fixture
+def backend(tmp_path):
+    backend = storage_backend.SQLiteBackend(str(tmp_path / 'test.db'))
+    yield backend
+    backend.close()
+
+
+@pytest.fixture
+def sqlite_db(backend):
+    """Run firebase_db against an embedded SQLite backend"""
+    with patch('firebase_db.initialize_firebase'), \
+         patch('firebase_db.get_backend', return_value=backend):
+        yield backend
@@ -0,0 +1,14 @@
+import firebase_db
+
+
+def test_customer_registry_is_keyed_and_migrates_legacy_lists(sqlite_db):
+    """Test single-child customer registration and folding of the old list shape"""
+    sqlite_db.reference('sellers/reg_seller/customers').set(['+911111', '+912222'])
+    firebase_db.update_customer('reg_seller', '+913333', {'phone_number': '+913333', 'name': 'Asha'})
+
+    assert sorted(firebase_db.get_customer_ids('reg_seller')) == ['+911111', '+912222', '+913333']
+    assert firebase_db.add_customer_id('reg_seller', '+913333') is True
+    assert firebase_db.get_customer('reg_seller', '+913333') == {'phone_number': '+913333', 'name': 'Asha'}
+    assert sqlite_db.reference('sellers/reg_seller/customers').get(shallow=True) == {
+        '_plus_911111': True, '_plus_912222': True, '_plus_913333': True
+    }
@@ -44,3 +44,230 @@ def test_save_seller_data():
         
         mock_ref_instance.update.assert_called_once_with(mock_data)
         assert result is True
+
+
+def test_apply_mirror_event_put_and_patch():
+    """Test streaming events are applied to the mirrored seller tree"""
+    tree = firebase_db._apply_mirror_event(None, '/', {'company_info': {'name': 'A'}, 'orders': [{'order_id': 1}]}, 'put')
+    tree = firebase_db._apply_mirror_event(tree, '/orders/1', {'order_id': 2}, 'put')
+    tree = firebase_db._apply_mirror_event(tree, '/company_info', {'name': 'B', 'upi_id': 'b@upi'}, 'patch')
+    tree = firebase_db._apply_mirror_event(tree, '/orders/0', None, 'put')
+    
+    assert tree['company_info'] == {'name': 'B', 'upi_id': 'b@upi'}
+    assert tree['orders'] == [None, {'order_id': 2}]
+
+
+def test_seller_mirror_serves_reads_from_memory():
+    """Test that the mirror subscribes once and serves later reads locally"""
+    listeners = {}
+    
+    def fake_reference(path):
+        ref = MagicMock()
+        def listen(callback):
+            listeners[path] = callback
+            event = MagicMock(event_type='put', path='/', data={'company_info': {'name': 'Shop'}})
+            callback(event)
+            return MagicMock()
+        ref.listen.side_effect = listen
+        return ref
+    
+    mirror = firebase_db.SellerMirror(max_sellers=1, idle_seconds=60, sync_timeout=1)
+    
+    with patch('firebase_db.db.reference', side_effect=fake_reference):
+        found, data = mirror.get('seller_a')
+        assert found and data['company_info']['name'] == 'Shop'
+        
+        listeners['sellers/seller_a'](MagicMock(event_type='patch', path='/company_info', data={'name': 'Renamed'}))
+        found, data = mirror.get('seller_a')
+        assert data['company_info']['name'] == 'Renamed'
+        
+        mirror.get('seller_b')
+    
+    stats = mirror.stats()
+    assert stats['hits'] == 1
+    assert stats['misses'] == 2
+    assert stats['evictions'] == 1
+    assert stats['sellers'] == 1
+
+
+def test_orders_to_list_handles_both_layouts():
+    """Test that legacy list and keyed map orders normalize to the same list"""
+    legacy = [None, {'order_id': 1}, {'order_id': 2}]
+    keyed = {'order_2': {'order_id': 2}, 'order_1': {'order_id': 1}}
+    
+    assert firebase_db.orders_to_list(legacy) == [{'order_id': 1}, {'order_id': 2}]
+    assert firebase_db.orders_to_list(keyed) == [{'order_id': 1}, {'order_id': 2}]
+    assert firebase_db._orders_to_v2_map(legacy) == {'order_1': {'order_id': 1}, 'order_2': {'order_id': 2}}
+
+
+def test_migration_keeps_orders_with_repeated_ids():
+    """Test that legacy orders sharing an order_id are all kept when re-keyed"""
+    legacy = [{'order_id': 1, 'n': 'a'}, {'order_id': 2, 'n': 'b'}, {'order_id': 2, 'n': 'c'}, {'order_id': 2, 'n': 'd'}]
+    
+    migrated = firebase_db._orders_to_v2_map(legacy)
+    
+    assert migrated == {
+        'order_1': {'order_id': 1, 'n': 'a'},
+        'order_2': {'order_id': 2, 'n': 'b'},
+        'order_2_dup1': {'order_id': 2, 'n': 'c'},
+        'order_2_dup2': {'order_id': 2, 'n': 'd'}
+    }
+
+
+def test_update_order_fields_writes_single_child():
+    """Test that an order update is a partial write to the keyed order path"""
+    firebase_db._order_layouts['test_seller'] = firebase_db.ORDER_LAYOUT_V2
+    
+    with patch('firebase_db.db.reference') as mock_ref:
+        result = firebase_db.update_order_fields('test_seller', 7, {'delivery_lat': 12.9}, check_exists=False)
+        
+        assert result is True
+        mock_ref.assert_called_with('sellers/test_seller/orders/order_7')
+        mock_ref.return_value.update.assert_called_once_with({'delivery_lat': 12.9})
+        mock_ref.return_value.set.assert_not_called()
+
+
+def test_status_change_moves_listing_fields_and_counts():
+    """Test that a status change rewrites its listing field and moves order_stats in the same write"""
+    firebase_db._order_layouts['test_seller'] = firebase_db.ORDER_LAYOUT_V2
+    current = {'order_id': 7, 'created_at': '2026-01-02T10:00:00', 'order_status': 'Received', 'payment_status': 'Pending'}
+    current.update(firebase_db.order_listing_fields('order_7', current))
+    
+    with patch('firebase_db.db.reference') as mock_ref:
+        assert firebase_db.update_order_fields('test_seller', 7, {'order_status': 'Delivered'}, current=current) is True
+        
+        mock_ref.return_value.get.assert_not_called()
+        mock_ref.return_value.update.assert_called_once_with({
+            'sellers/test_seller/orders/order_7/order_status': 'Delivered',
+            'sellers/test_seller/orders/order_7/idx_status': 'Delivered|2026-01-02T10:00:00|order_7',
+            'sellers/test_seller/order_stats/order_status/Received': {'.sv': {'increment': -1}},
+            'sellers/test_seller/order_stats/order_status/Delivered': {'.sv': {'increment': 1}}
+        })
+
+
+def test_add_order_writes_order_and_index_together():
+    """Test that a new order and its order_index entry go out in one multi-path update"""
+    firebase_db._order_layouts['test_seller'] = firebase_db.ORDER_LAYOUT_V2
+    order = {'order_id': 3, 'buyer_phone': '919999999999', 'created_at': '2026-01-02T10:00:00',
+             'order_status': 'Received', 'payment_status': 'Pending'}
+    
+    with patch('firebase_db.db.reference') as mock_ref:
+        assert firebase_db.add_order('test_seller', order) is True
+        
+        mock_ref.return_value.update.assert_called_once_with({
+            'sellers/test_seller/orders/order_3': dict(
+                order,
+                idx_created='2026-01-02T10:00:00|order_3',
+                idx_status='Received|2026-01-02T10:00:00|order_3',
+                idx_payment='Pending|2026-01-02T10:00:00|order_3',
+                idx_buyer='919999999999|2026-01-02T10:00:00|order_3'
+            ),
+            'order_index/3/test_seller': {'buyer_phone': '919999999999'},
+            'sellers/test_seller/order_stats/total': {'.sv': {'increment': 1}},
+            'sellers/test_seller/order_stats/order_status/Received': {'.sv': {'increment': 1}},
+            'sellers/test_seller/order_stats/payment_status/Pending': {'.sv': {'increment': 1}}
+        })
+
+
+def test_lookup_order_sellers_filters_by_buyer():
+    """Test that index lookups narrow shared order IDs down to the buyer's seller"""
+    with patch('firebase_db.db.reference') as mock_ref:
+        mock_ref.return_value.get.return_value = {
+            'seller_a': {'buyer_phone': '111'},
+            'seller_b': {'buyer_phone': '222'}
+        }
+        
+        result = firebase_db.lookup_order_sellers(5, buyer_phone='222')
+        
+        mock_ref.assert_called_with('order_index/5')
+        assert list(result.keys()) == ['seller_b']
+
+
+def test_allocate_order_id_reserves_blocks():
+    """Test that order numbers come from counter blocks and are handed out locally"""
+    firebase_db._order_id_blocks.pop('test_seller', None)
+    
+    with patch('firebase_db.db.reference') as mock_ref, \
+         patch('firebase_db.ORDER_ID_BLOCK_SIZE', 3):
+        counter = {'value': 7}
+        
+        def transaction(fn):
+            counter['value'] = fn(counter['value'])
+            return counter['value']
+        
+        mock_ref.return_value.get.return_value = 7
+        mock_ref.return_value.transaction.side_effect = transaction
+        
+        assert [firebase_db.allocate_order_id('test_seller') for _ in range(4)] == [8, 9, 10, 11]
+        assert mock_ref.return_value.transaction.call_count == 2
+
+
+def test_add_customer_order_ref_writes_only_new_child():
+    """Test that order references are appended as a keyed child without reading the list"""
+    with patch('firebase_db.db.reference') as mock_ref:
+        ref = {'seller_id': 'test_seller', 'order_id': 4}
+        assert firebase_db.add_customer_order_ref('test_seller', '+919999999999', ref) is True
+        
+        mock_ref.assert_called_with('sellers/test_seller/customers/_plus_919999999999/orders/order_4')
+        mock_ref.return_value.set.assert_called_once_with(ref)
+        mock_ref.return_value.get.assert_not_called()
+
+
+def test_write_batch_commits_once():
+    """Test that queued writes across paths go out as one root update"""
+    firebase_db._order_layouts['test_seller'] = firebase_db.ORDER_LAYOUT_V2
+    order = {'order_id': 9, 'buyer_phone': '111'}
+    
+    with patch('firebase_db.db.reference') as mock_ref:
+        batch = firebase_db.WriteBatch()
+        assert firebase_db.add_order('test_seller', order, batch=batch) is True
+        assert firebase_db.add_order('test_seller', dict(order, order_id=10), batch=batch) is True
+        firebase_db.update_customer_cart('test_seller', '111', [], batch=batch)
+        mock_ref.return_value.update.assert_not_called()
+        
+        assert batch.commit() is True
+        updates = mock_ref.return_value.update.call_args.args[0]
+        mock_ref.return_value.update.assert_called_once()
+        assert updates['sellers/test_seller/orders/order_9']['buyer_phone'] == '111'
+        assert updates['order_index/10/test_seller'] == {'buyer_phone': '111'}
+        assert updates['sellers/test_seller/customers/111/cart'] == []
+        # Increments to the same counter add up instead of overwriting each other
+        assert updates['sellers/test_seller/order_stats/total'] == {'.sv': {'increment': 2}}
+        assert len(batch) == 0
+
+
+def test_save_conversation_message_appends_without_reading():
+    """Test that saving a message is a single push and trims only periodically"""
+    with patch('firebase_db.db.reference') as mock_ref, \
+         patch('firebase_db.CONVERSATION_TRIM_EVERY', 3), \
+         patch('firebase_db.trim_conversation_history') as mock_trim:
+        for _ in range(3):
+            assert firebase_db.save_conversation_message('test_seller', '111', 'user', 'hi') is True
+        
+        assert mock_ref.return_value.push.call_count == 3
+        mock_ref.return_value.get.assert_not_called()
+        mock_trim.assert_called_once_with('test_seller', '111')
+
+
+def test_claim_message_is_single_conditional_write():
+    """Test that a message is claimed once and redeliveries are rejected locally"""
+    firebase_db._dedup_last_expiry_day = firebase_db._dedup_bucket()
+    
+    with patch('firebase_db.db.reference') as mock_ref:
+        mock_ref.return_value.set_if_unchanged.return_value = (True, 1, 'etag')
+        
+        assert firebase_db.claim_message('wamid.ABC', '1700000000') is True
+        assert firebase_db.claim_message('wamid.ABC', '1700000000') is False
+        
+        mock_ref.assert_called_once_with('msg_dedup/2023-11-14/wamid_ABC')
+        mock_ref.return_value.set_if_unchanged.assert_called_once()
+        mock_ref.return_value.get.assert_not_called()
+
+
+def test_claim_message_rejects_claim_from_other_worker():
+    """Test that a message already claimed elsewhere is reported as a duplicate"""
+    firebase_db._dedup_last_expiry_day = firebase_db._dedup_bucket()
+    
+    with patch('firebase_db.db.reference') as mock_ref:
+        mock_ref.return_value.set_if_unchanged.return_value = (False, 123, 'etag')
+        assert firebase_db.claim_message('wamid.XYZ') is False
@@ -0,0 +1,30 @@
+import http_client
+import resilience
+from unittest.mock import patch, MagicMock
+
+
+def test_graph_session_is_shared_and_pooled():
+    """Test every caller gets the same pooled session with default timeouts"""
+    session = http_client.get_session()
+    assert http_client.get_session() is session
+
+    adapter = session.get_adapter('https://graph.facebook.com/v21.0/123/messages')
+    assert isinstance(adapter, http_client.PooledAdapter)
+    assert adapter._pool_maxsize == http_client.HTTP_POOL_MAXSIZE
+    assert 'POST' not in adapter.max_retries.allowed_methods
+
+
+def test_default_timeout_and_host_metrics():
+    """Test requests without a timeout get the adapter default and are counted per host"""
+    resilience.metrics.reset()
+    session = http_client.create_session(timeout=(1, 2))
+    response = MagicMock(status_code=200, url='https://graph.facebook.com/v21.0/x')
+    response.request.method = 'POST'
+    response.elapsed.total_seconds.return_value = 0.05
+
+    with patch('requests.adapters.HTTPAdapter.send', return_value=response) as send:
+        session.get_adapter('https://graph.facebook.com').send(MagicMock())
+        assert send.call_args.kwargs['timeout'] == (1, 2)
+
+    http_client._record_response(response)
+    assert resilience.metrics.snapshot()['http POST graph.facebook.com']['calls'] == 1
@@ -0,0 +1,103 @@
+import firebase_db
+import notifications
+from unittest.mock import patch
+
+
+def test_status_update_commits_and_queues_notification(sqlite_db):
+    """Test the endpoint writes the status with a queued marker and leaves delivery to workers"""
+    from app import app
+    firebase_db.add_order('ntf_seller', {'order_id': 5, 'buyer_phone': '111', 'order_status': 'Received'})
+
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['seller_id'] = 'ntf_seller'
+    with patch('notifications.emit') as emit, \
+         patch('whatsapp_msg.send_whatsapp_message') as send:
+        response = client.put('/api/orders/5', json={'order_status': 'Shipped'})
+
+    assert response.status_code == 200
+    send.assert_not_called()
+    [event] = emit.call_args[0][0]
+    assert (event['type'], event['value'], event['order_id']) == ('order_status', 'Shipped', 5)
+
+    order = firebase_db.get_order('ntf_seller', 5)
+    assert order['order_status'] == 'Shipped'
+    assert order['notification']['order_status']['status'] == 'queued'
+
+
+def test_failed_status_write_sends_nothing(sqlite_db):
+    """Test a status change that could not be saved returns 500 and emits no notification"""
+    from app import app
+    firebase_db.add_order('ntf_seller', {'order_id': 9, 'buyer_phone': '111', 'order_status': 'Received'})
+
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['seller_id'] = 'ntf_seller'
+    with patch('app.update_order_fields', return_value=False), \
+         patch('notifications.emit') as emit:
+        response = client.put('/api/orders/9', json={'order_status': 'Shipped'})
+
+    assert response.status_code == 500
+    emit.assert_not_called()
+    assert firebase_db.get_order('ntf_seller', 9)['order_status'] == 'Received'
+
+
+def test_worker_creates_payment_link_and_records_delivery(sqlite_db):
+    """Test a payment request event renders with a Razorpay link, sends, and marks the order"""
+    firebase_db.add_order('ntf_seller', {'order_id': 6, 'buyer_phone': '111', 'total_amount': 250})
+    event, _ = notifications.build_event('ntf_seller', 6, notifications.EVENT_PAYMENT_STATUS, 'Requested')
+
+    with patch('firebase_db.get_razorpay_credentials', return_value={'enabled': True}), \
+         patch('razorpay_helper.create_payment_link', return_value={'success': True, 'payment_link': 'https://rzp.io/x'}) as link, \
+         patch('whatsapp_msg.send_whatsapp_message', return_value={'messages': [{}]}) as send:
+        assert notifications.handle_notification_event(event) == 'sent'
+
+    link.assert_called_once()
+    assert 'https://rzp.io/x' in send.call_args[0][1]
+    assert firebase_db.get_order('ntf_seller', 6)['notification']['payment_status']['status'] == 'sent'
+
+
+def test_worker_does_not_recreate_a_deleted_order(sqlite_db):
+    """Test an event for an order deleted before delivery is skipped without writing the marker"""
+    firebase_db.add_order('ntf_seller', {'order_id': 7, 'buyer_phone': '111'})
+    event, _ = notifications.build_event('ntf_seller', 8, notifications.EVENT_ORDER_STATUS, 'Shipped')
+
+    with patch('whatsapp_msg.send_whatsapp_message') as send:
+        assert notifications.handle_notification_event(event) == 'skipped'
+
+    send.assert_not_called()
+    assert firebase_db.get_order('ntf_seller', 8) is None
+    assert [o['order_id'] for o in firebase_db.load_orders('ntf_seller')] == [7]
+
+
+def test_bulk_update_is_one_write_with_fanned_out_notifications(sqlite_db):
+    """Test a bulk status change commits in one multi-path write and emits one event per changed order"""
+    from app import app
+    for order_id in (1, 2, 3):
+        firebase_db.add_order('bulk_seller', {'order_id': order_id, 'buyer_phone': f'11{order_id}', 'order_status': 'Received'})
+    firebase_db.update_order_fields('bulk_seller', 3, {'order_status': 'Out for Delivery'})
+
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['seller_id'] = 'bulk_seller'
+
+    root_updates = []
+    original_reference = sqlite_db.reference
+
+    def reference(path=None):
+        ref = original_reference(path)
+        if path is None:
+            real_update = ref.update
+            ref.update = lambda value: root_updates.append(value) or real_update(value)
+        return ref
+
+    with patch.object(sqlite_db, 'reference', side_effect=reference), \
+         patch('notifications.emit') as emit:
+        response = client.post('/api/orders/bulk', json={'order_ids': [1, 2, 3, 99], 'order_status': 'Out for Delivery'})
+
+    body = response.get_json()
+    assert response.status_code == 200
+    assert (body['updated'], body['unchanged'], body['not_found']) == ([1, 2], [3], [99])
+    assert len(root_updates) == 1
+    assert [event['order_id'] for event in emit.call_args[0][0]] == [1, 2]
+    assert firebase_db.get_order('bulk_seller', 2)['order_status'] == 'Out for Delivery'
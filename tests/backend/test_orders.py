@@ -0,0 +1,98 @@
+import firebase_db
+from unittest.mock import patch
+
+
+def test_order_flow_runs_on_sqlite(sqlite_db):
+    """Test placing, reading and updating an order through firebase_db on SQLite"""
+    order = {'order_id': 1, 'buyer_phone': '111', 'order_status': 'Received'}
+
+    batch = firebase_db.WriteBatch()
+    assert firebase_db.add_order('sqlite_seller', order, batch=batch) is True
+    firebase_db.add_customer_order_ref('sqlite_seller', '111', {'seller_id': 'sqlite_seller', 'order_id': 1}, batch=batch)
+    assert batch.commit() is True
+
+    assert firebase_db.update_order_fields('sqlite_seller', 1, {'order_status': 'Shipped'}) is True
+    assert firebase_db.get_order('sqlite_seller', 1)['order_status'] == 'Shipped'
+    assert firebase_db.lookup_order_sellers(1, buyer_phone='111') == {'sqlite_seller': {'buyer_phone': '111'}}
+
+    result = firebase_db.request_order_cancellation(1, buyer_phone='111')
+    assert result['success'] is True
+    assert result['seller_id'] == 'sqlite_seller'
+
+
+def test_orders_page_through_indexed_listing(sqlite_db):
+    """Test cursor pages, indexed filters, date ranges and counts, including backfilled orders"""
+    # An order written before listing fields existed
+    sqlite_db.reference('sellers/pager').set({
+        'order_layout': firebase_db.ORDER_LAYOUT_V2,
+        'orders': {'order_1': {'order_id': 1, 'created_at': '2026-01-01T09:00:00',
+                               'order_status': 'Delivered', 'payment_status': 'Completed', 'buyer_phone': '111'}}
+    })
+    for order_id in range(2, 8):
+        assert firebase_db.add_order('pager', {
+            'order_id': order_id,
+            # Orders 4 and 5 share a timestamp
+            'created_at': f"2026-01-0{min(order_id, 5) if order_id != 5 else 4}T09:00:00",
+            'order_status': 'Received',
+            'payment_status': 'Pending' if order_id % 2 else 'Requested',
+            'buyer_phone': '222' if order_id > 5 else '111'
+        }) is True
+
+    seen, cursor = [], None
+    while True:
+        page = firebase_db.list_orders('pager', limit=3, cursor=cursor)
+        seen += [order['order_id'] for order in page['orders']]
+        cursor = page['next_cursor']
+        if not cursor:
+            break
+    assert sorted(seen) == list(range(1, 8)) and len(seen) == 7
+    assert seen[0] in (6, 7) and seen[-1] == 1
+
+    received = firebase_db.list_orders('pager', order_status='Received', limit=10)['orders']
+    assert [order['order_id'] for order in received][-1] == 2 and len(received) == 6
+    both = firebase_db.list_orders('pager', buyer_phone='111', payment_status='Requested')['orders']
+    assert [order['order_id'] for order in both] == [4, 2]
+    ranged = firebase_db.list_orders('pager', date_from='2026-01-02', date_to='2026-01-03')['orders']
+    assert [order['order_id'] for order in ranged] == [3, 2]
+
+    assert firebase_db.update_order_fields('pager', 2, {'order_status': 'Delivered'}) is True
+    stats = firebase_db.get_order_stats('pager')
+    assert stats['total'] == 7
+    assert stats['order_status'] == {'Delivered': 2, 'Received': 5}
+    assert firebase_db.count_orders(stats, payment_status='Requested') == 3
+    assert [o['order_id'] for o in firebase_db.list_orders('pager', order_status='Delivered')['orders']] == [2, 1]
+
+
+def test_payment_completion_resolves_through_link_index(sqlite_db):
+    """Test that a paid payment link updates its order without scanning orders"""
+    firebase_db.add_order('pay_seller', {'order_id': 3, 'buyer_phone': '111', 'payment_status': 'Pending'})
+
+    assert firebase_db.update_order_payment_link('pay_seller', 3, 'plink_abc') is True
+    assert firebase_db.get_payment_link('plink_abc') == {'seller_id': 'pay_seller', 'order_id': 3}
+
+    assert firebase_db.complete_order_payment('plink_abc', 'pay_123') == 3
+    order = firebase_db.get_order('pay_seller', 3)
+    assert order['payment_status'] == 'Completed'
+    assert order['razorpay_payment_id'] == 'pay_123'
+
+
+def test_cancellation_requests_are_a_keyed_set(sqlite_db):
+    """Test requesting, listing and approving cancellations without touching other orders"""
+    for order_id in (1, 2, 3):
+        firebase_db.add_order('cx_seller', {'order_id': order_id, 'buyer_phone': '111', 'total_amount': 10 * order_id,
+                                            'order_status': 'Pending', 'payment_status': 'Paid' if order_id == 2 else 'Unpaid'})
+    sqlite_db.reference('sellers/cx_seller/cancellation').set([3])
+
+    assert firebase_db.request_order_cancellation(2, seller_id='cx_seller')['success'] is True
+    assert firebase_db.request_order_cancellation(2, seller_id='cx_seller').get('already_requested') is True
+    with patch('firebase_db.get_orders', wraps=firebase_db.get_orders) as get_orders:
+        assert [o['order_id'] for o in firebase_db.get_cancellation_requests('cx_seller')] == [2, 3]
+    get_orders.assert_called_once()
+
+    assert firebase_db.approve_cancellation_request('cx_seller', 2)['success'] is True
+    assert firebase_db.reject_cancellation_request('cx_seller', 3)['success'] is True
+    assert firebase_db.get_cancellation_requests('cx_seller') == []
+    assert [o['order_id'] for o in firebase_db.load_orders('cx_seller')] == [1, 3]
+    assert firebase_db.get_order_stats('cx_seller') == {
+        'total': 2, 'order_status': {'Pending': 2}, 'payment_status': {'Unpaid': 2}
+    }
@@ -0,0 +1,81 @@
+import pytest
+import time
+import outbound
+import requests
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+from unittest.mock import MagicMock, patch
+
+
+def _response(status, headers=None):
+    response = MagicMock(status_code=status, headers=headers or {})
+    return response
+
+
+def test_token_bucket_paces_after_burst():
+    """Test the bucket allows a burst, then reports the wait for the next token"""
+    bucket = outbound.TokenBucket(rate=10, burst=2)
+    assert bucket.take() == 0
+    assert bucket.take() == 0
+    assert 0 < bucket.take() <= 0.1
+
+
+def test_retries_429_then_delivers():
+    """Test a throttled send is retried after Retry-After and resolves with the final response"""
+    dispatcher = outbound.OutboundDispatcher(workers=1, rate=100, burst=10, max_attempts=3)
+    refused = requests.exceptions.ConnectionError(MaxRetryError(None, '/messages', NewConnectionError(None, 'refused')))
+    send = MagicMock(side_effect=[_response(429, {'Retry-After': '0'}), refused, _response(200)])
+    dispatcher.start()
+    with patch('outbound.random.uniform', return_value=0):
+        result = dispatcher.submit('pn1', send).result(timeout=5)
+    dispatcher.stop()
+
+    assert result.status_code == 200
+    assert send.call_count == 3
+    stats = dispatcher.stats()
+    assert stats['sent'] == 1 and stats['retried'] == 2
+
+
+def test_sends_that_may_have_arrived_are_not_retried():
+    """Test a 5xx or read timeout is final so the buyer never gets a message twice"""
+    dispatcher = outbound.OutboundDispatcher(workers=1, rate=100, burst=10, max_attempts=3)
+    dispatcher.start()
+    server_error = MagicMock(return_value=_response(503))
+    read_timeout = MagicMock(side_effect=requests.exceptions.ReadTimeout('read timed out'))
+    assert dispatcher.submit('pn1', server_error).result(timeout=5).status_code == 503
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        dispatcher.submit('pn1', read_timeout).result(timeout=5)
+    dispatcher.stop()
+
+    assert server_error.call_count == 1 and read_timeout.call_count == 1
+    stats = dispatcher.stats()
+    assert stats['failed'] == 2 and stats['retried'] == 0
+
+
+def test_replies_jump_ahead_of_notices():
+    """Test the reply lane is served before queued notices"""
+    dispatcher = outbound.OutboundDispatcher(workers=1, rate=1000, burst=100)
+    order = []
+    notices = [dispatcher.submit('pn1', lambda n=n: order.append(f'notice{n}') or _response(200), outbound.PRIORITY_NOTICE)
+               for n in range(3)]
+    reply = dispatcher.submit('pn1', lambda: order.append('reply') or _response(200), outbound.PRIORITY_REPLY)
+    dispatcher.start()
+    reply.result(timeout=5)
+    for future in notices:
+        future.result(timeout=5)
+    dispatcher.stop()
+
+    assert order[0] == 'reply'
+
+
+def test_numbers_are_rate_limited_independently():
+    """Test one number's exhausted bucket does not hold back another number"""
+    dispatcher = outbound.OutboundDispatcher(workers=2, rate=1, burst=1)
+    dispatcher.start()
+    dispatcher.submit('busy', lambda: _response(200)).result(timeout=5)
+    held = dispatcher.submit('busy', lambda: _response(200))
+
+    started = time.monotonic()
+    dispatcher.submit('other', lambda: _response(200)).result(timeout=5)
+    assert time.monotonic() - started < 0.5
+    assert not held.done()
+    dispatcher.stop()
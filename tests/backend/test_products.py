@@ -0,0 +1,23 @@
+import firebase_db
+
+
+def test_products_are_written_one_child_at_a_time(sqlite_db):
+    """Test legacy product lists are keyed on first write and IDs come from the counter"""
+    sqlite_db.reference('sellers/s1/products').set([{'id': 1, 'title': 'Tea'}, {'id': 4, 'title': 'Jam'}])
+
+    assert firebase_db.allocate_product_id('s1') == 5
+    assert firebase_db.add_product('s1', {'id': 5, 'title': 'Honey'})
+    assert set(sqlite_db.reference('sellers/s1/products').get(shallow=True)) == {'product_1', 'product_4', 'product_5'}
+
+    assert firebase_db.update_product_fields('s1', 4, {'price': 120.0}) == {'id': 4, 'title': 'Jam', 'price': 120.0}
+    assert firebase_db.update_product_fields('s1', 9, {'price': 1.0}) is None
+    assert firebase_db.delete_product('s1', 1)
+    assert [p['id'] for p in firebase_db.load_products('s1')] == [4, 5]
+
+    # Deleting the newest product never lets its ID be reused
+    assert firebase_db.delete_product('s1', 5)
+    assert firebase_db.allocate_product_id('s1') == 6
+
+    assert firebase_db.update_company_info_fields('s1', {'upi_id': 'shop@upi'})
+    assert firebase_db.update_company_info_fields('s1', {'city': 'Pune'})
+    assert firebase_db.load_company_info('s1') == {'upi_id': 'shop@upi', 'city': 'Pune'}
@@ -0,0 +1,97 @@
+import pytest
+import firebase_db
+import resilience
+from unittest.mock import patch, MagicMock
+from firebase_admin import exceptions as firebase_exceptions
+
+
+def _unavailable():
+    return firebase_exceptions.UnavailableError('rtdb unavailable')
+
+
+@pytest.fixture(autouse=True)
+def fresh_state():
+    resilience.metrics.reset()
+    with patch('resilience.time.sleep'), patch('firebase_db.initialize_firebase'):
+        yield
+
+
+def test_reads_retry_transient_errors():
+    """Test idempotent calls are retried and counted, writes are not"""
+    breaker = resilience.CircuitBreaker('test', threshold=10)
+    read = MagicMock(side_effect=[_unavailable(), {'ok': True}])
+    assert resilience.call('get test', read, idempotent=True, breaker=breaker) == {'ok': True}
+    assert read.call_count == 2
+
+    write = MagicMock(side_effect=_unavailable())
+    with pytest.raises(firebase_exceptions.UnavailableError):
+        resilience.call('set test', write, breaker=breaker)
+    assert write.call_count == 1
+
+    ops = resilience.metrics.snapshot()
+    assert ops['get test']['calls'] == 2 and ops['get test']['retries'] == 1
+    assert ops['set test']['errors'] == 1
+
+
+def test_breaker_opens_then_probes():
+    """Test the circuit fails fast once open and closes after a successful probe"""
+    breaker = resilience.CircuitBreaker('test', threshold=2, reset_seconds=60)
+    failing = MagicMock(side_effect=_unavailable())
+    for _ in range(2):
+        with pytest.raises(firebase_exceptions.UnavailableError):
+            resilience.call('get test', failing, breaker=breaker)
+
+    with pytest.raises(resilience.CircuitOpenError):
+        resilience.call('get test', failing, breaker=breaker)
+    assert failing.call_count == 2
+    assert resilience.metrics.snapshot()['get test']['short_circuited'] == 1
+
+    breaker.reset_seconds = 0
+    assert resilience.call('get test', lambda: 'up', breaker=breaker) == 'up'
+    assert breaker.state == 'closed'
+
+
+def test_tenant_config_served_stale_while_firebase_fails():
+    """Test cached credentials outlive their TTL when the database is failing"""
+    with patch('firebase_db.db.reference') as mock_ref:
+        mock_ref.return_value.get.return_value = {'access_token': 'tok'}
+        assert firebase_db.get_whatsapp_credentials('stale_seller')['access_token'] == 'tok'
+
+        firebase_db._tenant_config.ttl = 0
+        mock_ref.return_value.get.side_effect = resilience.CircuitOpenError('open')
+        try:
+            assert firebase_db.get_whatsapp_credentials('stale_seller')['access_token'] == 'tok'
+        finally:
+            firebase_db._tenant_config.ttl = firebase_db.TENANT_CONFIG_TTL_SECONDS
+
+
+def test_requests_are_cut_to_the_time_left():
+    """Test HTTP timeouts inside a call never outlive its deadline, and time_limit tightens it"""
+    seen = []
+
+    def request():
+        seen.append(resilience.cap_timeout(resilience.FIREBASE_HTTP_TIMEOUT))
+        return 'ok'
+
+    breaker = resilience.CircuitBreaker('test')
+    assert resilience.call('get test', request, idempotent=True, deadline=2, breaker=breaker) == 'ok'
+    with resilience.time_limit(0.5):
+        resilience.call('set test', request, breaker=breaker)
+    assert 1 < seen[0] <= 2 and 0 < seen[1] <= 0.5
+    assert resilience.cap_timeout((3, 30)) == (3, 30)
+    assert resilience.time_left() is None
+
+    with resilience.time_limit(0):
+        with pytest.raises(resilience.DeadlineExceeded):
+            resilience.call('get test', request, idempotent=True, breaker=breaker)
+    assert len(seen) == 2
+
+
+def test_deadline_adapter_caps_sdk_requests():
+    """Test the adapter wrapping the SDK session passes the capped timeout down"""
+    inner = MagicMock()
+    adapter = resilience.DeadlineAdapter(inner)
+    with resilience.time_limit(1):
+        adapter.send('request', timeout=(5, 10))
+    connect, read = inner.send.call_args[1]['timeout']
+    assert 0 < connect <= 1 and 0 < read <= 1
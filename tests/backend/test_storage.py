@@ -0,0 +1,167 @@
+import firebase_db
+import storage_backend
+
+
+def test_set_get_round_trip(backend):
+    """Test that nested values, lists and scalar types survive a round trip"""
+    ref = backend.reference('sellers/acme')
+    ref.set({
+        'company_info': {'name': 'Acme', 'upi': None},
+        'products': [{'id': 1, 'price': 9.5, 'active': True}],
+        'empty': {}
+    })
+
+    assert ref.get() == {
+        'company_info': {'name': 'Acme'},
+        'products': [{'id': 1, 'price': 9.5, 'active': True}]
+    }
+    assert backend.reference('sellers/acme/company_info/name').get() == 'Acme'
+    assert backend.reference('sellers/acme').get(shallow=True) == {'company_info': True, 'products': True}
+    # Scalar children come back as their value, like the Realtime Database
+    assert backend.reference('sellers/acme/company_info').get(shallow=True) == {'name': 'Acme'}
+
+
+def test_sparse_integer_keys_stay_a_map(backend):
+    """Test that arrays are rebuilt with the Realtime Database's density rule"""
+    backend.reference('a').set({'1': 'x', '2': 'y'})
+    backend.reference('b').set({'1': 'x', '9': 'y'})
+
+    assert backend.reference('a').get() == [None, 'x', 'y']
+    assert backend.reference('b').get() == {'1': 'x', '9': 'y'}
+
+
+def test_update_delete_and_sibling_prefixes(backend):
+    """Test multi-path updates and that deletes do not touch siblings sharing a prefix"""
+    backend.reference().update({
+        'orders/order_1': {'order_id': 1},
+        'orders/order_10': {'order_id': 10},
+        'index/1': 'acme'
+    })
+    backend.reference('orders/order_1').delete()
+
+    assert backend.reference('orders').get() == {'order_10': {'order_id': 10}}
+    assert backend.reference('index').get() == {'1': 'acme'}
+
+
+def test_transaction_and_conditional_set(backend):
+    """Test transactions and etag-conditional writes"""
+    counter = backend.reference('counters/seq')
+    assert counter.transaction(lambda current: (current or 0) + 5) == 5
+    assert counter.transaction(lambda current: (current or 0) + 5) == 10
+
+    claim = backend.reference('claims/m1')
+    assert claim.set_if_unchanged(storage_backend.NULL_ETAG, 1)[0] is True
+    assert claim.set_if_unchanged(storage_backend.NULL_ETAG, 2)[0] is False
+    assert claim.get() == 1
+
+
+def test_push_and_ordered_queries(backend):
+    """Test push keys keep insertion order and child queries sort and limit server-side"""
+    log = backend.reference('log')
+    keys = [log.push({'timestamp': ts, 'text': str(ts)}).key for ts in (30, 10, 20)]
+
+    assert sorted(keys) == keys
+    assert list(log.order_by_child('timestamp').limit_to_last(2).get().values()) == [
+        {'timestamp': 20, 'text': '20'},
+        {'timestamp': 30, 'text': '30'}
+    ]
+    assert list(log.order_by_child('timestamp').equal_to(10).get().values()) == [
+        {'timestamp': 10, 'text': '10'}
+    ]
+
+
+def test_ordered_queries_read_only_the_page(backend):
+    """Test field queries are index ranges in SQL and match RTDB ordering around missing fields"""
+    orders = backend.reference('sellers/acme/orders')
+    orders.set({f'order_{i}': {'idx_created': f'2026-01-{i:02d}', 'paid': i % 2 == 0} for i in range(1, 8)})
+    orders.child('order_0').set({'note': 'no listing field'})
+    backend.reference('sellers/other/orders/order_1').set({'idx_created': '2026-01-09'})
+
+    page = orders.order_by_child('idx_created').start_at('2026-01-02').end_at('2026-01-06').limit_to_last(2)
+    query, params = page._field_query(['sellers', 'acme', 'orders'], 'path', page._start, page._end, True, 2)
+    [plan] = backend._conn.execute('EXPLAIN QUERY PLAN ' + query, params).fetchall()
+    assert 'USING COVERING INDEX idx_nodes_children' in plan[-1]
+    assert list(page.get()) == ['order_5', 'order_6']
+
+    assert list(orders.order_by_child('idx_created').limit_to_last(3).get()) == ['order_5', 'order_6', 'order_7']
+    # Children without the field sort first, as in the Realtime Database
+    assert list(orders.order_by_child('idx_created').limit_to_first(2).get()) == ['order_0', 'order_1']
+    assert list(orders.order_by_child('idx_created').limit_to_last(10).get())[0] == 'order_0'
+    assert list(orders.order_by_child('paid').equal_to(True).get()) == ['order_2', 'order_4', 'order_6']
+
+
+def test_old_layout_is_upgraded(tmp_path):
+    """Test a database written with seller/depth columns gains the container column and loses the old indexes"""
+    import sqlite3
+    path = str(tmp_path / 'old.db')
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE nodes (path TEXT PRIMARY KEY, seller TEXT, key TEXT NOT NULL,
+                            depth INTEGER NOT NULL, vtype TEXT NOT NULL, value);
+        CREATE INDEX idx_nodes_seller ON nodes(seller);
+        CREATE INDEX idx_nodes_child ON nodes(key, depth, value);
+        INSERT INTO nodes VALUES ('sellers/acme/orders/order_1/order_id', 'acme', 'order_id', 5, 'n', 1);
+    """)
+    conn.close()
+
+    backend = storage_backend.SQLiteBackend(path)
+    try:
+        columns = [row[1] for row in backend._conn.execute('PRAGMA table_info(nodes)')]
+        indexes = [row[1] for row in backend._conn.execute('PRAGMA index_list(nodes)') if row[1].startswith('idx_')]
+        assert columns == ['path', 'key', 'vtype', 'value', 'container']
+        assert indexes == ['idx_nodes_children']
+        orders = backend.reference('sellers/acme/orders')
+        assert orders.order_by_child('order_id').equal_to(1).get() == {'order_1': {'order_id': 1}}
+    finally:
+        backend.close()
+
+
+def test_listeners_receive_snapshot_then_changes(backend):
+    """Test local listeners get the initial snapshot and every committed change under their path"""
+    backend.reference('sellers/acme').set({'company_info': {'name': 'Acme'}})
+    events = []
+    registration = backend.reference('sellers/acme').listen(lambda e: events.append((e.event_type, e.path, e.data)))
+
+    backend.reference('sellers/acme/company_info/name').set('Acme Ltd')
+    backend.reference().update({'sellers/acme/orders/order_1': {'order_id': 1}, 'sellers/other/x': 1})
+    backend.reference('sellers').update({'acme': {'fresh': True}})
+    registration.close()
+    backend.reference('sellers/acme/fresh').delete()
+
+    assert events == [
+        ('put', '/', {'company_info': {'name': 'Acme'}}),
+        ('put', '/company_info/name', 'Acme Ltd'),
+        ('put', '/orders/order_1', {'order_id': 1}),
+        ('put', '/', {'fresh': True})
+    ]
+
+
+def test_seller_mirror_runs_on_sqlite(sqlite_db):
+    """Test the seller mirror syncs from and follows the SQLite backend"""
+    sqlite_db.reference('sellers/mirrored/company_info').set({'name': 'Acme'})
+    mirror = firebase_db.SellerMirror(sync_timeout=1)
+    try:
+        assert mirror.get('mirrored') == (True, {'company_info': {'name': 'Acme'}})
+        sqlite_db.reference('sellers/mirrored/company_info/name').set('Acme Ltd')
+        assert mirror.peek('mirrored', 'company_info') == (True, {'name': 'Acme Ltd'})
+    finally:
+        mirror.clear()
+
+
+def test_narrow_loaders_read_only_their_subtree(sqlite_db):
+    """Test field-scoped loaders and server-side order filters"""
+    sqlite_db.reference('sellers/narrow_seller').set({
+        'company_info': {'company_name': 'Narrow'},
+        'products': [{'id': 1, 'title': 'Tea'}],
+        'orders': {
+            'order_1': {'order_id': 1, 'order_status': 'Received', 'buyer_phone': '111'},
+            'order_2': {'order_id': 2, 'order_status': 'Delivered', 'buyer_phone': '222'}
+        },
+        'conv_history': {'111': {'m1': {'timestamp': 1, 'role': 'user', 'content': 'hi'}}}
+    })
+
+    assert firebase_db.load_company_info('narrow_seller') == {'company_name': 'Narrow'}
+    assert firebase_db.load_products('narrow_seller') == [{'id': 1, 'title': 'Tea'}]
+    assert [o['order_id'] for o in firebase_db.load_orders('narrow_seller', order_status='Delivered')] == [2]
+    assert [o['order_id'] for o in firebase_db.load_orders('narrow_seller', buyer_phone='111')] == [1]
+    assert sorted(firebase_db.list_seller_keys('narrow_seller')) == ['company_info', 'conv_history', 'orders', 'products']
@@ -0,0 +1,63 @@
+import firebase_db
+from unittest.mock import patch
+
+
+def test_tenant_config_is_cached_and_invalidated_on_save(sqlite_db):
+    """Test warm tenant lookups skip the backend and saves invalidate them"""
+    firebase_db.save_whatsapp_credentials('tenant_seller', 'pn1', 'ba1', 'tok', 'verify')
+    assert firebase_db.get_seller_by_phone_number_id('pn1') == 'tenant_seller'
+    assert firebase_db.get_whatsapp_credentials('tenant_seller')['access_token'] == 'tok'
+
+    with patch.object(sqlite_db, 'reference', side_effect=AssertionError('backend hit')):
+        assert firebase_db.get_seller_by_phone_number_id('pn1') == 'tenant_seller'
+        assert firebase_db.get_whatsapp_credentials('tenant_seller')['access_token'] == 'tok'
+
+    firebase_db.save_whatsapp_credentials('tenant_seller', 'pn1', 'ba1', 'tok2', 'verify')
+    assert firebase_db.get_whatsapp_credentials('tenant_seller')['access_token'] == 'tok2'
+
+    # Switching numbers and tokens drops the old mappings
+    firebase_db.save_whatsapp_credentials('tenant_seller', 'pn2', 'ba1', 'tok2', 'verify2')
+    assert firebase_db.get_seller_by_phone_number_id('pn1') is None
+    assert firebase_db.get_seller_by_phone_number_id('pn2') == 'tenant_seller'
+    assert sqlite_db.reference('numbers').get() == {'pn2': 'tenant_seller'}
+    assert firebase_db.get_seller_by_verify_token('verify') is None
+    assert list(sqlite_db.reference('verify_tokens').get()) == [firebase_db._verify_token_key('verify2')]
+
+    firebase_db.save_workflow_config('tenant_seller', {'auto_confirm': True})
+    assert firebase_db.get_workflow_config('tenant_seller') == {'auto_confirm': True}
+    firebase_db.save_workflow_config('tenant_seller', {'auto_confirm': False})
+    assert firebase_db.get_workflow_config('tenant_seller') == {'auto_confirm': False}
+
+
+def test_verify_tokens_match_exactly(sqlite_db):
+    """Test that tokens differing only in unsafe key characters resolve to their own sellers"""
+    firebase_db.save_whatsapp_credentials('seller_a', 'pna', 'ba', 'ta', 'tok.x')
+    firebase_db.save_whatsapp_credentials('seller_b', 'pnb', 'bb', 'tb', 'tok#x')
+    # Mapping written before tokens were hashed, pointing at the wrong seller
+    sqlite_db.reference('verify_tokens/tok_x').set('seller_b')
+
+    assert firebase_db.get_seller_by_verify_token('tok.x') == 'seller_a'
+    assert firebase_db.get_seller_by_verify_token('tok#x') == 'seller_b'
+    assert firebase_db.get_seller_by_verify_token('tok_x') is None
+
+
+def test_cold_data_migration_and_dual_read(sqlite_db):
+    """Test that conversations and credentials move out of the seller node and stay readable"""
+    sqlite_db.reference('sellers/cold_seller').set({
+        'company_info': {'company_name': 'Cold'},
+        'conv_history': {'111': {'m1': {'timestamp': 1, 'role': 'user', 'content': 'old'}}},
+        'what_creds': {'phone_number_id': 'pn1', 'verify_token': 'tok.1'}
+    })
+
+    # Before migration: new message goes to the new root, history merges both
+    firebase_db.save_conversation_message('cold_seller', '111', 'assistant', 'new')
+    assert [m['content'] for m in firebase_db.get_conversation_history('cold_seller', '111')] == ['old', 'new']
+    assert firebase_db.get_whatsapp_credentials('cold_seller')['phone_number_id'] == 'pn1'
+    assert firebase_db.get_seller_by_verify_token('tok.1') == 'cold_seller'
+
+    assert firebase_db.migrate_seller_cold_data('cold_seller') == {'conversations': 1, 'credentials': ['whatsapp']}
+
+    assert firebase_db.list_seller_keys('cold_seller') == ['company_info']
+    assert [m['content'] for m in firebase_db.get_conversation_history('cold_seller', '111')] == ['old', 'new']
+    assert firebase_db.get_whatsapp_credentials('cold_seller')['phone_number_id'] == 'pn1'
+    assert sqlite_db.reference(f'verify_tokens/{firebase_db._verify_token_key("tok.1")}').get() == 'cold_seller'
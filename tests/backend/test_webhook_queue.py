@@ -0,0 +1,219 @@
+import threading
+import webhook_queue
+from unittest.mock import patch
+
+
+def test_sqlite_queue_survives_reopen_and_releases_expired_leases(tmp_path):
+    """Test queued jobs persist across instances and an unacked job is redelivered"""
+    path = str(tmp_path / 'queue.db')
+    webhook_queue.SQLiteQueue(path).put({'n': 1})
+    webhook_queue.SQLiteQueue(path).put({'n': 2})
+
+    q = webhook_queue.SQLiteQueue(path, lease_seconds=0.05)
+    token, job = q.get(timeout=0)
+    assert job == {'n': 1}
+    assert q.get(timeout=0)[1] == {'n': 2}
+    assert q.get(timeout=0) is None
+
+    # Job 1 was never acked: once its lease expires another worker gets it
+    redelivered = q.get(timeout=1)
+    assert redelivered[1] == {'n': 1}
+    q.ack(redelivered[0])
+    assert q.size() == 1
+
+
+def test_webhook_acks_before_processing(tmp_path):
+    """Test the webhook returns 200 with the message queued, and a worker processes it"""
+    from app import app
+    import whatsapp_msg
+
+    done = threading.Event()
+    handled = []
+
+    def handler(job):
+        handled.append(job)
+        done.set()
+
+    payload = {
+        'object': 'whatsapp_business_account',
+        'entry': [{'changes': [{'value': {
+            'metadata': {'phone_number_id': 'pn1'},
+            'messages': [{'id': 'wamid.1', 'from': '111', 'type': 'text', 'text': {'body': 'hi'}}]
+        }}]}]
+    }
+
+    webhook_queue.set_queue(webhook_queue.SQLiteQueue(str(tmp_path / 'q.db')))
+    try:
+        with patch('whatsapp_msg.handle_webhook_job', side_effect=handler), \
+             patch('webhook_queue.start_workers') as start_workers:
+            response = app.test_client().post('/webhook', json=payload)
+            assert response.status_code == 200
+            assert handled == []
+            assert webhook_queue.get_queue().size() == 1
+
+            pool = webhook_queue.WorkerPool(webhook_queue.get_queue(), start_workers.call_args[0][0], workers=1)
+            pool.start()
+            assert done.wait(5)
+            pool.stop()
+    finally:
+        webhook_queue.set_queue(None)
+
+    assert handled[0]['phone_number_id'] == 'pn1'
+    assert handled[0]['message']['id'] == 'wamid.1'
+    assert pool.stats()['processed'] == 1
+
+
+def test_same_conversation_runs_in_order_while_others_run_in_parallel():
+    """Test keyed jobs never overlap per key but different keys overlap"""
+    running = {}
+    order = []
+    overlap = []
+    lock = threading.Lock()
+    both_started = threading.Barrier(2, timeout=5)
+
+    def handler(job):
+        with lock:
+            if running.get(job['key']):
+                overlap.append(job)
+            running[job['key']] = True
+        if job['n'] == 0:
+            both_started.wait()  # conversation a and b are in flight together
+        with lock:
+            order.append((job['key'], job['n']))
+            running[job['key']] = False
+
+    q = webhook_queue.LocalQueue()
+    q.put({'key': 'a', 'n': 0})
+    for n in (1, 2, 3):
+        q.put({'key': 'a', 'n': n})
+    q.put({'key': 'b', 'n': 0})
+
+    pool = webhook_queue.WorkerPool(q, handler, workers=3)
+    pool.start()
+    deadline = threading.Event()
+    for _ in range(100):
+        if len(order) == 5:
+            break
+        deadline.wait(0.05)
+    pool.stop()
+
+    assert overlap == []
+    assert [n for key, n in order if key == 'a'] == [0, 1, 2, 3]
+    assert ('b', 0) in order
+
+
+def test_sqlite_queue_holds_back_a_busy_conversation(tmp_path):
+    """Test the durable queue does not lease a second job for a conversation in flight"""
+    q = webhook_queue.SQLiteQueue(str(tmp_path / 'keys.db'))
+    q.put({'key': 'a', 'n': 1})
+    q.put({'key': 'a', 'n': 2})
+    q.put({'key': 'b', 'n': 1})
+
+    first = q.get(timeout=0)
+    assert first[1] == {'key': 'a', 'n': 1}
+    assert q.get(timeout=0)[1] == {'key': 'b', 'n': 1}
+    assert q.get(timeout=0) is None
+
+    q.ack(first[0])
+    assert q.get(timeout=0)[1] == {'key': 'a', 'n': 2}
+
+
+def _wait_for(predicate, timeout=5):
+    done = threading.Event()
+    for _ in range(int(timeout / 0.05)):
+        if predicate():
+            return True
+        done.wait(0.05)
+    return predicate()
+
+
+def test_burst_of_texts_becomes_one_turn(tmp_path):
+    """Test a text burst is merged into one job and a media message ends the burst"""
+    from whatsapp_msg import merge_webhook_jobs
+
+    handled = []
+    q = webhook_queue.SQLiteQueue(str(tmp_path / 'burst.db'))
+    for n, body in enumerate(['hi', 'I want apples', '2kg']):
+        q.put({'key': 'a', 'coalesce': True, 'message': {'id': f'm{n}', 'type': 'text', 'text': {'body': body}}})
+    q.put({'key': 'a', 'coalesce': False, 'message': {'id': 'm3', 'type': 'image'}})
+
+    pool = webhook_queue.WorkerPool(q, handled.append, workers=2, coalesce=merge_webhook_jobs,
+                                    coalesce_window=0.2, coalesce_max_wait=2)
+    pool.start()
+    assert _wait_for(lambda: len(handled) == 2)
+    pool.stop()
+
+    assert [m['text']['body'] for m in handled[0]['messages']] == ['hi', 'I want apples', '2kg']
+    assert handled[1]['message']['id'] == 'm3'
+    assert pool.stats()['coalesced'] == 2
+    assert q.size() == 0
+
+
+def test_merged_job_claims_each_message_and_replies_once():
+    """Test a merged job sends the burst to the agent as one turn with one reply"""
+    import whatsapp_msg
+
+    job = whatsapp_msg.merge_webhook_jobs([
+        {'phone_number_id': 'pn1', 'message': {'id': 'm1', 'from': '111', 'type': 'text', 'text': {'body': 'hi'}}},
+        {'phone_number_id': 'pn1', 'message': {'id': 'm2', 'from': '111', 'type': 'text', 'text': {'body': '2kg apples'}}}
+    ])
+    with patch('firebase_db.get_seller_by_phone_number_id', return_value='seller'), \
+         patch('firebase_db.get_whatsapp_credentials', return_value={'access_token': 't'}), \
+         patch('firebase_db.claim_message', side_effect=lambda msg_id, ts: msg_id != 'm1'), \
+         patch('whatsapp_msg.process_whatsapp_message', return_value='ok') as process, \
+         patch('whatsapp_msg.send_whatsapp_message') as send:
+        whatsapp_msg.handle_webhook_job(job)
+
+    # m1 was already claimed by an earlier delivery, so only m2 reaches the agent
+    process.assert_called_once_with('111', '2kg apples', 'seller')
+    send.assert_called_once()
+
+
+def test_worker_survives_queue_and_merge_errors():
+    """Test a failing queue read or merge neither kills the worker nor leaves its key held"""
+    handled = []
+    q = webhook_queue.LocalQueue()
+    real_get = q.get
+    reads = []
+
+    def flaky_get(timeout=1.0):
+        reads.append(timeout)
+        if len(reads) == 1:
+            raise RuntimeError('queue unavailable')
+        return real_get(timeout)
+
+    def broken_merge(jobs):
+        raise ValueError('cannot merge')
+
+    q.get = flaky_get
+    for n in range(2):
+        q.put({'key': 'a', 'coalesce': True, 'n': n})
+
+    pool = webhook_queue.WorkerPool(q, handled.append, workers=1, coalesce=broken_merge,
+                                    coalesce_window=0.1, coalesce_max_wait=1)
+    pool.start()
+    assert _wait_for(lambda: len(handled) == 2)
+    q.put({'key': 'a', 'n': 2})
+    assert _wait_for(lambda: len(handled) == 3)
+    pool.stop()
+
+    assert [job['n'] for job in handled] == [0, 1, 2]
+    assert pool.stats()['active_keys'] == 0
+
+
+def test_single_worker_merges_a_burst_from_the_local_queue():
+    """Test the gathering worker takes the rest of a burst itself when no other worker reads the queue"""
+    handled = []
+    q = webhook_queue.LocalQueue()
+    q.put({'key': 'a', 'coalesce': True, 'n': 0})
+    q.put({'key': 'b', 'n': 0})
+    q.put({'key': 'a', 'coalesce': True, 'n': 1})
+
+    pool = webhook_queue.WorkerPool(q, handled.append, workers=1, coalesce=lambda jobs: {'merged': [j['n'] for j in jobs]},
+                                    coalesce_window=0.1, coalesce_max_wait=1)
+    pool.start()
+    assert _wait_for(lambda: len(handled) == 2)
+    pool.stop()
+
+    assert handled == [{'merged': [0, 1]}, {'key': 'b', 'n': 0}]
+    assert pool.stats()['coalesced'] == 1
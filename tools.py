@@ -18,18 +18,24 @@ try:
         save_buyers_data,
         load_seller_data,
         save_seller_data,
+        load_company_info,
+        load_products,
         get_buyer,
         update_buyer,
         add_buyer_order,
         update_buyer_cart,
         add_order,
+        allocate_order_id,
         request_order_cancellation,
         # New customer functions for seller-specific data
         get_customer,
         update_customer,
         get_customer_cart,
         update_customer_cart,
-        add_customer_order_ref
+        add_customer_order_ref,
+        get_order,
+        orders_to_list,
+        WriteBatch
     )
     FIREBASE_ENABLED = True
 except ImportError:
@@ -57,6 +63,22 @@ def load_sample_data(seller_id=None):
             return None
 
 
+def load_seller_company_info(seller_id=None):
+    """Load only the seller's company info (Firebase or JSON fallback)"""
+    if FIREBASE_ENABLED:
+        return load_company_info(seller_id)
+    data = load_sample_data(seller_id) or {}
+    return data.get('company_info') or {}
+
+
+def load_seller_products(seller_id=None):
+    """Load only the seller's products (Firebase or JSON fallback)"""
+    if FIREBASE_ENABLED:
+        return load_products(seller_id)
+    data = load_sample_data(seller_id) or {}
+    return data.get('products') or []
+
+
 # Load buyers data function is imported from firebase_db if available
 if not FIREBASE_ENABLED:
     def load_buyers_data():
@@ -96,13 +118,11 @@ def get_company_info(seller_id=None):
     Returns:
         dict: Company information including name and description
     """
-    data = load_sample_data(seller_id)
+    company = load_seller_company_info(seller_id)
     
-    if not data or not data.get('company_info'):
+    if not company:
         return {"error": "No company information found"}
     
-    company = data['company_info']
-    
     return {
         "company_name": company.get('company_name', ''),
         "company_description": company.get('company_description', ''),
@@ -123,13 +143,13 @@ def get_product_catalog(seller_id=None):
     Returns:
         list: List of products with id, title, description, and price
     """
-    data = load_sample_data(seller_id)
+    seller_products = load_seller_products(seller_id)
     
-    if not data or not data.get('products'):
+    if not seller_products:
         return {"error": "No products found"}
     
     products = []
-    for product in data['products']:
+    for product in seller_products:
         products.append({
             "product_id": product.get('id'),
             "title": product.get('title', ''),
@@ -152,12 +172,12 @@ def get_product_by_id(product_id: int, seller_id=None):
     Returns:
         dict: Product information or error message
     """
-    data = load_sample_data(seller_id)
+    products = load_seller_products(seller_id)
     
-    if not data or not data.get('products'):
+    if not products:
         return {"error": "No products found"}
     
-    for product in data['products']:
+    for product in products:
         if product.get('id') == product_id:
             return {
                 "product_id": product.get('id'),
@@ -360,9 +380,8 @@ def add_to_cart(phone_number: str, product_id: int, quantity: int, seller_id=Non
         dict: Success status and cart info
     """
     # Get product details
-    seller_data = load_sample_data(seller_id)
     product = None
-    for p in seller_data.get('products', []):
+    for p in load_seller_products(seller_id):
         if p.get('id') == product_id:
             product = p
             break
@@ -694,13 +713,10 @@ def place_order(buyer_phone: str, delivery_address: str, delivery_lat: float, de
         if not cart:
             return {"error": "Cart is empty. Please add items to cart first."}
         
-        # Load seller data for order ID generation
-        seller_data = load_sample_data(seller_id)
-        if not seller_data:
-            return {"error": "Unable to load seller data"}
-        
-        # Generate order ID
-        order_id = len(seller_data.get('orders', [])) + 1
+        # Generate order ID from the seller's order counter
+        order_id = allocate_order_id(seller_id)
+        if order_id is None:
+            return {"error": "Unable to generate order ID. Please try again."}
         
         # Create timestamp
         timestamp = datetime.now().isoformat()
@@ -724,20 +740,19 @@ def place_order(buyer_phone: str, delivery_address: str, delivery_lat: float, de
             "total_amount": total_amount
         }
         
-        # Save order to seller
-        if not add_order(seller_id, order):
+        # Save the order, the customer's reference to it and the emptied cart
+        # together in a single multi-path write
+        batch = WriteBatch()
+        queued = add_order(seller_id, order, batch=batch)
+        if queued:
+            add_customer_order_ref(seller_id, buyer_phone, {'seller_id': seller_id, 'order_id': order_id}, batch=batch)
+            update_customer_cart(seller_id, buyer_phone, [], batch=batch)
+        if not queued or not batch.commit():
             return {
                 "error": "Order created but failed to save to seller DB",
                 "order_details": order
             }
         
-        # Add order reference to customer's orders using new function
-        order_ref = {'seller_id': seller_id, 'order_id': order_id}
-        add_customer_order_ref(seller_id, buyer_phone, order_ref)
-        
-        # Clear cart after successful order
-        update_customer_cart(seller_id, buyer_phone, [])
-        
         # Format item list for response
         items_summary = ", ".join([f"{item['quantity']}x {item['product_name']}" for item in cart])
         
@@ -837,14 +852,9 @@ def calculate_order_total(product_id: int, quantity: int, seller_id=None):
     Returns:
         dict: Price breakdown including unit price, quantity, and total
     """
-    data = load_sample_data(seller_id)
-    
-    if not data:
-        return {"error": "Unable to load data"}
-    
     # Find the product
     product = None
-    for p in data.get('products', []):
+    for p in load_seller_products(seller_id):
         if p.get('id') == product_id:
             product = p
             break
@@ -1082,7 +1092,8 @@ def get_tools_for_user(phone_number: str, seller_id: str):
                 return "No orders found for this number. Would you like to place your first order?"
             
             buyer_name = customer.get('name', 'there')
-            order_refs = customer.get('orders', [])
+            # References may be a legacy list or a map keyed by order
+            order_refs = orders_to_list(customer.get('orders'))
         else:
             # Fallback to old method
             buyers_data = load_buyers_data()
@@ -1106,11 +1117,17 @@ def get_tools_for_user(phone_number: str, seller_id: str):
                 # New reference format - fetch from seller
                 ref_seller_id = ref.get('seller_id')
                 order_id = ref.get('order_id')
-                seller_data = load_sample_data(ref_seller_id)
-                for order in seller_data.get('orders', []):
-                    if order and (order.get('order_id') == order_id or order.get('id') == order_id):
+                if FIREBASE_ENABLED:
+                    # Direct keyed read of the single order
+                    order = get_order(ref_seller_id, order_id)
+                    if order:
                         orders.append(order)
-                        break
+                else:
+                    seller_data = load_sample_data(ref_seller_id)
+                    for order in seller_data.get('orders', []):
+                        if order and (order.get('order_id') == order_id or order.get('id') == order_id):
+                            orders.append(order)
+                            break
             elif isinstance(ref, dict):
                 # Old format - full order object (backward compatibility)
                 orders.append(ref)
@@ -1162,8 +1179,8 @@ def get_tools_for_user(phone_number: str, seller_id: str):
             # Convert order_id to int
             order_id_int = int(order_id)
             
-            # Request cancellation
-            result = request_order_cancellation(order_id_int)
+            # Request cancellation (seller and buyer are known, so no index scan is needed)
+            result = request_order_cancellation(order_id_int, seller_id=seller_id, buyer_phone=phone_number)
             
             if result.get('success'):
                 return str({
@@ -0,0 +1,460 @@
+"""
+Webhook Queue
+Incoming WhatsApp webhook messages are enqueued here and acknowledged right
+away; a pool of background workers drains the queue and runs the agent
+pipeline. Two queue implementations share one interface:
+
+- LocalQueue: in-process deque. Fast, but jobs waiting in it are lost
+  if the process exits.
+- SQLiteQueue: durable queue in an SQLite file. Jobs survive restarts, and
+  workers in other processes (scripts/webhook_worker.py) can drain it.
+
+Jobs may carry a 'key' (one per seller/buyer conversation). Jobs with the
+same key run one at a time in queue order; different keys run in parallel.
+Keyed jobs marked 'coalesce' are debounced: the worker waits for the burst
+to settle and hands the merged jobs to the pool's coalesce function as one.
+"""
+
+from dotenv import load_dotenv
+load_dotenv()
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+
+import resilience
+
+
+WEBHOOK_ASYNC = os.environ.get('WEBHOOK_ASYNC', 'true').lower() == 'true'
+WEBHOOK_QUEUE = os.environ.get('WEBHOOK_QUEUE', 'local').lower()
+WEBHOOK_QUEUE_PATH = os.environ.get('WEBHOOK_QUEUE_PATH', os.path.join(os.path.dirname(__file__), 'webhook_queue.db'))
+# 'thread': this process runs the workers; 'external': only enqueue, scripts/webhook_worker.py drains
+WEBHOOK_WORKER_MODE = os.environ.get('WEBHOOK_WORKER_MODE', 'thread').lower()
+WEBHOOK_WORKERS = int(os.environ.get('WEBHOOK_WORKERS', '4'))
+# Seconds a job may be held by a worker before another worker may take it over
+WEBHOOK_LEASE_SECONDS = float(os.environ.get('WEBHOOK_LEASE_SECONDS', '300'))
+# Quiet period that ends a burst of coalescible jobs, and the longest a burst is held (0 disables)
+WEBHOOK_COALESCE_SECONDS = float(os.environ.get('WEBHOOK_COALESCE_SECONDS', '1.5'))
+WEBHOOK_COALESCE_MAX_SECONDS = float(os.environ.get('WEBHOOK_COALESCE_MAX_SECONDS', '5'))
+
+
+# ==================== QUEUES ====================
+
+class LocalQueue:
+    """In-process job queue"""
+
+    name = 'local'
+
+    def __init__(self):
+        self._jobs = deque()
+        self._cond = threading.Condition()
+
+    def put(self, job):
+        with self._cond:
+            self._jobs.append((uuid.uuid4().hex, job))
+            self._cond.notify()
+
+    def get(self, timeout=1.0):
+        """
+        Take the next job.
+
+        Returns:
+            tuple: (token, job), or None if the queue stayed empty for timeout seconds
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._jobs, timeout):
+                return None
+            return self._jobs.popleft()
+
+    def lease_key(self, key):
+        """
+        Take every queued job for key, oldest first. Used by the worker that
+        owns key to pick up the rest of a burst.
+
+        Returns:
+            list: (token, job) tuples
+        """
+        with self._cond:
+            taken = [item for item in self._jobs if item[1].get('key') == key]
+            if taken:
+                self._jobs = deque(item for item in self._jobs if item[1].get('key') != key)
+            return taken
+
+    def ack(self, token):
+        pass
+
+    def size(self):
+        with self._cond:
+            return len(self._jobs)
+
+
+class SQLiteQueue:
+    """
+    Durable job queue in an SQLite file.
+
+    get() leases the oldest available job; ack() deletes it. A job whose
+    worker died is handed out again once its lease expires. A keyed job is
+    not handed out while an earlier job with the same key is leased, which
+    keeps a conversation in order across worker processes.
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, path=WEBHOOK_QUEUE_PATH, lease_seconds=WEBHOOK_LEASE_SECONDS, poll_interval=0.05):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        conn = self._conn()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id           INTEGER PRIMARY KEY AUTOINCREMENT,
+                payload      TEXT NOT NULL,
+                leased_until REAL NOT NULL DEFAULT 0,
+                key          TEXT
+            )
+        """)
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(jobs)")]
+        if 'key' not in columns:
+            conn.execute("ALTER TABLE jobs ADD COLUMN key TEXT")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_lease ON jobs(leased_until, id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_key ON jobs(key, leased_until)")
+        conn.commit()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def put(self, job):
+        self._conn().execute("INSERT INTO jobs (payload, key) VALUES (?, ?)", (json.dumps(job), job.get('key')))
+
+    def _lease(self):
+        conn = self._conn()
+        now = time.time()
+        with self._lock:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                # Oldest job whose conversation has nothing in flight
+                row = conn.execute("""
+                    SELECT id, payload FROM jobs
+                    WHERE leased_until < :now
+                      AND (key IS NULL OR key NOT IN (
+                          SELECT key FROM jobs WHERE key IS NOT NULL AND leased_until >= :now
+                      ))
+                    ORDER BY id LIMIT 1
+                """, {'now': now}).fetchone()
+                if row is not None:
+                    conn.execute("UPDATE jobs SET leased_until = ? WHERE id = ?", (now + self.lease_seconds, row[0]))
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        return row
+
+    def get(self, timeout=1.0):
+        give_up_at = time.monotonic() + timeout
+        while True:
+            row = self._lease()
+            if row is not None:
+                return row[0], json.loads(row[1])
+            if time.monotonic() >= give_up_at:
+                return None
+            time.sleep(self.poll_interval)
+
+    def lease_key(self, key):
+        """
+        Lease every available job for key, oldest first. Used by the worker
+        that owns key to pick up the rest of a burst.
+
+        Returns:
+            list: (token, job) tuples
+        """
+        conn = self._conn()
+        now = time.time()
+        with self._lock:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                rows = conn.execute(
+                    "SELECT id, payload FROM jobs WHERE key = ? AND leased_until < ? ORDER BY id", (key, now)
+                ).fetchall()
+                conn.executemany(
+                    "UPDATE jobs SET leased_until = ? WHERE id = ?",
+                    [(now + self.lease_seconds, row[0]) for row in rows]
+                )
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        return [(row[0], json.loads(row[1])) for row in rows]
+
+    def ack(self, token):
+        self._conn().execute("DELETE FROM jobs WHERE id = ?", (token,))
+
+    def size(self):
+        return self._conn().execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+
+
+# ==================== WORKER POOL ====================
+
+class WorkerPool:
+    """
+    Threads that take jobs off a queue and pass them to handler(job).
+    
+    A job whose key is already being processed by another worker is parked
+    behind it; that worker runs the parked jobs in order before taking new
+    work, so a conversation never runs on two workers at once.
+    
+    With a coalesce function, a keyed job marked 'coalesce' is held until no
+    further coalescible job for its key arrives for coalesce_window seconds
+    (at most coalesce_max_wait), then coalesce(jobs) turns the burst into
+    one job. A non-coalescible job for the key ends the burst, keeping order.
+    """
+
+    def __init__(self, job_queue, handler, workers=WEBHOOK_WORKERS, coalesce=None,
+                 coalesce_window=WEBHOOK_COALESCE_SECONDS, coalesce_max_wait=WEBHOOK_COALESCE_MAX_SECONDS):
+        self.queue = job_queue
+        self.handler = handler
+        self.workers = workers
+        self.coalesce = coalesce
+        self.coalesce_window = coalesce_window
+        self.coalesce_max_wait = coalesce_max_wait
+        self.coalesced = 0
+        self._threads = []
+        self._stopping = threading.Event()
+        self.processed = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+        self._active = {}  # key -> deque of (token, job) parked behind the running job
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f'webhook-worker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        print(f"🧵 Started {self.workers} webhook workers on {self.queue.name} queue")
+
+    def stop(self, timeout=5.0):
+        self._stopping.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                item = self.queue.get(timeout=0.5)
+            except Exception as e:
+                print(f"❌ Webhook queue read failed: {e}")
+                self._stopping.wait(0.5)
+                continue
+            if item is None:
+                continue
+            token, job = item
+            key = job.get('key')
+            if key is not None:
+                with self._lock:
+                    if key in self._active:
+                        self._active[key].append((token, job))
+                        continue
+                    self._active[key] = deque()
+            
+            released = key is None
+            try:
+                self._process(key, token, job)
+                
+                # Drain jobs for this key that arrived while it was running
+                while not released:
+                    with self._lock:
+                        parked = self._active[key]
+                        if not parked:
+                            del self._active[key]
+                            released = True
+                            break
+                        token, job = parked.popleft()
+                    self._process(key, token, job)
+            except Exception as e:
+                print(f"❌ Webhook worker error for {key}: {e}")
+            finally:
+                # Parked jobs left unacked here are handed out again by a durable queue
+                if not released:
+                    with self._lock:
+                        self._active.pop(key, None)
+
+    def _process(self, key, token, job):
+        """Run one job (or a coalesced burst) and ack it; errors are logged, not raised"""
+        jobs, tokens = [job], [token]
+        try:
+            if key is not None and self.coalesce and self.coalesce_window > 0 and job.get('coalesce'):
+                jobs, tokens = self._gather_burst(key, job, token)
+            if len(jobs) > 1:
+                try:
+                    jobs = [self.coalesce(jobs)]
+                except Exception as e:
+                    print(f"❌ Could not merge {len(jobs)} webhook jobs for {key}, running them one by one: {e}")
+                else:
+                    with self._lock:
+                        self.coalesced += len(tokens) - 1
+            for job in jobs:
+                self.run_job(job)
+            for token in tokens:
+                self.queue.ack(token)
+        except Exception as e:
+            # A durable queue hands unacked jobs out again once their lease expires
+            print(f"❌ Webhook job for {key} could not be processed: {e}")
+            with self._lock:
+                self.failed += 1
+
+    def _gather_burst(self, key, job, token):
+        """Wait out a burst for key and collect its coalescible jobs"""
+        jobs, tokens = [job], [token]
+        started = last_arrival = time.monotonic()
+        lease_key = getattr(self.queue, 'lease_key', None)
+        
+        while True:
+            now = time.monotonic()
+            if now - last_arrival >= self.coalesce_window or now - started >= self.coalesce_max_wait:
+                break
+            time.sleep(min(0.05, self.coalesce_window))
+            # Take the rest of the key straight from the queue: other workers may all be
+            # busy, and a durable queue holds a busy key's jobs back anyway
+            leased = lease_key(key) if lease_key else []
+            with self._lock:
+                parked = self._active[key]
+                parked.extend(leased)
+                while parked and parked[0][1].get('coalesce'):
+                    next_token, next_job = parked.popleft()
+                    jobs.append(next_job)
+                    tokens.append(next_token)
+                    last_arrival = time.monotonic()
+                if parked:
+                    break
+        return jobs, tokens
+
+    def run_job(self, job):
+        """Run one job, recording queue wait and processing time"""
+        started = time.time()
+        if job.get('enqueued_at'):
+            resilience.metrics.record('webhook queue_wait', max(0.0, started - job['enqueued_at']))
+        try:
+            self.handler(job)
+            failed = False
+        except Exception as e:
+            failed = True
+            print(f"❌ Webhook job failed: {e}")
+            import traceback
+            traceback.print_exc()
+        resilience.metrics.record('webhook job', time.time() - started, error=failed)
+        with self._lock:
+            self.processed += 1
+            self.failed += int(failed)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'queue': self.queue.name,
+                'workers': self.workers,
+                'depth': self.queue.size(),
+                'processed': self.processed,
+                'failed': self.failed,
+                'coalesced': self.coalesced,
+                'active_keys': len(self._active),
+                'parked': sum(len(parked) for parked in self._active.values())
+            }
+
+
+# ==================== DISPATCH ====================
+
+_queue = None
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_queue():
+    """Get the configured queue (WEBHOOK_QUEUE), creating it on first use"""
+    global _queue
+    if _queue is None:
+        with _pool_lock:
+            if _queue is None:
+                _queue = SQLiteQueue() if WEBHOOK_QUEUE == 'sqlite' else LocalQueue()
+    return _queue
+
+
+def set_queue(job_queue):
+    """Replace the queue (tests, or a custom durable implementation)"""
+    global _queue
+    _queue = job_queue
+
+
+def start_workers(handler, coalesce=None):
+    """
+    Start the in-process worker pool once. Workers are started lazily on first
+    enqueue so forked web workers each get their own threads.
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                pool = WorkerPool(get_queue(), handler, coalesce=coalesce)
+                pool.start()
+                _pool = pool
+    return _pool
+
+
+def enqueue(job, handler, coalesce=None):
+    """
+    Queue a webhook job for background processing.
+
+    Args:
+        job (dict): JSON-serializable job; jobs sharing job['key'] run in order
+        handler (callable): handler(job), used by in-process workers
+        coalesce (callable): coalesce(jobs) -> job, merges a burst of jobs marked 'coalesce'
+
+    Returns:
+        bool: True if queued, False if it ran inline (WEBHOOK_ASYNC=false)
+    """
+    if not WEBHOOK_ASYNC:
+        handler(job)
+        return False
+    job = dict(job, enqueued_at=time.time())
+    get_queue().put(job)
+    if WEBHOOK_WORKER_MODE == 'thread':
+        start_workers(handler, coalesce)
+    return True
+
+
+def run_workers(handler, workers=WEBHOOK_WORKERS, coalesce=None):
+    """Drain the configured queue from this process until interrupted (external worker mode)"""
+    pool = WorkerPool(get_queue(), handler, workers, coalesce=coalesce)
+    pool.start()
+    try:
+        while True:
+            time.sleep(60)
+            print(f"📊 Webhook workers: {pool.stats()}")
+    except KeyboardInterrupt:
+        pool.stop()
+
+
+def get_stats():
+    """
+    Get queue depth and worker counters for this process.
+
+    Returns:
+        dict: queue, workers, depth, processed, failed, coalesced, active_keys, parked
+        (workers 0 if none run here)
+    """
+    if _pool is not None:
+        return _pool.stats()
+    job_queue = get_queue()
+    return {
+        'queue': job_queue.name, 'workers': 0, 'depth': job_queue.size(),
+        'processed': 0, 'failed': 0, 'coalesced': 0, 'active_keys': 0, 'parked': 0
+    }
@@ -11,7 +11,7 @@ load_dotenv()
 
 from flask import Flask, request, jsonify
 import os
-import requests
+from http_client import get_session
 import json
 from datetime import datetime
 from langchain_google_genai import ChatGoogleGenerativeAI
@@ -22,6 +22,8 @@ from typing import Any
 
 # Import multi-agent system
 from multi_agent_system import get_orchestrator, describe_image
+import outbound
+import webhook_queue
 
 
 def download_whatsapp_media(media_id: str, access_token: str) -> bytes:
@@ -43,7 +45,7 @@ def download_whatsapp_media(media_id: str, access_token: str) -> bytes:
         }
         
         print(f"📥 Fetching media URL for ID: {media_id}")
-        response = requests.get(media_url_endpoint, headers=headers)
+        response = get_session().get(media_url_endpoint, headers=headers)
         response.raise_for_status()
         
         media_data = response.json()
@@ -55,7 +57,7 @@ def download_whatsapp_media(media_id: str, access_token: str) -> bytes:
         
         # Step 2: Download the actual media file
         print(f"📥 Downloading media from: {download_url[:50]}...")
-        media_response = requests.get(download_url, headers=headers)
+        media_response = get_session().get(download_url, headers=headers)
         media_response.raise_for_status()
         
         print(f"✅ Media downloaded successfully: {len(media_response.content)} bytes")
@@ -236,14 +238,23 @@ def collect_buyer_name(phone_number: str, message: str, agent, history: list = N
         }
 
 
-def send_whatsapp_message(phone_number: str, message: str, seller_id: str = "jilsnshah_at_gmail_dot_com", whatsapp_creds: dict = None):
+def send_whatsapp_message(phone_number: str, message: str, seller_id: str = "jilsnshah_at_gmail_dot_com", whatsapp_creds: dict = None,
+                          priority: int = outbound.PRIORITY_REPLY, wait: bool = True):
     """Send a message via WhatsApp Business API and save to Firebase
     
+    The send goes through the outbound dispatcher, which paces it against the
+    sending number's rate limit and retries 429 responses and failed connects.
+    
     Args:
         phone_number: Recipient phone number
         message: Message text to send
         seller_id: Seller ID for conversation history
         whatsapp_creds: Optional dict with phone_number_id, access_token. Falls back to env vars.
+        priority: outbound.PRIORITY_REPLY (default) or outbound.PRIORITY_NOTICE
+        wait: Block until delivered. With wait=False the send is queued and a Future is returned.
+    
+    Returns:
+        dict: Graph API response (None if failed), or a Future when wait=False
     """
     # If creds not provided, try to fetch from Firebase
     if not whatsapp_creds and seller_id:
@@ -281,19 +292,30 @@ def send_whatsapp_message(phone_number: str, message: str, seller_id: str = "jil
         }
     }
     
-    try:
-        response = requests.post(url, headers=headers, json=payload)
-        response.raise_for_status()
-        print(f"✅ Message sent to {phone_number}")
-        
-        # Save outgoing message to Firebase
-        from firebase_db import save_conversation_message
-        save_conversation_message(seller_id, phone_number, "assistant", message)
-        
-        return response.json()
-    except Exception as e:
-        print(f"❌ Error sending message: {e}")
-        return None
+    def deliver(future):
+        try:
+            response = future.result()
+            response.raise_for_status()
+            print(f"✅ Message sent to {phone_number}")
+            
+            # Save outgoing message to Firebase
+            from firebase_db import save_conversation_message
+            save_conversation_message(seller_id, phone_number, "assistant", message)
+            
+            return response.json()
+        except Exception as e:
+            print(f"❌ Error sending message: {e}")
+            return None
+    
+    future = outbound.submit(
+        phone_number_id,
+        lambda: get_session().post(url, headers=headers, json=payload),
+        priority
+    )
+    if not wait:
+        future.add_done_callback(deliver)
+        return future
+    return deliver(future)
 
 
 def send_whatsapp_media(phone_number: str, media_file, caption: str = "", seller_id: str = "jilsnshah_at_gmail_dot_com", whatsapp_creds: dict = None):
@@ -336,23 +358,24 @@ def send_whatsapp_media(phone_number: str, media_file, caption: str = "", seller
             "Authorization": f"Bearer {access_token}"
         }
         
-        # Prepare file for upload
+        # Prepare file for upload (a path is kept open until the upload finishes)
         if hasattr(media_file, 'read'):
             # It's a file object
-            files = {
-                'file': ('invoice.pdf', media_file, 'application/pdf'),
-                'messaging_product': (None, 'whatsapp')
-            }
+            file_obj = media_file
         else:
             # It's a file path
-            with open(media_file, 'rb') as f:
-                files = {
-                    'file': ('invoice.pdf', f, 'application/pdf'),
-                    'messaging_product': (None, 'whatsapp')
-                }
+            file_obj = open(media_file, 'rb')
+        files = {
+            'file': ('invoice.pdf', file_obj, 'application/pdf'),
+            'messaging_product': (None, 'whatsapp')
+        }
         
         print(f"📤 Uploading media to WhatsApp...")
-        upload_response = requests.post(upload_url, headers=headers, files=files)
+        try:
+            upload_response = get_session().post(upload_url, headers=headers, files=files)
+        finally:
+            if file_obj is not media_file:
+                file_obj.close()
         upload_response.raise_for_status()
         
         media_id = upload_response.json().get('id')
@@ -376,7 +399,11 @@ def send_whatsapp_media(phone_number: str, media_file, caption: str = "", seller
         }
         
         print(f"📨 Sending media message to {phone_number}...")
-        send_response = requests.post(send_url, headers=headers, json=payload)
+        send_response = outbound.submit(
+            phone_number_id,
+            lambda: get_session().post(send_url, headers=headers, json=payload),
+            outbound.PRIORITY_NOTICE
+        ).result()
         send_response.raise_for_status()
         
         print(f"✅ Media message sent successfully to {phone_number}")
@@ -486,6 +513,117 @@ def process_whatsapp_message(phone_number: str, message_text: str, seller_id: st
         return "Sorry, I encountered an error. Please try again."
 
 
+def merge_webhook_jobs(jobs: list) -> dict:
+    """
+    Merge a burst of queued text messages from one buyer into a single job.
+    
+    Args:
+        jobs: Jobs for the same conversation, oldest first
+    
+    Returns:
+        dict: Job whose 'messages' lists every original message
+    """
+    merged = dict(jobs[-1])
+    merged["messages"] = [m for job in jobs for m in job.get("messages", [job.get("message", {})])]
+    merged["enqueued_at"] = jobs[0].get("enqueued_at")
+    return merged
+
+
+def handle_webhook_job(job: dict):
+    """
+    Process one queued incoming WhatsApp message (runs on a webhook worker).
+    
+    Args:
+        job: {'phone_number_id': str, 'message': dict} as queued by webhook_callback,
+            or a merged burst with 'messages' (see merge_webhook_jobs)
+    """
+    phone_number_id = job.get("phone_number_id")
+    
+    # Look up seller_id from phone_number_id mapping
+    from firebase_db import get_seller_by_phone_number_id, get_whatsapp_credentials, claim_message
+    seller_id = get_seller_by_phone_number_id(phone_number_id) if phone_number_id else None
+    
+    # Get WhatsApp credentials for this seller
+    whatsapp_creds = None
+    if seller_id:
+        whatsapp_creds = get_whatsapp_credentials(seller_id)
+        print(f"🏪 Seller identified: {seller_id}")
+    else:
+        print(f"⚠️ No seller found for phone_number_id: {phone_number_id}")
+    
+    # Atomically claim each message; redeliveries and concurrent copies are skipped
+    messages = []
+    for message in job.get("messages") or [job.get("message", {})]:
+        msg_id = message.get("id")
+        if claim_message(msg_id, message.get("timestamp")):
+            messages.append(message)
+        else:
+            print(f"⏭️ Deduplication: Skipping already processed message {msg_id}")
+    if not messages:
+        return
+    
+    message = messages[-1]
+    from_number = message.get("from")
+    message_type = message.get("type")
+    
+    # Check if seller is registered
+    if not seller_id or not whatsapp_creds:
+        print(f"❌ Seller not registered for phone_number_id: {phone_number_id}")
+        # Still try to send a response using env fallback
+        send_whatsapp_message(from_number, "Sorry, this seller is not registered yet. Please contact support.")
+        return
+    
+    if message_type == "text":
+        # A coalesced burst ("hi" / "I want apples" / "2kg") is answered as one turn
+        message_text = "\n".join(m.get("text", {}).get("body", "") for m in messages)
+        if len(messages) > 1:
+            print(f"🧺 Coalesced {len(messages)} messages from {from_number}")
+        agent_response = process_whatsapp_message(from_number, message_text, seller_id)
+        send_whatsapp_message(from_number, agent_response, seller_id, whatsapp_creds)
+    elif message_type == "location":
+        location_data = message.get("location", {})
+        latitude = location_data.get("latitude")
+        longitude = location_data.get("longitude")
+        location_text = f"[location] : latitude: {latitude}, longitude: {longitude}"
+        print(f"📍 Location received from {from_number}: {location_text}")
+        agent_response = process_whatsapp_message(from_number, location_text, seller_id)
+        send_whatsapp_message(from_number, agent_response, seller_id, whatsapp_creds)
+    elif message_type == "image":
+        # Handle image messages
+        image_data = message.get("image", {})
+        media_id = image_data.get("id")
+        caption = image_data.get("caption", "")
+        
+        print(f"📷 Image received from {from_number}, media_id: {media_id}")
+        
+        if media_id:
+            # Get access token from credentials
+            access_token = whatsapp_creds.get('access_token', WHATSAPP_ACCESS_TOKEN)
+            
+            # Download the image
+            image_bytes = download_whatsapp_media(media_id, access_token)
+            
+            if image_bytes:
+                # Describe the image using Gemini Vision
+                image_description = describe_image(image_bytes)
+                
+                # Format as user message with image context
+                if caption:
+                    image_text = f"User sent an Image : {image_description}\n\nUser's caption: {caption}"
+                else:
+                    image_text = f"User sent an Image : {image_description}"
+                
+                print(f"📷 Image message formatted: {image_text[:100]}...")
+                
+                # Process through agent
+                agent_response = process_whatsapp_message(from_number, image_text, seller_id)
+                send_whatsapp_message(from_number, agent_response, seller_id, whatsapp_creds)
+            else:
+                send_whatsapp_message(from_number, "I received your image but couldn't process it. Could you describe what you're looking for?", seller_id, whatsapp_creds)
+        else:
+            send_whatsapp_message(from_number, "I received your image but couldn't access it. Please try sending it again.", seller_id, whatsapp_creds)
+
+
 # WhatsApp Webhook Endpoints
 
 @app.route('/webhook', methods=['GET'])
@@ -504,13 +642,11 @@ def verify_webhook():
             return challenge, 200
             
         try:
-            from firebase_db import db
-            sellers_ref = db.reference('sellers')
-            sellers = sellers_ref.get() or {}
-            for seller_id, data in sellers.items():
-                if data.get('what_creds', {}).get('verify_token') == token:
-                    print(f"✅ Webhook verified successfully for seller {seller_id}!")
-                    return challenge, 200
+            from firebase_db import get_seller_by_verify_token
+            seller_id = get_seller_by_verify_token(token)
+            if seller_id:
+                print(f"✅ Webhook verified successfully for seller {seller_id}!")
+                return challenge, 200
         except Exception as e:
             print(f"❌ Error verifying token against sellers: {e}")
             
@@ -541,7 +677,8 @@ def webhook_callback():
                         for status in statuses:
                             print(f"🔄 Status update: id={status.get('id')}, status={status.get('status')}, recipient={status.get('recipient_id')}")
         
-        # Only process incoming user messages (not status updates)
+        # Only process incoming user messages (not status updates). Each message is
+        # queued for the background workers so Meta gets its 200 right away.
         if data.get("object") == "whatsapp_business_account":
             entries = data.get("entry", [])
             for entry in entries:
@@ -550,94 +687,20 @@ def webhook_callback():
                     value = change.get("value", {})
                     # Only process if there is a 'messages' key (not 'statuses')
                     if "messages" in value:
-                        # Extract phone_number_id from metadata
-                        metadata = value.get("metadata", {})
-                        phone_number_id = metadata.get("phone_number_id")
-                        
-                        # Look up seller_id from phone_number_id mapping
-                        from firebase_db import get_seller_by_phone_number_id, get_whatsapp_credentials
-                        seller_id = get_seller_by_phone_number_id(phone_number_id) if phone_number_id else None
-                        
-                        # Get WhatsApp credentials for this seller
-                        whatsapp_creds = None
-                        if seller_id:
-                            whatsapp_creds = get_whatsapp_credentials(seller_id)
-                            print(f"🏪 Seller identified: {seller_id}")
-                        else:
-                            print(f"⚠️ No seller found for phone_number_id: {phone_number_id}")
-                        
-                        messages = value.get("messages", [])
-                        for message in messages:
-                            # Get WhatsApp message ID for deduplication
-                            msg_id = message.get("id")
-                            
-                            # Import deduplication functions
-                            from firebase_db import is_message_processed, mark_message_as_processed
-                            
-                            # Check if message was already processed
-                            if is_message_processed(msg_id):
-                                print(f"⏭️ Deduplication: Skipping already processed message {msg_id}")
-                                continue
-                            
-                            # Mark message as processed before processing to avoid race conditions
-                            mark_message_as_processed(msg_id)
-                            
-                            from_number = message.get("from")
-                            message_type = message.get("type")
-                            
-                            # Check if seller is registered
-                            if not seller_id or not whatsapp_creds:
-                                print(f"❌ Seller not registered for phone_number_id: {phone_number_id}")
-                                # Still try to send a response using env fallback
-                                send_whatsapp_message(from_number, "Sorry, this seller is not registered yet. Please contact support.")
-                                continue
-                            
-                            if message_type == "text":
-                                message_text = message.get("text", {}).get("body", "")
-                                agent_response = process_whatsapp_message(from_number, message_text, seller_id)
-                                send_whatsapp_message(from_number, agent_response, seller_id, whatsapp_creds)
-                            elif message_type == "location":
-                                location_data = message.get("location", {})
-                                latitude = location_data.get("latitude")
-                                longitude = location_data.get("longitude")
-                                location_text = f"[location] : latitude: {latitude}, longitude: {longitude}"
-                                print(f"📍 Location received from {from_number}: {location_text}")
-                                agent_response = process_whatsapp_message(from_number, location_text, seller_id)
-                                send_whatsapp_message(from_number, agent_response, seller_id, whatsapp_creds)
-                            elif message_type == "image":
-                                # Handle image messages
-                                image_data = message.get("image", {})
-                                media_id = image_data.get("id")
-                                caption = image_data.get("caption", "")
-                                
-                                print(f"📷 Image received from {from_number}, media_id: {media_id}")
-                                
-                                if media_id:
-                                    # Get access token from credentials
-                                    access_token = whatsapp_creds.get('access_token', WHATSAPP_ACCESS_TOKEN)
-                                    
-                                    # Download the image
-                                    image_bytes = download_whatsapp_media(media_id, access_token)
-                                    
-                                    if image_bytes:
-                                        # Describe the image using Gemini Vision
-                                        image_description = describe_image(image_bytes)
-                                        
-                                        # Format as user message with image context
-                                        if caption:
-                                            image_text = f"User sent an Image : {image_description}\n\nUser's caption: {caption}"
-                                        else:
-                                            image_text = f"User sent an Image : {image_description}"
-                                        
-                                        print(f"📷 Image message formatted: {image_text[:100]}...")
-                                        
-                                        # Process through agent
-                                        agent_response = process_whatsapp_message(from_number, image_text, seller_id)
-                                        send_whatsapp_message(from_number, agent_response, seller_id, whatsapp_creds)
-                                    else:
-                                        send_whatsapp_message(from_number, "I received your image but couldn't process it. Could you describe what you're looking for?", seller_id, whatsapp_creds)
-                                else:
-                                    send_whatsapp_message(from_number, "I received your image but couldn't access it. Please try sending it again.", seller_id, whatsapp_creds)
+                        phone_number_id = value.get("metadata", {}).get("phone_number_id")
+                        for message in value.get("messages", []):
+                            # Keyed per conversation: one buyer's messages run in order,
+                            # and a burst of text messages becomes one agent turn
+                            webhook_queue.enqueue(
+                                {
+                                    "key": f"{phone_number_id}:{message.get('from')}",
+                                    "phone_number_id": phone_number_id,
+                                    "message": message,
+                                    "coalesce": message.get("type") == "text"
+                                },
+                                handle_webhook_job,
+                                merge_webhook_jobs
+                            )
         
         return jsonify({"status": "success"}), 200
         
@@ -6,7 +6,7 @@ seller WhatsApp Business accounts to the platform.
 """
 
 import os
-import requests
+from http_client import get_session
 import secrets
 
 # Facebook App Configuration
@@ -34,7 +34,7 @@ def exchange_code_for_token(code: str) -> dict:
             'code': code
         }
         
-        response = requests.get(url, params=params)
+        response = get_session().get(url, params=params)
         response.raise_for_status()
         return response.json()
     except Exception as e:
@@ -60,7 +60,7 @@ def get_whatsapp_business_accounts(access_token: str) -> list:
             'access_token': f'{FB_APP_ID}|{FB_APP_SECRET}'
         }
         
-        response = requests.get(url, params=params)
+        response = get_session().get(url, params=params)
         response.raise_for_status()
         debug_data = response.json().get('data', {})
         
@@ -82,7 +82,7 @@ def get_whatsapp_business_accounts(access_token: str) -> list:
                 'fields': 'id,name,phone_numbers{id,verified_name,code_verification_status,display_phone_number}'
             }
             
-            waba_response = requests.get(waba_url, params=waba_params)
+            waba_response = get_session().get(waba_url, params=waba_params)
             waba_response.raise_for_status()
             waba_data = waba_response.json()
             accounts.append(waba_data)
@@ -111,7 +111,7 @@ def get_phone_number_details(access_token: str, phone_number_id: str) -> dict:
             'fields': 'id,verified_name,code_verification_status,display_phone_number,quality_rating'
         }
         
-        response = requests.get(url, params=params)
+        response = get_session().get(url, params=params)
         response.raise_for_status()
         return response.json()
     except Exception as e:
@@ -137,7 +137,7 @@ def subscribe_app_to_waba(access_token: str, waba_id: str) -> bool:
             'Content-Type': 'application/json'
         }
         
-        response = requests.post(url, headers=headers)
+        response = get_session().post(url, headers=headers)
         response.raise_for_status()
         result = response.json()
         
@@ -169,7 +169,7 @@ def register_phone_number(access_token: str, phone_number_id: str) -> bool:
             'pin': '123456'  # 6-digit PIN for 2FA (will need to be configurable)
         }
         
-        response = requests.post(url, headers=headers, json=payload)
+        response = get_session().post(url, headers=headers, json=payload)
         response.raise_for_status()
         result = response.json()
         